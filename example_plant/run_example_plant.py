@@ -7,33 +7,153 @@ altered to fit the IEDO Iron Electrowinning project
 import os
 import json
 import pickle
+import pandas as pd
 
 # # yaml imports
 import yaml
 from pathlib import Path
 
-# HOPP imports
-from greenheart.simulation.greenheart_simulation import (
-    run_simulation,
-    GreenHeartSimulationConfig,
-)
-from greenheart.simulation.greenheart_simulation import run_simulation as run_greenheart
-from greenheart.tools.optimization.gc_run_greenheart import (
-    run_greenheart as run_greenheart_with_om,
-)
-from greenheart.tools.optimization.fileIO import save_data, load_data
-import openmdao.api as om
-
-from utilities.load_library_inputs import load_ore_cost, load_tech_capex
+# GreenHEART and OpenMDAO are imported where they are used, so scenarios that never run them (fixed-cost
+# scenarios, or the OpenMDAO path while run_om = False) don't pay for importing them
+
 from utilities.download_site_resources import download_site_resources
+from utilities.results_store import output_key
+from utilities import pre_profast_cache
+from utilities import profiling
+from utilities.config_factory import get_config_factory, unknown_params
+from utilities.sweep_spec import override_mask, scenario_id, OVERRIDES
+from utilities.iron_finance import fixed_cost_results, fixed_cost_errors, finance_inputs
+
+# Load inputs as needed
+filepath = str(os.path.abspath(os.path.dirname(__file__)))
+input_filepath = filepath + "/input/"
+output_filepath = filepath + "/output/"
+library_filepath = filepath + "/../data_library/"
+pre_profast_cache_dir = output_filepath + "example_plant_pre_profast"
+turbine_model = "lbw_6MW"
+filename_turbine_config = input_filepath + "turbines/" + turbine_model + ".yaml"
+filename_floris_config = input_filepath + "floris/floris_input_lbw_6MW.yaml"
+filename_hopp_config = input_filepath + "plant/hopp_config.yaml"
+filename_greenheart_config = input_filepath + "plant/greenheart_config.yaml"
+
+# Steps of GreenHEART's run_simulation timed as their own stages when profiling - anything else it
+# does (config setup, design calculations, the iron model) is only in the greenheart_full total
+GREENHEART_STAGES = {'greenheart.tools.eco.hopp_mgmt': {'run_hopp': 'gh_hopp'},
+                     'greenheart.tools.eco.electrolysis': {'run_electrolyzer_physics': 'gh_electrolyzer'},
+                     'greenheart.tools.eco.hydrogen_mgmt': {'run_h2_storage': 'gh_h2_storage'},
+                     'greenheart.tools.eco.finance': {'run_capex': 'gh_capex',
+                                                      'run_opex': 'gh_opex',
+                                                      'run_profast_lcoe': 'gh_profast_lcoe',
+                                                      'run_profast_grid_only': 'gh_profast_grid_only',
+                                                      'run_profast_full_plant_model': 'gh_profast_lcoh'}}
+
+# Set cost filepaths
+ore_cost_filepath = library_filepath + "tea/placeholders/ore_cost.csv"
+tech_capex_filepath = library_filepath + "tea/placeholders/tech_capex.csv"
+
+# GreenHEART configuration template - the YAML inputs are only parsed the first time this is called
+def example_config_factory():
+    return get_config_factory(
+        filename_hopp_config,
+        filename_greenheart_config,
+        filename_turbine_config,
+        filename_floris_config,
+        verbose=False,
+        show_plots=False,
+        save_plots=False,
+        use_profast=True,
+        post_processing=False,
+        run_pre_profast=True,
+        save_pre_profast=True,
+        pre_profast_fn=pre_profast_cache_dir,
+        iron_modular=False,
+        incentive_option=1,
+        plant_design_scenario=9,
+        output_level=7,
+    )
+
+# Scenarios fixing their H2 or electricity cost go through run_fixed_cost instead of GreenHEART
+def is_fixed_cost(params):
+    scenario = pd.DataFrame([params])
+    return bool(override_mask(scenario, "overwrite_h2")[0] or override_mask(scenario, "overwrite_elec")[0])
+
+def run_example_plant(run_pre_profast=None, ore=None, tech=None, location=[45.0, -90.0], site_id=0, params=None):
+    # Set up GreenHEART configuration from the process-wide template
+    # params are any other sweep parameters of the scenario, e.g. inflation from a sweep spec
+    if params is not None and is_fixed_cost(params):
+        return run_fixed_cost(ore, tech, location, site_id, params)
+    with profiling.stage("config"):
+        config = example_config_factory().variant(location, ore, tech, params=params)
+    return run_example_plant_config(config, run_pre_profast, ore, tech, location, site_id)
+
+def run_finance_variants(variants, ore=None, tech=None, location=[45.0, -90.0], site_id=0, params=None):
+    """Rerun only the finance stage of one site for each variant, returning one row per variant
+
+    Each variant is a dict of an incentive_option, finance_parameters entries and/or fixed H2 or
+    electricity cost overrides, e.g. the scenarios of a SweepSpec. The pre-ProFAST steps run at most
+    once, if the site isn't in the pre-ProFAST cache yet, and every variant loads them from the cache
+    and only reruns ProFAST and the iron model. Variants with a fixed cost skip GreenHEART like
+    run_example_plant. Raises ValueError before running anything if a variant has a parameter that
+    isn't in the GreenHEART config, since it would otherwise be dropped without changing the results.
+    """
+    variants = list(variants)
+    override_names = set(OVERRIDES) | {column for columns in OVERRIDES.values() for column in columns}
+    names = {name for variant in variants for name in variant} - {"id", "incentive_option"} - override_names
+    if len(names) > 0:
+        unknown = unknown_params(example_config_factory().template.greenheart_config, names)
+        if len(unknown) > 0:
+            raise ValueError("finance variant parameters not in the GreenHEART config: {}".format(", ".join(unknown)))
+
+    rows = []
+    for variant in variants:
+        variant_id = variant["id"] if "id" in variant else scenario_id(variant)
+        variant = {name: value for name, value in variant.items() if name != "id"}
+        variant_params = {**(params or {}), **{name: value for name, value in variant.items()
+                                               if name != "incentive_option"}}
+        # Outputs of each variant get their own key so they don't overwrite each other
+        variant_site_id = "{}-{}".format(site_id, variant_id)
+        if is_fixed_cost(variant_params):
+            results = run_fixed_cost(ore, tech, location, variant_site_id, variant_params)
+        else:
+            overrides = {}
+            if "incentive_option" in variant:
+                overrides["incentive_option"] = int(variant["incentive_option"])
+            with profiling.stage("config"):
+                config = example_config_factory().variant(location, ore, tech, params=variant_params, **overrides)
+            results = run_example_plant_config(config, None, ore, tech, location, variant_site_id)
+        rows.append({"id": site_id, "variant": variant_id, **variant, **results})
+    return pd.DataFrame(rows)
+
+# A scenario with a fixed H2 cost doesn't need HOPP or the electrolyzer, so GreenHEART is skipped
+# and only the iron costs are worked out - a fixed electricity cost on its own is rejected, since
+# GreenHEART has no way to skip HOPP and take the electricity price instead
+def run_fixed_cost(ore, tech, location, site_id, params):
+    with profiling.stage("fixed_cost"):
+        with open(filename_greenheart_config) as greenheart_file:
+            greenheart_config = yaml.safe_load(greenheart_file)
+        scenario = pd.DataFrame([{**params, "ore": ore, "tech": tech}])
+        error = fixed_cost_errors(scenario).iloc[0]
+        if error is not None:
+            raise ValueError("Site {}: {}".format(site_id, error))
+        fixed = fixed_cost_results(scenario, **finance_inputs(greenheart_config)).iloc[0]
+    return {"key": output_key(site_id, ore, tech, location),
+            "lcoe": float(fixed["lcoe"]),
+            "lcoh": float(fixed["lcoh"]),
+            "lcoi_fixed_cost": float(fixed["lcoi_fixed_cost"])}
+
+def run_example_plant_config(config, run_pre_profast=None, ore=None, tech=None, location=[45.0, -90.0], site_id=0):
+    # Entry point for a prebuilt GreenHEART configuration, e.g. ConfigFactory.variant()
+    # The config is modified in place, so don't reuse it for another run
 
-def run_example_plant(run_pre_profast=True, ore=None, tech=None, location=[45.0, -90.0]):
     # Decide if running a new simulation or loading a previously run simulation
     run_new = True
-    filename = "example_plant"
+    # Namespace outputs by scenario so runs in a sweep don't overwrite each other
+    filename = output_key(site_id, ore, tech, location)
 
     # Decide if running all of the parts of GreenHEART before the green iron model and saving output
-    save_pre_profast = True # Output pre-green iron must be saved once before save_pre_profast can be set to False
+    # None reuses cached pre-green iron output when there is one, True always reruns, False always loads
+    # Pre-green iron output doesn't depend on ore or tech, so it is cached by its location-dependent inputs
+    save_pre_profast = True
 
     # Decide if running OpenMDAO problem or straight GreenHEART simulation (True for OpenMDAO)
     run_om = False
@@ -41,44 +161,10 @@ def run_example_plant(run_pre_profast=True, ore=None, tech=None, location=[45.0,
     # Decide if analyzing or optimizing (True for analysis, False for optimization)
     run_analysis = True
 
-    # Load inputs as needed
-    filepath = str(os.path.abspath(os.path.dirname(__file__)))
-    input_filepath = filepath + "/input/"
-    output_filepath = filepath + "/output/"
-    library_filepath = filepath + "/../data_library/"
     if not os.path.exists(output_filepath):
-        os.mkdir(output_filepath)
-    turbine_model = "lbw_6MW"
-    filename_turbine_config = input_filepath + "turbines/" + turbine_model + ".yaml"
-    filename_floris_config = input_filepath + "floris/floris_input_lbw_6MW.yaml"
-    filename_hopp_config = input_filepath + "plant/hopp_config.yaml"
-    filename_greenheart_config = input_filepath + "plant/greenheart_config.yaml"
-
-    # Set cost filepaths
-    ore_cost_filepath = library_filepath + "tea/placeholders/ore_cost.csv"
-    tech_capex_filepath = library_filepath + "tea/placeholders/tech_capex.csv"
-
-    # Set up GreenHEART configuration
-    if run_new:
-        config = GreenHeartSimulationConfig(
-            filename_hopp_config,
-            filename_greenheart_config,
-            filename_turbine_config,
-            filename_floris_config,
-            verbose=False,
-            show_plots=False,
-            save_plots=False,
-            use_profast=True,
-            post_processing=False,
-            run_pre_profast=run_pre_profast,
-            save_pre_profast=save_pre_profast,
-            pre_profast_fn=output_filepath + filename + "_pre_profast",
-            iron_modular=False,
-            incentive_option=1,
-            plant_design_scenario=9,
-            output_level=7,
-        )
+        os.makedirs(output_filepath, exist_ok=True)
 
+    if run_new:
         # # Modify ore, tech, location
         # if ore != None:
         #     config.greenheart_config["iron"]["ore_type"] = ore
@@ -95,18 +181,54 @@ def run_example_plant(run_pre_profast=True, ore=None, tech=None, location=[45.0,
             # config.greenheart_config['iron']['site']['resource_dir'] =  str(Path(os.path.abspath(__file__)).parent) + \
             # config.greenheart_config['iron']['site']['resource_dir']
             # fp = config.greenheart_config['iron']['site']['resource_dir']
-            config.greenheart_config['site']['resource_dir'] = str(Path(os.path.abspath(__file__)).parent) + \
-                config.greenheart_config['site']['resource_dir']
+            # The template's resource_dir is relative to this file, variants may override it with a full path
+            if not os.path.isdir(config.greenheart_config['site']['resource_dir']):
+                config.greenheart_config['site']['resource_dir'] = str(Path(os.path.abspath(__file__)).parent) + \
+                    config.greenheart_config['site']['resource_dir']
             fp = config.greenheart_config['site']['resource_dir']
-            download_site_resources(config,fp)     
-        
-        # # Load ore- and tech- specific costs
-        # config = load_ore_cost(config, ore_cost_filepath)
-        # config = load_tech_capex(config, tech_capex_filepath)
+            with profiling.stage("resource_download"):
+                download_site_resources(config,fp)
+
+        # Point GreenHEART at the cache entry for this location
+        pre_profast_key = pre_profast_cache.pre_profast_key(config)
+        config.pre_profast_fn = pre_profast_cache.cache_fn(pre_profast_cache_dir, pre_profast_key)
+        if run_pre_profast is None:
+            run_pre_profast = not pre_profast_cache.is_cached(pre_profast_cache_dir, pre_profast_key)
+        # Only one run at a time saves a given cache entry, any others running it just don't save
+        save_pre_profast = run_pre_profast and pre_profast_cache.claim(pre_profast_cache_dir, pre_profast_key)
+        config.run_pre_profast = run_pre_profast
+        config.save_pre_profast = save_pre_profast
 
     # Run/load GreenHEART simulation
+    # HOPP, the electrolyzer model, and ProFAST all run inside one GreenHEART call, so the stage name
+    # records whether the pre-ProFAST steps ran or were loaded from the cache, and the steps that
+    # GreenHEART calls through its tools modules are timed as stages within it - see GREENHEART_STAGES
+    try:
+        with profiling.stage("greenheart_full" if run_pre_profast else "greenheart_from_cache"):
+            lcoe, lcoh, lcoi = run_or_load(config, run_om, run_analysis, run_new, output_filepath, filename)
+    except BaseException:
+        if run_new and save_pre_profast:
+            pre_profast_cache.release(pre_profast_cache_dir, pre_profast_key)
+        raise
+    if run_new and save_pre_profast:
+        pre_profast_cache.mark_cached(pre_profast_cache_dir, pre_profast_key)
+
+    # print("LCOE: ", lcoe, "[$/MWh]")
+    print("LCOH: ", lcoh, "[$/kg]")
+    # print("LCOI: ", lcoi, "[$/metric-tonne]")
+
+    return {"key": filename, "lcoe": float(lcoe), "lcoh": float(lcoh), "lcoi": float(lcoi)}
+
+
+def run_or_load(config, run_om, run_analysis, run_new, output_filepath, filename):
     if run_om:
         # Run using OpenMDAO
+        from greenheart.tools.optimization.gc_run_greenheart import (
+            run_greenheart as run_greenheart_with_om,
+        )
+        from greenheart.tools.optimization.fileIO import save_data, load_data
+        import openmdao.api as om
+
         if True:  # run_new: #TODO - Make load_data actually work?
             prob, config = run_greenheart_with_om(config, run_only=run_analysis)
 
@@ -121,34 +243,38 @@ def run_example_plant(run_pre_profast=True, ore=None, tech=None, location=[45.0,
         lcoe = prob.get_val("lcoe", units="USD/(MW*h)")
         lcoh = prob.get_val("lcoh", units="USD/kg")
         # lcoi = prob.get_val("lcoi", units="USD/t")
+        lcoi = float("nan")
 
     else:
         # Run not using OpenMDAO
         if run_new:
+            from greenheart.simulation.greenheart_simulation import run_simulation as run_greenheart
+
+            profiling.time_calls(GREENHEART_STAGES)
             lcoe, lcoh, iron_finance, ammonia_finance = run_greenheart(config)
-            # lcoi = iron_finance.sol["price"]
+            lcoi = iron_finance.sol["price"] if iron_finance is not None else float("nan")
 
             # Save GreenHEART data (lcoe, lcoh, and IronCostModelOutputs)
-            output = open(output_filepath + filename + "_lcoe.txt", "w")
-            output.write(str(lcoe))
-            output = open(output_filepath + filename + "_lcoh.txt", "w")
-            output.write(str(lcoh))
+            with profiling.stage("output_io"):
+                with open(output_filepath + filename + "_lcoe.txt", "w") as output:
+                    output.write(str(lcoe))
+                with open(output_filepath + filename + "_lcoh.txt", "w") as output:
+                    output.write(str(lcoh))
             # output = open(output_filepath + filename + "_if.pkl", "wb")
             # pickle.dump(iron_finance, output)
 
         # Load from saved files
         else:
-            input = open(output_filepath + filename + "_lcoe.txt")
-            lcoe = float(input.read())
-            input = open(output_filepath + filename + "_lcoh.txt")
-            lcoh = float(input.read())
+            with open(output_filepath + filename + "_lcoe.txt") as input:
+                lcoe = float(input.read())
+            with open(output_filepath + filename + "_lcoh.txt") as input:
+                lcoh = float(input.read())
+            lcoi = float("nan")
             # input = open(output_filepath + filename + "_if.pkl", "rb")
             # iron_finance = pickle.load(input)
             # lcoi = iron_finance.sol["price"]
 
-    # print("LCOE: ", lcoe, "[$/MWh]")
-    print("LCOH: ", lcoh, "[$/kg]")
-    # print("LCOI: ", lcoi, "[$/metric-tonne]")
+    return lcoe, lcoh, lcoi
 
 
 # Run as script
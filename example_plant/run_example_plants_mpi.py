@@ -3,15 +3,15 @@ Sweeps through example_plants with modified ores and technologies (hopefully als
 Based off of NED-toolbox/toolbox/simulation/run_offshore_onshore_baseline_mpi.py
 '''
 
+# Rank startup is timed from here, so it includes the imports below
+import time
+script_start = time.perf_counter()
+
 # All imports copied from NED-toolbox/toolbox/simulation/run_offshore_onshore_baseline_mpi.py
 import pandas as pd
-import yaml
 import os
-import time
-import logging
 from pathlib import Path
 from hopp.utilities import load_yaml
-import copy
 import sys
 from mpi4py import MPI
 from datetime import datetime
@@ -20,28 +20,80 @@ from datetime import datetime
 # from yamlinclude import YamlIncludeConstructor
 
 # Changed the imported function for multiprocessing from run_offgrid_onshore to run_example_plant
-from run_example_plant import run_example_plant
+# GreenHEART itself is only imported by warm_up or the first site a rank simulates
+from run_example_plant import run_example_plant, example_config_factory
 
 # Made my own logger from NED-toolbox logger
 from utilities.logger import mpi_logger as mpi_log
 from utilities.logger import main_logger as main_log
+from utilities.logger import setup_rank_logging, stop_rank_logging, merge_rank_logs
+from utilities.results_store import ResultsStore, load_results
+from utilities.load_library_inputs import broadcast_cost_library
+from utilities.sweep_ledger import SweepLedger, completed_ids
+from utilities import profiling
+from utilities import sweep_runner
+from utilities.site_runtimes import order_longest_first, save_runtimes
+from utilities.hpc_resource import HPCResource
+from utilities.download_site_resources import use_hpc_resource
+from utilities.resource_screen import add_resource_columns
 
 ROOT_DIR = Path(__file__).resolve().parent.parent
 INPUT_DIR = ROOT_DIR/"example_plant/input"
 
-sitelist_all = INPUT_DIR/'multiprocess/sitelist.csv'
+# "static" splits sites into equal chunks up front, "dynamic" hands them out as ranks free up
+scheduler = "dynamic"
+# Number of sites handed to a rank at a time when scheduler = "dynamic"
+batch_size = 1
+# Hand out the sites that took longest in past sweeps first when scheduler = "dynamic"
+longest_first = True
+runtime_fp = ROOT_DIR/"example_plant/output/site_runtimes.csv"
+
+# The sweep, its results store, ledger and summary, resource files and pre-screen are set in
+# utilities/sweep_runner.py, shared with run_example_plants_pool.py
+
+# Each rank logs JSON lines to its own file through a background writer, merged by rank 0 at the end
+rank_logging = True
+
+# Time each stage of every site run and record memory use, summarized by rank 0 at the end
+profile_stages = False
+# Keep cProfile dumps for this many of the slowest sites when profile_stages is on - 0 for none
+n_profile_dumps = 0
+profile_dir = ROOT_DIR/"example_plant/output/profiling"
+
+# Surrogate mode runs full simulations for a random seed set of sites, predicts the rest with a surrogate,
+# then runs full simulations in rounds only where the surrogate is most uncertain
+surrogate_mode = False
+surrogate_seed_fraction = 0.1
+surrogate_rounds = 3
+surrogate_batch_fraction = 0.05
+surrogate_dir = ROOT_DIR/"example_plant/output/surrogate"
+
+# Import GreenHEART and parse its input YAMLs on every rank before the sweep starts, so the first site on
+# each rank doesn't include them in its runtime
+warm_start = True
+# Time from the script starting to each rank being ready to run sites, written by rank 0
+startup_fp = ROOT_DIR/"example_plant/output/rank_startup.csv"
 
-sitelist_locs = INPUT_DIR/'multiprocess/sitelist_just_loc.csv'
+# Run sites in disadvantaged tracts before the rest of the sweep
+disadvantaged_first = False
 
-# Set to False to use to old, previously-calculated location data
-rerun_locs = False
+# MPI message tags for dynamic scheduling
+TAG_READY = 1
+TAG_WORK = 2
+TAG_STOP = 3
+
+# Set on every rank when resource_origin = "HPC"
+hpc_resource = None
+# Resource statistics of the sweep locations, set on rank 0 by the pre-screen
+site_stats = None
 
 # Parallel job is "do_something" - run_example_plant replaces run_baseline_site
 def do_something(inputs,site_id):
-    mpi_log.info("Site {}: starting".format(site_id))
-    run_pre_iron, ore, tech, location = inputs
-    run_example_plant(run_pre_iron, ore, tech, location)
-    mpi_log.info("Site {}: complete".format(site_id))
+    mpi_log.info("Site {}: starting".format(site_id), extra={"site_id": site_id})
+    run_pre_iron, ore, tech, location, params = inputs
+    results = run_example_plant(run_pre_iron, ore, tech, location, site_id, params)
+    mpi_log.info("Site {}: complete".format(site_id), extra={"site_id": site_id})
+    return results
 
 start_time = datetime.now()
 
@@ -50,92 +102,268 @@ size = MPI.COMM_WORLD.Get_size()
 rank = MPI.COMM_WORLD.Get_rank()
 name = MPI.Get_processor_name()
 
+if rank_logging:
+    log_run_dir = setup_rank_logging(rank)
+
+if profile_stages:
+    profiling.enable_profiling(n_profile_dumps, profile_dir)
+
+results_store = ResultsStore(sweep_runner.results_dir, rank, sweep_runner.results_flush_every,
+                             sweep_runner.results_flush_seconds)
+ledger = SweepLedger(sweep_runner.ledger_dir, rank)
+
+# Read the cost and inflation tables once on rank 0 and share them with every rank
+cost_library = broadcast_cost_library(comm)
+
 # Mostly the same
-def main(sitelist,inputs,verbose = True):
+def main(s_list,spec,verbose = True):
     """Main function
     Basic MPI job for embarrassingly paraller job:
     read data for multiple sites(gids) from one WTK .h5 file
     compute somthing (windspeed min, max, mean) for each site(gid)
     write results to .csv file for each site(gid)
-    each rank will get about equal number of sites(gids) to process
+    sites are either split between ranks up front (scheduler = "static")
+    or handed out in small batches as ranks free up (scheduler = "dynamic")
+    s_list holds the indices of the scenarios in the sweep spec to run
     """
 
     ### input
     main_log.info(f"START TIME: {start_time}")
     main_log.info("number of ranks: {}".format(size))
-    main_log.info("number of sites: {}".format(len(sitelist)))
-    site_idxs = sitelist.index
+    main_log.info("number of sites: {}".format(len(s_list)))
+    if scheduler == "dynamic":
+        run_dynamic(s_list,spec,verbose)
+    else:
+        run_static(s_list,spec,verbose)
+    ledger.record_done([row["id"] for row in results_store.flush()])
+
+    # Add carbon intensity to every scenario in one pass once all ranks have written their results
+    comm.barrier()
+    if rank == 0:
+        sweep_runner.write_summary(sweep_runner.summary_results(cost_library))
+
+    if profile_stages:
+        write_stage_summary()
+    if verbose:
+        print(f"rank {rank}: ellapsed time: {datetime.now() - start_time}")
+    mpi_log.info(f"rank {rank}: ellapsed time: {datetime.now() - start_time}")
+
+# Read the resources of a chunk of scenarios from the HPC datasets before running them
+def load_chunk_resources(gids,spec):
+    if hpc_resource is None or len(gids) == 0:
+        return
+    scenarios = [spec.scenario(gid) for gid in gids]
+    hpc_resource.load([scenario['latitude'] for scenario in scenarios],
+                      [scenario['longitude'] for scenario in scenarios])
+
+# Run scenario gid of the sweep spec and return its stable ID and how long it took in seconds
+def run_site(gid,spec,verbose = True):
+    # Scenarios are only expanded from the spec when a rank gets to them
+    scenario = spec.scenario(gid)
+    site_id = scenario['id']
+    if verbose:
+        print(f"rank {rank} now processing site gid {gid} ({site_id})")
+    mpi_log.info(f"rank {rank} now processing: Site {site_id}", extra={"site_id": site_id})
+    site_start = time.perf_counter()
+    inputs = sweep_runner.scenario_inputs(scenario)
+    # One site failing shouldn't take down the rank - record it and move on
+    try:
+        with profiling.site(site_id):
+            results = do_something(inputs,site_id)
+    except Exception as e:
+        mpi_log.exception(f"rank {rank} Site {site_id}: failed", extra={"site_id": site_id})
+        ledger.record_failure(site_id, e)
+        return site_id, time.perf_counter() - site_start
+    runtime = time.perf_counter() - site_start
+    # Sites are only recorded done once their results are on disk
+    with profiling.stage("results_io", site_id):
+        flushed = results_store.append({**sweep_runner.result_row(gid, scenario, inputs, results, runtime),
+                                        "rank": rank})
+        ledger.record_done([row["id"] for row in flushed])
+    return site_id, runtime
+
+# Every rank takes every size-th scenario starting from its own rank and runs them in serial
+# Every rank has the same s_list, so no scenarios need to be sent between ranks
+def run_static(s_list,spec,verbose = True):
     if rank == 0:
         print(" i'm rank {}:".format(rank))
-        ################################ split site_idx's
-        s_list = site_idxs.tolist()
-        # check if number of ranks <= number of tasks
+        # more ranks than scenarios just leaves some ranks with nothing to run
         if size > len(s_list):
-            print(
-                "number of scenarios {} < number of ranks {}, abborting...".format(
-                    len(s_list), size
+            main_log.info(
+                "number of scenarios {} < number of ranks {}, {} ranks will be idle".format(
+                    len(s_list), size, size - len(s_list)
                 )
             )
-            sys.exit()
-
-        # split them into chunks (number of chunks = number of ranks)
-        chunk_size = len(s_list) // size
-
-        remainder_size = len(s_list) % size
-
-        s_list_chunks = [
-            s_list[i : i + chunk_size] for i in range(0, size * chunk_size, chunk_size)
-        ]
-        # distribute remainder to chunks
-        for i in range(-remainder_size, 0):
-            s_list_chunks[i].append(s_list[i])
-        if verbose:
-            print(f"\n s_list_chunks {s_list_chunks}")
-        main_log.info(f"s_list_chunks {s_list_chunks}")
-    else:
-        s_list_chunks = None
 
-    ### scatter
-    s_list_chunks = comm.scatter(s_list_chunks, root=0)
+    # Slicing a range doesn't build the list of scenarios
+    s_list_shard = s_list[rank::size]
     if verbose:
-        print(f"\n rank {rank} has sites {s_list_chunks} to process")
-    main_log.info(f"rank {rank} has sites {s_list_chunks} to process")
+        print(f"\n rank {rank} has {len(s_list_shard)} sites to process")
+    main_log.info(f"rank {rank} has {len(s_list_shard)} sites to process")
+
+    load_chunk_resources(s_list_shard,spec)
 
     # ### run sites in serial
-    for i, gid in enumerate(s_list_chunks):
-        # time.sleep(rank * 5)
-        if verbose:
-            print(f"rank {rank} now processing its sites in serial: site gid {gid}")
-        mpi_log.info(f"rank {rank} now processing its sites in serial: Site {gid}")
-        inputs_copied = [copy.deepcopy(inpt) for inpt in inputs[gid]]
-        do_something(inputs_copied,gid)
-    if verbose:
-        print(f"rank {rank}: ellapsed time: {datetime.now() - start_time}")
-    mpi_log.info(f"rank {rank}: ellapsed time: {datetime.now() - start_time}")
+    for gid in s_list_shard:
+        run_site(gid,spec,verbose)
+
+# Gather stage timings from every rank and write a p50/p95 summary per stage
+def write_stage_summary():
+    stage_df = profiling.gather_records(comm)
+    if n_profile_dumps > 0:
+        profiling.prune_profile_dumps(comm)
+    if rank == 0:
+        os.makedirs(profile_dir, exist_ok=True)
+        stage_df.to_csv(profile_dir/"stage_records.csv", index=False)
+        summary = profiling.stage_summary(stage_df)
+        summary.to_csv(profile_dir/"stage_summary.csv")
+        main_log.info(f"stage timing summary:\n{summary.to_string()}")
 
-# This function reads a very basic placeholder sitelist
-def setup_sites(sitelist_fp, run_pre_iron=False):
+# Master/worker scheduling - rank 0 hands out batches of sites to whichever rank asks next
+def run_dynamic(s_list,spec,verbose = True):
+    # Longest-first would undo the disadvantaged-first order of the sweep or the pre-screen's order
+    prescreen_last = sweep_runner.prescreen and sweep_runner.prescreen_action == "last"
+    if longest_first and not disadvantaged_first and not prescreen_last:
+        s_list = order_longest_first(s_list,spec,runtime_fp)
 
-    sites = pd.read_csv(sitelist_fp)
-    
-    inputs = []
-    for i in range(sites.shape[0]):
-        site = sites.loc[i]
-        inputs.append([run_pre_iron,
-                       site.loc['ore'],
-                       site.loc['tech'],
-                       (site.loc['latitude'],site.loc['longitude'])])
+    # Nobody to hand work to, just run everything here
+    if size == 1:
+        runtimes = {}
+        for i in range(0, len(s_list), batch_size):
+            batch = list(s_list[i : i + batch_size])
+            load_chunk_resources(batch,spec)
+            runtimes.update(run_site(gid,spec,verbose) for gid in batch)
+        save_runtimes(runtimes,runtime_fp)
+        return
 
-    return sites, inputs
+    status = MPI.Status()
+    if rank == 0:
+        # Batches are sliced off s_list as they are handed out
+        n_batches = -(-len(s_list) // batch_size)
+        batches = (list(s_list[i : i + batch_size]) for i in range(0, len(s_list), batch_size))
+        main_log.info(f"dynamic scheduling {len(s_list)} sites in {n_batches} batches of up to {batch_size}")
+        runtimes = {}
+        n_active = size - 1
+        while n_active > 0:
+            # Workers report runtimes of their last batch when asking for the next one
+            done = comm.recv(source=MPI.ANY_SOURCE, tag=TAG_READY, status=status)
+            runtimes.update(done)
+            worker = status.Get_source()
+            batch = next(batches, None)
+            if batch is not None:
+                comm.send(batch, dest=worker, tag=TAG_WORK)
+                main_log.info(f"rank {worker} given sites {batch}")
+            else:
+                comm.send(None, dest=worker, tag=TAG_STOP)
+                n_active -= 1
+        save_runtimes(runtimes,runtime_fp)
+    else:
+        done = {}
+        while True:
+            comm.send(done, dest=0, tag=TAG_READY)
+            batch = comm.recv(source=0, tag=MPI.ANY_TAG, status=status)
+            if status.Get_tag() == TAG_STOP:
+                break
+            load_chunk_resources(batch,spec)
+            done = dict(run_site(gid,spec,verbose) for gid in batch)
 
+# Latest full-simulation results for the given sites
+def full_results(site_ids):
+    results = load_results(sweep_runner.results_dir)
+    results = results[results["id"].isin(site_ids)]
+    return results.drop_duplicates("id", keep="last").set_index("id")
 
-if __name__ == "__main__":
-    if len(sys.argv)<3:
-        n_sites = 4 
-        start_idx = 0
+def run_surrogate_sweep(s_list, spec):
+    # scikit-learn is only needed in surrogate mode
+    from utilities.surrogate import SurrogateModel, most_uncertain, validation_report
+
+    # The surrogate needs a table of every scenario's parameters to predict over
+    sitelist = spec.sitelist(s_list)
+    if rank == 0:
+        to_run = sitelist.sample(frac=surrogate_seed_fraction, random_state=0).index.tolist()
+    else:
+        to_run = None
+    to_run = comm.bcast(to_run, root=0)
+    # Resource statistics from the pre-screen are features of the surrogate
+    if site_stats is not None:
+        sitelist = add_resource_columns(sitelist, site_stats)
+    done = []
+    for surrogate_round in range(surrogate_rounds+1):
+        main(sitelist.loc[to_run,"scenario"].tolist(),spec)
+        done.extend(to_run)
+        if rank == 0:
+            fit_results = full_results(done)
+            if site_stats is not None:
+                fit_results = add_resource_columns(fit_results, site_stats)
+            model = SurrogateModel().fit(fit_results)
+            predictions = model.predict(sitelist.drop(done))
+            n_next = int(surrogate_batch_fraction*len(sitelist)) if surrogate_round < surrogate_rounds else 0
+            to_run = most_uncertain(predictions, n_next).tolist()
+            main_log.info(f"surrogate round {surrogate_round}: {len(done)} full runs, {len(to_run)} sites sent to full simulation next")
+        to_run = comm.bcast(to_run, root=0)
+        if len(to_run) == 0:
+            break
+
+    if rank == 0:
+        os.makedirs(surrogate_dir, exist_ok=True)
+        full = full_results(done)
+        full["source"] = "full"
+        predictions = sitelist.drop(done).join(predictions)
+        predictions["source"] = "surrogate"
+        pd.concat([full, predictions]).to_parquet(surrogate_dir/"predictions.parquet")
+        report, comparison = validation_report(full)
+        report.to_csv(surrogate_dir/"validation_report.csv", index=False)
+        comparison.to_csv(surrogate_dir/"validation_comparison.csv")
+        main_log.info(f"surrogate validation:\n{report.to_string(index=False)}")
+
+# Fetch resource files for every location in the sweep on rank 0 before any rank starts simulating
+def prefetch_sites(s_list, spec):
+    if rank == 0:
+        sweep_runner.prefetch_sites(s_list, spec)
+    comm.barrier()
+
+# Pre-screen on rank 0 - the resource statistics are kept there for the surrogate
+def prescreen_sites(s_list, spec):
+    global site_stats
+    if rank == 0:
+        order, site_stats = sweep_runner.prescreen_sites(s_list, spec)
+    else:
+        order = None
+    return comm.bcast(order, root=0)
+
+# Move sites in disadvantaged tracts to the front of the sweep, tagged on rank 0
+def order_disadvantaged_first(s_list, spec):
+    order = sweep_runner.order_disadvantaged_first(s_list, spec) if rank == 0 else None
+    return comm.bcast(order, root=0)
+
+# Rank 0 works out every fixed H2 cost scenario and only the rest are handed to ranks to simulate
+def run_fixed_cost_scenarios(s_list, spec):
+    if rank == 0:
+        remaining = sweep_runner.run_fixed_cost_scenarios(s_list, spec, results_store, ledger, cost_library,
+                                                          rank=rank)
     else:
-        n_sites = int(sys.argv[1])
-        start_idx = int(sys.argv[2])
+        remaining = None
+    return comm.bcast(remaining, root=0)
+
+# Import GreenHEART and build the config template on this rank
+def warm_up():
+    from greenheart.simulation.greenheart_simulation import run_simulation
+    example_config_factory()
+
+# Gather how long each rank took to start up and write a summary on rank 0
+def report_startup():
+    startup_s = comm.gather(time.perf_counter() - script_start, root=0)
+    if rank == 0:
+        startup = pd.Series(startup_s, name="startup_s")
+        startup.index.name = "rank"
+        os.makedirs(startup_fp.parent, exist_ok=True)
+        startup.to_csv(startup_fp)
+        main_log.info(f"rank startup [s]: min {startup.min():.2f}, median {startup.median():.2f}, max {startup.max():.2f}")
+
+
+if __name__ == "__main__":
+    # --resume skips sites already recorded done in the ledger, rerunning unfinished and failed sites
+    n_sites, start_idx, resume = sweep_runner.parse_args(sys.argv)
 
     input_filepath = INPUT_DIR/'multiprocess/example.yaml'
     input_config = load_yaml(input_filepath)
@@ -146,36 +374,51 @@ if __name__ == "__main__":
     # input_config["output_dir"] = "/kfs2/projects/hopp/ned-results/v1"
 
     # below is to run locally
-    input_config["renewable_resource_origin"] = "API" #"API" or "HPC"
+    input_config["renewable_resource_origin"] = sweep_runner.resource_origin #"API" or "HPC"
     input_config["hpc_or_local"] = "local"
     if "env_path" in input_config:
         input_config.pop("env_path")
     input_config.pop("output_dir")
     
-    # Pre-populate model with location-specific data - DO run pre-iron steps of GreenHEART
-    
-    if rerun_locs:
+    # Run all technologies across locations - pre-iron steps of GreenHEART are run once per location
+
+    spec = sweep_runner.setup_sweep()
+    main_log.info(f"set up a sweep of {len(spec)} scenarios")
 
-        site_list_locs, inputs = setup_sites(sitelist_locs, True)
-        main_log.info("set up runs")
+    # Scenarios are referred to by their index in the spec
+    site_list_all = sweep_runner.sweep_scenarios(spec, n_sites, start_idx)
+
+    if resume:
+        done = completed_ids(sweep_runner.ledger_dir) if rank == 0 else None
+        done = comm.bcast(done, root=0)
+        site_list_all = sweep_runner.resume_scenarios(site_list_all, spec, done)
+
+    if disadvantaged_first:
+        site_list_all = order_disadvantaged_first(site_list_all,spec)
+
+    site_list_all = run_fixed_cost_scenarios(site_list_all,spec)
+
+    if warm_start and len(site_list_all) > 0:
+        warm_up()
+    report_startup()
+
+    if sweep_runner.resource_origin == "HPC":
+        hpc_resource = HPCResource.from_config(input_config, *sweep_runner.resource_year_hub_height())
+        use_hpc_resource(hpc_resource)
+    elif sweep_runner.prefetch:
+        prefetch_sites(site_list_all,spec)
+
+    # Resource statistics come from the API resource files, which HPC runs don't download
+    if sweep_runner.prescreen and sweep_runner.resource_origin != "HPC":
+        site_list_all = prescreen_sites(site_list_all,spec)
     
-        end_idx = start_idx + n_sites
-        if end_idx>=len(site_list_locs):
-            sitelist_locs = site_list_locs.iloc[start_idx:]
-        else:
-            sitelist_locs = site_list_locs.iloc[start_idx:start_idx+n_sites]
-        
-        main(site_list_locs,inputs)
-
-    # Run all technologies across locations - DON'T run pre-iron steps of GreenHEART
-
-    site_list_all, inputs = setup_sites(sitelist_all, False)
-    main_log.info("set up runs")
- 
-    end_idx = start_idx + n_sites
-    if end_idx>=len(site_list_all):
-        sitelist_all = site_list_all.iloc[start_idx:]
+    if surrogate_mode:
+        run_surrogate_sweep(site_list_all,spec)
     else:
-        sitelist_all = site_list_all.iloc[start_idx:start_idx+n_sites]
-    
-    main(site_list_all,inputs)
\ No newline at end of file
+        main(site_list_all,spec)
+
+    if rank_logging:
+        stop_rank_logging()
+        comm.barrier()
+        if rank == 0:
+            merge_rank_logs(log_run_dir)
\ No newline at end of file
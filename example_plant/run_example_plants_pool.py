@@ -0,0 +1,186 @@
+'''
+Sweeps through example_plants on the cores of one machine without MPI
+Runs the same sweep as run_example_plants_mpi.py through a process pool - for laptops and CI
+'''
+
+import os
+import sys
+import time
+import importlib
+import traceback
+import multiprocessing
+import pandas as pd
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from hopp.utilities import load_yaml
+
+from utilities.logger import main_logger as main_log
+from utilities.logger import start_worker_listener, setup_worker_logging
+from utilities.results_store import ResultsStore
+from utilities.load_library_inputs import get_cost_library
+from utilities.sweep_ledger import SweepLedger
+from utilities import sweep_runner
+from utilities.hpc_resource import HPCResource
+from utilities.download_site_resources import use_hpc_resource
+
+# The sweep, its results store, ledger and summary, resource files and pre-screen are set in
+# utilities/sweep_runner.py, shared with run_example_plants_mpi.py, so --resume works across both
+
+# Worker processes - defaults to one per core
+n_workers = os.cpu_count()
+# Scenarios sent to a worker per task, so each task's overhead is shared between a few scenarios
+chunksize = 4
+# Tasks waiting per worker - enough to keep workers busy without queueing the whole sweep up front
+pending_per_worker = 2
+# How workers start - "forkserver" forks them from a server that has already imported WARM_MODULES,
+# "fork" imports them in this process first and forks from it, "spawn" starts each worker from scratch
+start_method = "forkserver"
+# Imported once before any worker starts in the forkserver and fork start methods
+WARM_MODULES = ['run_example_plant', 'greenheart.simulation.greenheart_simulation']
+
+# Set in each worker by warm_up
+worker_spec = None
+worker_resource = None
+run_example_plant = None
+# How long this worker took to warm up, sent back with its first chunk
+worker_startup_s = None
+
+# Runs once in each worker - GreenHEART is imported and its input YAMLs parsed here instead of per scenario
+# These are already imported when the worker was forked from a warm process, leaving just the YAMLs
+def warm_up(spec, log_queue, hpc_resource=None):
+    global worker_spec, worker_resource, run_example_plant, worker_startup_s
+    warm_start = time.perf_counter()
+    setup_worker_logging(log_queue)
+    from run_example_plant import run_example_plant, example_config_factory
+    for module in WARM_MODULES:
+        importlib.import_module(module)
+    example_config_factory()
+    worker_spec = spec
+    worker_resource = hpc_resource
+    use_hpc_resource(hpc_resource)
+    worker_startup_s = time.perf_counter() - warm_start
+
+# Run a chunk of scenarios in a worker - failures are sent back as traceback strings instead of raised so
+# the rest still run, since exceptions from GreenHEART can't always be pickled
+# Returns the worker's warm-up time with its first chunk, None after that
+def run_chunk(chunk):
+    global worker_startup_s
+    startup_s, worker_startup_s = worker_startup_s, None
+    outcomes = []
+    scenarios = [worker_spec.scenario(gid) for gid in chunk]
+    if worker_resource is not None:
+        worker_resource.load([scenario['latitude'] for scenario in scenarios],
+                             [scenario['longitude'] for scenario in scenarios])
+    for gid, scenario in zip(chunk, scenarios):
+        site_id = scenario['id']
+        inputs = sweep_runner.scenario_inputs(scenario)
+        run_pre_iron, ore, tech, location, params = inputs
+        site_start = time.perf_counter()
+        try:
+            results = run_example_plant(run_pre_iron, ore, tech, location, site_id, params)
+        except Exception:
+            main_log.exception(f"worker {os.getpid()} Site {site_id}: failed")
+            outcomes.append((site_id, None, traceback.format_exc()))
+            continue
+        runtime = time.perf_counter() - site_start
+        outcomes.append((site_id, {**sweep_runner.result_row(gid, scenario, inputs, results, runtime),
+                                   "worker": os.getpid()}, None))
+    return startup_s, outcomes
+
+# Record results in the parent as each chunk comes back, sites are only recorded done once on disk
+def record_outcomes(outcomes, results_store, ledger):
+    for site_id, row, error in outcomes:
+        if error is not None:
+            ledger.record_failure(site_id, error)
+        else:
+            ledger.record_done([flushed["id"] for flushed in results_store.append(row)])
+
+# Process context for the pool, warming up the forkserver or this process as start_method needs
+def pool_context():
+    context = multiprocessing.get_context(start_method)
+    if start_method == "forkserver":
+        context.set_forkserver_preload(WARM_MODULES)
+    elif start_method == "fork":
+        for module in WARM_MODULES:
+            importlib.import_module(module)
+    return context
+
+# Log worker warm-up times and how long the pool took to return its first results
+def report_startup(startup_s, first_result_s):
+    if len(startup_s) == 0:
+        return
+    startup = pd.Series(startup_s)
+    main_log.info(f"{start_method} workers warmed up in [s]: min {startup.min():.2f}, median {startup.median():.2f}, "
+                  f"max {startup.max():.2f} - first results after {first_result_s:.2f} s")
+
+def run_pool(s_list, spec, results_store, ledger, hpc_resource=None, verbose = True):
+    chunks = (list(s_list[i : i + chunksize]) for i in range(0, len(s_list), chunksize))
+    n_chunks = -(-len(s_list) // chunksize)
+    main_log.info(f"running {len(s_list)} sites in {n_chunks} chunks of up to {chunksize} on {n_workers} workers")
+    n_done = 0
+    startup_s = []
+    first_result_s = None
+    pool_start = time.perf_counter()
+    context = pool_context()
+    log_queue, log_listener = start_worker_listener(context)
+    try:
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=context,
+                                 initializer=warm_up, initargs=(spec, log_queue, hpc_resource)) as pool:
+            pending = set()
+            while True:
+                # Only submit more chunks as earlier ones finish
+                while len(pending) < n_workers*pending_per_worker:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    pending.add(pool.submit(run_chunk, chunk))
+                if len(pending) == 0:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    worker_startup, outcomes = future.result()
+                    if worker_startup is not None:
+                        startup_s.append(worker_startup)
+                    if first_result_s is None:
+                        first_result_s = time.perf_counter() - pool_start
+                    record_outcomes(outcomes, results_store, ledger)
+                    n_done += len(outcomes)
+                if verbose:
+                    print(f"{n_done} of {len(s_list)} sites done")
+    finally:
+        ledger.record_done([row["id"] for row in results_store.flush()])
+        # Workers have exited with the pool, so everything they logged is already queued
+        log_listener.stop()
+    report_startup(startup_s, first_result_s)
+
+
+if __name__ == "__main__":
+    start_time = datetime.now()
+    # --resume skips sites already recorded done in the ledger, rerunning unfinished and failed sites
+    n_sites, start_idx, resume = sweep_runner.parse_args(sys.argv)
+
+    spec = sweep_runner.setup_sweep()
+    site_list_all = sweep_runner.sweep_scenarios(spec, n_sites, start_idx)
+    if resume:
+        site_list_all = sweep_runner.resume_scenarios(site_list_all, spec)
+
+    results_store = ResultsStore(sweep_runner.results_dir, 0, sweep_runner.results_flush_every,
+                                 sweep_runner.results_flush_seconds)
+    ledger = SweepLedger(sweep_runner.ledger_dir, 0)
+    cost_library = get_cost_library()
+    site_list_all = sweep_runner.run_fixed_cost_scenarios(site_list_all, spec, results_store, ledger, cost_library)
+
+    hpc_resource = None
+    if sweep_runner.resource_origin == "HPC":
+        hpc_resource = HPCResource.from_config(load_yaml(sweep_runner.INPUT_DIR/'multiprocess/example.yaml'),
+                                               *sweep_runner.resource_year_hub_height())
+    elif sweep_runner.prefetch:
+        sweep_runner.prefetch_sites(site_list_all, spec)
+
+    # Resource statistics come from the API resource files, which HPC runs don't download
+    if sweep_runner.prescreen and sweep_runner.resource_origin != "HPC":
+        site_list_all, _ = sweep_runner.prescreen_sites(site_list_all, spec)
+
+    run_pool(site_list_all, spec, results_store, ledger, hpc_resource)
+    sweep_runner.write_summary(sweep_runner.summary_results(cost_library))
+    print(f"ellapsed time: {datetime.now() - start_time}")
@@ -0,0 +1,66 @@
+'''
+Reruns only the finance stage of example_plants across incentive options and finance parameters
+Each site's pre-ProFAST steps are run once, or loaded from the pre-ProFAST cache, and every finance
+variant reruns just ProFAST and the iron model - results of all sites and variants go in one table
+'''
+
+import os
+import sys
+import pandas as pd
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from utilities.logger import main_logger as main_log
+from utilities.sweep_spec import SweepSpec
+from utilities.sweep_runner import setup_sweep, parse_args, sweep_scenarios, SCENARIO_COLUMNS
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+INPUT_DIR = ROOT_DIR/"example_plant/input"
+
+# Sites to run are set by sitelist_all and sweep_spec_fp in utilities/sweep_runner.py, as for the other runners
+# Incentive options and finance parameters to run at every site
+finance_spec_fp = INPUT_DIR/'multiprocess/finance_variants.yaml'
+
+n_workers = os.cpu_count()
+# Sites sent to a worker per task
+chunksize = 1
+
+results_fp = ROOT_DIR/"example_plant/output/finance_sweep.parquet"
+
+# Run every finance variant of one site - failures are logged and give no rows so the rest still run
+def run_site(scenario, variants):
+    from run_example_plant import run_finance_variants
+    params = {name: value for name, value in scenario.items() if name not in SCENARIO_COLUMNS}
+    location = (scenario['latitude'], scenario['longitude'])
+    try:
+        results = run_finance_variants(variants, scenario['ore'], scenario['tech'], location, scenario['id'], params)
+    except Exception:
+        main_log.exception(f"worker {os.getpid()} Site {scenario['id']}: failed")
+        return pd.DataFrame()
+    results.insert(1, 'ore', scenario['ore'])
+    results.insert(2, 'tech', scenario['tech'])
+    results.insert(3, 'latitude', location[0])
+    results.insert(4, 'longitude', location[1])
+    return results
+
+def run_finance_sweep(scenarios, variants):
+    main_log.info(f"running {len(variants)} finance variants at each of {len(scenarios)} sites on {n_workers} workers")
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        tables = list(pool.map(run_site, scenarios, [variants]*len(scenarios), chunksize=chunksize))
+    return pd.concat(tables, ignore_index=True)
+
+
+if __name__ == "__main__":
+    start_time = datetime.now()
+    n_sites, start_idx, _ = parse_args(sys.argv)
+
+    spec = setup_sweep()
+    scenarios = [spec.scenario(gid) for gid in sweep_scenarios(spec, n_sites, start_idx)]
+    variants = list(SweepSpec.from_yaml(finance_spec_fp))
+
+    results = run_finance_sweep(scenarios, variants)
+    os.makedirs(results_fp.parent, exist_ok=True)
+    results.to_parquet(results_fp, index=False)
+    main_log.info(f"wrote {len(results)} finance variant results to {results_fp}")
+    print(f"ellapsed time: {datetime.now() - start_time}")
@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Tests import utilities the way the example_plant scripts do, from the repo root
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+sys.path.insert(0, str(ROOT_DIR/"example_plant"))
+
+# Log to a temp directory instead of the repo's dbg_log - set before utilities.logger is first imported
+os.environ["NED_LOG_DIR"] = tempfile.mkdtemp(prefix="ned_log_")
@@ -0,0 +1,21 @@
+import os
+import pytest
+
+from utilities.atomic_io import atomic_path, write_atomic
+
+def test_failed_writes_leave_the_old_file_and_no_temp_files(tmp_path):
+    fp = tmp_path/'out'/'table.csv'
+    write_atomic(fp, 'a,b\n1,2\n')
+    with pytest.raises(RuntimeError):
+        with atomic_path(fp) as tmp_fp:
+            with open(tmp_fp, 'w') as tmp_file:
+                tmp_file.write('a,b\n')
+            raise RuntimeError("writer died")
+    assert fp.read_text() == 'a,b\n1,2\n'
+    assert os.listdir(fp.parent) == ['table.csv']
+
+def test_bytes_and_text_are_written_whole(tmp_path):
+    write_atomic(tmp_path/'data.bin', b'\x00\x01')
+    write_atomic(tmp_path/'data.txt', 'text')
+    assert (tmp_path/'data.bin').read_bytes() == b'\x00\x01'
+    assert (tmp_path/'data.txt').read_text() == 'text'
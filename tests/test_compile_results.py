@@ -0,0 +1,37 @@
+import pickle
+import pytest
+
+pd = pytest.importorskip('pandas')
+pytest.importorskip('pyarrow')
+
+from utilities.compile_results import compile_results
+from utilities.results_store import ResultsStore
+from utilities.resource_screen import STATS_COLUMNS, stats_keys
+
+def test_scenarios_sharing_a_location_ore_and_tech_stay_separate(tmp_path):
+    store = ResultsStore(tmp_path / 'results')
+    for site_id, lcoh in [('a', 3.0), ('b', 4.0), ('a', 3.5)]:
+        store.append({'id': site_id, 'latitude': 45.0, 'longitude': -90.0, 'ore': 'Hibbing Taconite',
+                      'tech': 'h2_dri', 'lcoe': 30.0, 'lcoh': lcoh, 'lcoi': 400.0})
+    store.flush()
+    (tmp_path / 'output' / 'lcoh').mkdir(parents=True)
+    with open(tmp_path / 'output' / 'lcoh' / '45.0_-90.0_lcoh.pkl', 'wb') as writer:
+        pickle.dump(2.5, writer)
+
+    # Resource statistics already in the stats index, so no resource files are needed
+    weather_dir = str(tmp_path / 'weather') + '/'
+    (tmp_path / 'weather').mkdir()
+    stats = pd.DataFrame([[7.5, 200.0, 0.4, 0.2]], columns=STATS_COLUMNS,
+                         index=pd.Index(stats_keys(pd.DataFrame({'latitude': [45.0], 'longitude': [-90.0]}), 2012, 100),
+                                        name='key'))
+    stats.to_csv(weather_dir + 'resource_stats.csv')
+
+    table = compile_results(tmp_path / 'output', tmp_path / 'compiled.feather', tmp_path / 'results', 2012, 100,
+                            weather_dir, max_workers=1)
+    scenarios = table[table['id'].notna()].set_index('id')
+    assert sorted(scenarios.index) == ['a', 'b']
+    assert scenarios.loc['a', 'lcoh'] == 3.5
+    assert scenarios.loc['b', 'lcoi'] == 400.0
+    assert scenarios['ghg_total'].notna().all()
+    locations = table[table['id'].isna()]
+    assert locations['lcoh'].tolist() == [2.5]
@@ -0,0 +1,56 @@
+import math
+import copy
+import pytest
+import yaml
+from types import SimpleNamespace
+
+pytest.importorskip('pandas')
+
+from utilities.config_factory import ConfigFactory, set_param, unknown_params
+from utilities.sweep_spec import read_template
+from conftest import ROOT_DIR
+
+TEMPLATE_FP = ROOT_DIR/"example_plant/input/multiprocess/sitelist_template.csv"
+GREENHEART_CONFIG_FP = ROOT_DIR/"example_plant/input/plant/greenheart_config.yaml"
+
+def test_blank_template_cells_keep_config_defaults():
+    with open(GREENHEART_CONFIG_FP) as config_file:
+        template_config = yaml.safe_load(config_file)
+    default_inflation = template_config['finance_parameters']['costing_general_inflation']
+    rows = read_template(TEMPLATE_FP)
+    blank_rows = [row for row in rows if math.isnan(row['inflation'])]
+    assert len(blank_rows) > 0
+    for row in rows:
+        greenheart_config = copy.deepcopy(template_config)
+        for name, value in row.items():
+            set_param(greenheart_config, name, value)
+        inflation = greenheart_config['finance_parameters']['costing_general_inflation']
+        assert math.isfinite(inflation)
+        if math.isnan(row['inflation']):
+            assert inflation == default_inflation
+        else:
+            assert inflation == pytest.approx(row['inflation']*0.01)
+
+def test_parameters_set_param_would_drop_are_unknown():
+    with open(GREENHEART_CONFIG_FP) as config_file:
+        template_config = yaml.safe_load(config_file)
+    finance_name = next(iter(template_config['finance_parameters']))
+    # The example config has no iron section for slag_disposal_cost to go in
+    assert unknown_params(template_config, ['inflation', finance_name, 'slag_disposal_cost', 'discount_rat']) == \
+        ['discount_rat', 'slag_disposal_cost']
+
+def test_running_a_variant_leaves_the_template_unchanged():
+    # The template is built without GreenHEART, which isn't needed to copy it
+    factory = ConfigFactory.__new__(ConfigFactory)
+    factory.template = SimpleNamespace(hopp_config={'site': {'data': {'lat': 45.0, 'lon': -90.0}}},
+                                       greenheart_config={'site': {'resource_dir': '/weather/'}},
+                                       turbine_config={'hub_height': 100, 'rotor_diameter': 150},
+                                       floris_config={'farm': {'layout_x': [0.0]}})
+    base = copy.deepcopy(factory.template)
+    config = factory.variant(location=(40.0, -100.0), resource_dir='/other/')
+    # GreenHEART writes to every config of the variant it runs
+    config.turbine_config['hub_height'] = 120
+    config.floris_config['farm']['layout_x'].append(500.0)
+    config.hopp_config['site']['data']['year'] = 2013
+    config.greenheart_config['site']['resource_dir'] = '/elsewhere/'
+    assert vars(factory.template) == vars(base)
@@ -0,0 +1,27 @@
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+from utilities.ghg_accounting import carbon_intensity, ELECTROLYZER_CONSUMPTION
+from utilities.load_library_inputs import get_cost_library
+
+def scenario(id, **params):
+    return {'id': id, 'ore': 'Hibbing Taconite', 'tech': 'h2_dri', 'wind_cf': 0.4, 'solar_cf': 0.2, **params}
+
+def test_carbon_intensity_comes_from_each_site_or_its_overrides():
+    results = carbon_intensity(pd.DataFrame([scenario('windy'),
+                                             scenario('calm', wind_cf=0.2),
+                                             scenario('fixed', overwrite_elec='Yes', elec_ci=0.1),
+                                             scenario('pellets', ore='Northshore Taconite')])).set_index('id')
+    assert results.loc['windy', 'ghg_total'] < results.loc['calm', 'ghg_total']
+    assert results.loc['fixed', 'elec_ci_used'] == 0.1
+    assert results.loc['fixed', 'h2_ci_used'] == pytest.approx(0.1*ELECTROLYZER_CONSUMPTION)
+    assert results.loc['pellets', 'ghg_ore'] == results.loc['windy', 'ghg_ore']
+
+def test_unknown_ores_are_rejected():
+    with pytest.raises(KeyError, match='Mystery Ore'):
+        carbon_intensity(pd.DataFrame([scenario('ore', ore='Mystery Ore')]))
+
+def test_every_costed_ore_has_ghg_factors():
+    library = get_cost_library()
+    assert set(library.ore_cost.index) <= set(library.ore_ghg.index)
@@ -0,0 +1,151 @@
+import numpy as np
+import pytest
+
+h5py = pytest.importorskip('h5py')
+pytest.importorskip('scipy')
+
+from utilities.hpc_resource import HPCResource, read_columns, to_local, hourly_times, calendar, PA_PER_ATM
+
+'''
+HPCResource against a tiny synthetic NSRDB/WTK pair laid out like the HPC datasets
+
+The grid is 3 x 4 points a degree apart, with a leap year so Feb 29 has to be dropped. Every
+variable is stored as scaled integers that encode the gid and the hour, so the tests can tell which
+column and which hour each value came from.
+'''
+
+YEAR = 2012
+N_HOURS = 8784
+LATS = [40.0, 41.0, 42.0]
+LONS = [-100.0, -99.0, -98.0, -97.0]
+# Timezone of each gid - rolling by it moves a site's hours to local standard time
+TIMEZONES = [-6, -6, -5, -5, -7, -6, -6, -5, -8, -7, -6, -5]
+
+def grid_meta(fields):
+    lats, lons = np.meshgrid(LATS, LONS, indexing='ij')
+    meta = np.zeros(lats.size, dtype=[(name, 'f8') for name in fields])
+    meta['latitude'] = lats.ravel()
+    meta['longitude'] = lons.ravel()
+    meta['timezone'] = TIMEZONES
+    if 'elevation' in fields:
+        meta['elevation'] = np.arange(lats.size)*10.0
+    return meta
+
+def time_index(step_minutes):
+    times = np.arange(np.datetime64('{}-01-01T00:00'.format(YEAR)), np.datetime64('{}-01-01T00:00'.format(YEAR+1)),
+                      np.timedelta64(step_minutes, 'm'))
+    return np.array([str(t).replace('T', ' ') + ':00+00:00' for t in times], dtype='S25')
+
+# Stored value of a (time, gid) dataset - gid in the thousands, hour of the year mod 1000 below that
+def encoded(n_rows, n_gids, rows_per_hour=1, offset=0):
+    hours = np.arange(n_rows)//rows_per_hour
+    return (np.arange(n_gids)[None, :]*1000 + (hours % 1000)[:, None] + offset).astype(np.int32)
+
+def expected_utc(gid, scale, offset=0):
+    return (gid*1000 + np.arange(N_HOURS) % 1000 + offset)/scale
+
+@pytest.fixture
+def hpc_files(tmp_path):
+    nsrdb_dir = tmp_path/'nsrdb'
+    wtk_dir = tmp_path/'wtk'
+    nsrdb_dir.mkdir()
+    wtk_dir.mkdir()
+    n_gids = len(LATS)*len(LONS)
+    # NSRDB is half-hourly
+    with h5py.File(nsrdb_dir/'nsrdb_{}.h5'.format(YEAR), 'w') as h5:
+        h5['meta'] = grid_meta(['latitude', 'longitude', 'timezone', 'elevation'])
+        h5['time_index'] = time_index(30)
+        for name in ['ghi', 'dni', 'dhi']:
+            h5[name] = encoded(2*N_HOURS, n_gids, rows_per_hour=2)
+            h5[name].attrs['psm_scale_factor'] = 10.0
+    with h5py.File(wtk_dir/'wtk_conus_{}.h5'.format(YEAR), 'w') as h5:
+        h5['meta'] = grid_meta(['latitude', 'longitude', 'timezone'])
+        h5['time_index'] = time_index(60)
+        for name in ['windspeed_100m', 'winddirection_100m', 'temperature_100m']:
+            h5[name] = encoded(N_HOURS, n_gids)
+            h5[name].attrs['scale_factor'] = 100.0
+        # Pressure in Pa/10 - pressure_0m is a decoy the 100 m hub height shouldn't use
+        h5['pressure_100m'] = encoded(N_HOURS, n_gids, offset=9000)
+        h5['pressure_100m'].attrs['scale_factor'] = 0.1
+        h5['pressure_0m'] = np.zeros((N_HOURS, n_gids), dtype=np.int32)
+        h5['pressure_0m'].attrs['scale_factor'] = 0.1
+    return str(nsrdb_dir), str(wtk_dir)
+
+# Sites just off gids 1, 6 and 11, and a second site in gid 6
+SITES = [(40.1, -99.1, 1), (41.05, -98.0, 6), (42.2, -97.1, 11), (40.95, -97.9, 6)]
+
+def test_sites_map_to_nearest_gids(hpc_files):
+    resource = HPCResource(*hpc_files, YEAR, 100)
+    lats, lons, gids = zip(*SITES)
+    with h5py.File(resource.fps['solar'], 'r') as h5:
+        assert resource.gids('solar', h5, lats, lons).tolist() == list(gids)
+    with h5py.File(resource.fps['wind'], 'r') as h5:
+        assert resource.gids('wind', h5, lats, lons).tolist() == list(gids)
+
+class RecordingDataset:
+    """h5py dataset that records the hyperslabs read from it"""
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.attrs = dataset.attrs
+        self.reads = []
+
+    def __getitem__(self, key):
+        self.reads.append(key)
+        return self.dataset[key]
+
+def test_read_columns_merges_gids_within_max_gap(tmp_path):
+    with h5py.File(tmp_path/'wide.h5', 'w') as h5:
+        h5['data'] = encoded(24, 60)
+        h5['data'].attrs['scale_factor'] = 1.0
+        dataset = RecordingDataset(h5['data'])
+        gids = np.array([0, 1, 5, 40, 41, 59])
+        values = read_columns(dataset, gids, max_gap=3)
+        # 1 -> 5 skips 3 gids and stays one slab, 5 -> 40 and 41 -> 59 don't
+        assert [key[1] for key in dataset.reads] == [slice(0, 6), slice(40, 42), slice(59, 60)]
+        np.testing.assert_array_equal(values, encoded(24, 60)[:, gids])
+        dataset.reads.clear()
+        read_columns(dataset, gids, max_gap=64)
+        assert len(dataset.reads) == 1
+
+def test_hourly_times_and_calendar_drop_feb_29(hpc_files):
+    with h5py.File(HPCResource(*hpc_files, YEAR, 100).fps['solar'], 'r') as h5:
+        times, step = hourly_times(h5)
+    assert step == 2
+    assert len(times) == N_HOURS
+    columns, keep = calendar(times)
+    assert keep.sum() == 8760
+    assert not ((columns['month'] == 2) & (columns['day'] == 29)).any()
+    assert columns['hour'][:25].tolist() == list(range(24)) + [0]
+    assert (columns['minute'] == 0).all()
+
+def test_to_local_rolls_each_site_by_its_timezone():
+    data = np.arange(10, dtype=np.float32)[:, None].repeat(2, axis=1)
+    local = to_local(data, [-2, 3])
+    np.testing.assert_array_equal(local[:, 0], np.roll(np.arange(10), -2))
+    np.testing.assert_array_equal(local[:, 1], np.roll(np.arange(10), 3))
+
+def test_load_reads_chunk_into_memory(hpc_files):
+    resource = HPCResource(*hpc_files, YEAR, 100)
+    lats, lons, gids = zip(*SITES)
+    resource.load(lats, lons)
+    keep = calendar(np.arange(np.datetime64('2012-01-01T00'), np.datetime64('2013-01-01T00'))
+                    .astype('datetime64[m]'))[1]
+    for lat, lon, gid in SITES:
+        assert (lat, lon, YEAR) in resource
+        tz = TIMEZONES[gid]
+        solar = resource.solar_data(lat, lon)
+        assert solar['tz'] == tz
+        assert solar['elev'] == gid*10.0
+        assert len(solar['gh']) == 8760
+        np.testing.assert_allclose(solar['gh'], np.roll(expected_utc(gid, 10.0), tz)[keep], rtol=1e-6)
+
+        wind = resource.wind_data(lat, lon)
+        assert wind['heights'] == [100]*4
+        assert wind['fields'] == [1, 2, 3, 4]
+        assert wind['data'].shape == (8760, 4)
+        np.testing.assert_allclose(wind['data'][:, 2], np.roll(expected_utc(gid, 100.0), tz)[keep], rtol=1e-6)
+        # Pa to atm, from pressure_100m rather than pressure_0m
+        pressure = np.roll(expected_utc(gid, 0.1, offset=9000), tz)[keep]/PA_PER_ATM
+        np.testing.assert_allclose(wind['data'][:, 1], pressure, rtol=1e-5)
+    assert (40.5, -99.5, YEAR) not in resource
@@ -0,0 +1,23 @@
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+from utilities.iron_finance import fixed_cost_rows
+
+def scenario(id, **params):
+    return {'id': id, 'ore': 'Hibbing Taconite', 'tech': 'h2_dri', 'latitude': 45.0, 'longitude': -90.0, **params}
+
+def test_fixed_cost_rows_reject_scenarios_that_cant_be_costed():
+    scenarios = pd.DataFrame([scenario('fixed', overwrite_h2='Yes', h2_cost=2.0, h2_ci=0.0),
+                              scenario('ore', overwrite_h2='Yes', h2_cost=2.0, h2_ci=0.0, ore='More Expensive Ore'),
+                              scenario('tech', overwrite_h2='Yes', h2_cost=2.0, h2_ci=0.0, tech='ng_dri'),
+                              scenario('elec', overwrite_h2='No', overwrite_elec='Yes', elec_cost=0.03),
+                              scenario('full', overwrite_h2='No')]).set_index('id')
+    rows, failed = fixed_cost_rows(scenarios, elec_cost=0.025)
+    assert [row['id'] for row in rows] == ['fixed']
+    assert sorted(failed) == ['elec', 'ore', 'tech']
+    # Electricity at the PPA price when it isn't overridden, iron cost kept apart from GreenHEART's lcoi
+    assert rows[0]['lcoe'] == pytest.approx(25.0)
+    assert rows[0]['lcoh'] == 2.0
+    assert rows[0]['lcoi_fixed_cost'] > 0
+    assert 'lcoi' not in rows[0]
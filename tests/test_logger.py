@@ -0,0 +1,22 @@
+import json
+
+from utilities import logger
+
+def test_rank_logs_keep_tracebacks_and_merge_past_bad_lines(tmp_path):
+    run_dir = logger.setup_rank_logging(0, 'run', str(tmp_path))
+    try:
+        try:
+            raise ValueError("no resource")
+        except ValueError:
+            logger.main_logger.exception("Site a: failed", extra={"site_id": "a"})
+    finally:
+        logger.stop_rank_logging()
+    with open(tmp_path/'run'/'rank00001.jsonl', 'w') as rank_file:
+        rank_file.write('{"time": 0, "message": "earlier"}\n{"time": 1, "mess\n')
+
+    with open(logger.merge_rank_logs(run_dir)) as merged_file:
+        entries = [json.loads(line) for line in merged_file]
+    assert [entry['message'] for entry in entries] == ['earlier', 'Site a: failed']
+    assert entries[1]['site_id'] == 'a'
+    assert 'ValueError: no resource' in entries[1]['exception']
+    assert logger.main_logger.handlers == [logger.handler]
@@ -0,0 +1,14 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pyproj = pytest.importorskip('pyproj')
+pytest.importorskip('shapely')
+
+from utilities.mapping import merc_x, merc_y
+
+def test_merc_matches_pyproj_web_mercator():
+    lats, lons = np.meshgrid(np.linspace(-80, 80, 17), np.linspace(-179, 179, 11))
+    to_3857 = pyproj.Transformer.from_crs('EPSG:4326', 'EPSG:3857', always_xy=True)
+    x, y = to_3857.transform(lons, lats)
+    np.testing.assert_allclose(merc_x(lons), x, atol=1e-3)
+    np.testing.assert_allclose(merc_y(lats), y, atol=1e-3)
@@ -0,0 +1,56 @@
+import os
+import sys
+import json
+import shutil
+import subprocess
+import pytest
+
+pytest.importorskip('mpi4py')
+pytest.importorskip('hopp')
+
+from conftest import ROOT_DIR
+
+# Runs the dynamic scheduler of run_example_plants_mpi.py on every rank, with a site run that only
+# records which sites it was given, and writes every rank's sites from rank 0
+DISPATCH_SCRIPT = '''
+import sys
+import json
+from pathlib import Path
+sys.path[:0] = [{root!r}, {example_plant!r}]
+from utilities import sweep_runner
+from utilities.sweep_spec import SweepSpec
+out_dir = Path(sys.argv[1])
+sweep_runner.results_dir = out_dir/"results"
+sweep_runner.ledger_dir = out_dir/"ledger"
+import run_example_plants_mpi as runner
+runner.runtime_fp = out_dir/"site_runtimes.csv"
+
+dispatched = []
+def do_something(inputs, site_id):
+    dispatched.append(site_id)
+    return {{"lcoh": 1.0}}
+runner.do_something = do_something
+
+spec = SweepSpec({{"location": [{{"latitude": 45.0, "longitude": -90.0}}, {{"latitude": 46.0, "longitude": -91.0}}],
+                  "ore": ["Hibbing Taconite", "United Taconite"],
+                  "tech": ["h2_dri", "h2_dri_eaf"]}})
+runner.run_dynamic(range(len(spec)), spec, verbose=False)
+all_dispatched = runner.comm.gather(dispatched, root=0)
+runner.stop_rank_logging()
+if runner.rank == 0:
+    with open(out_dir/"dispatched.json", "w") as out_file:
+        json.dump({{"ids": [scenario["id"] for scenario in spec], "dispatched": all_dispatched}}, out_file)
+'''
+
+@pytest.mark.skipif(shutil.which('mpiexec') is None, reason="needs mpiexec")
+def test_every_site_is_dispatched_exactly_once(tmp_path):
+    script_fp = tmp_path/'dispatch.py'
+    script_fp.write_text(DISPATCH_SCRIPT.format(root=str(ROOT_DIR), example_plant=str(ROOT_DIR/'example_plant')))
+    subprocess.run(['mpiexec', '-n', '2', sys.executable, str(script_fp), str(tmp_path)],
+                   check=True, timeout=300, env=os.environ.copy())
+    with open(tmp_path/'dispatched.json') as out_file:
+        out = json.load(out_file)
+    # Rank 0 only hands sites out
+    assert out['dispatched'][0] == []
+    all_dispatched = [site_id for rank_sites in out['dispatched'] for site_id in rank_sites]
+    assert sorted(all_dispatched) == sorted(out['ids'])
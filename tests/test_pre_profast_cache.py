@@ -0,0 +1,54 @@
+import os
+import copy
+import time
+import numpy as np
+from pathlib import Path
+from types import SimpleNamespace
+
+from utilities import pre_profast_cache
+
+def config(lat=45.0, lon=-90.0, **finance):
+    return SimpleNamespace(hopp_config={'site': {'data': {'lat': lat, 'lon': lon, 'year': 2012},
+                                                 'solar_resource_file': '/weather/solar/a.csv'},
+                                        'technologies': {'wind': {'num_turbines': np.int64(20)}}},
+                           turbine_config={'hub_height': 100},
+                           greenheart_config={'electrolyzer': {'rating': 100},
+                                              'finance_parameters': {'costing_general_inflation': 0.025,
+                                                                     'discount_years': {'wind': 2022},
+                                                                     **finance},
+                                              'iron': {'ore_type': 'Hibbing Taconite'}})
+
+def test_keys_only_change_with_pre_profast_inputs():
+    key = pre_profast_cache.pre_profast_key(config())
+    # The same inputs in another order, resources of the same location, or ProFAST-only inputs share the key
+    reordered = config()
+    reordered.hopp_config = dict(reversed(list(reordered.hopp_config.items())))
+    moved_file = config()
+    moved_file.hopp_config['site']['solar_resource_file'] = Path('/other/solar/a.csv')
+    other_ore = config(debt_equity_split=60)
+    other_ore.greenheart_config['iron']['ore_type'] = 'United Taconite'
+    for same in [copy.deepcopy(config()), reordered, moved_file, other_ore]:
+        assert pre_profast_cache.pre_profast_key(same) == key
+    for other in [config(lat=46.0), config(costing_general_inflation=0.03)]:
+        assert pre_profast_cache.pre_profast_key(other) != key
+
+def test_only_one_run_fills_an_entry_and_the_next_loads_it(tmp_path):
+    key = pre_profast_cache.pre_profast_key(config())
+    assert not pre_profast_cache.is_cached(tmp_path, key)
+    assert pre_profast_cache.claim(tmp_path, key)
+    assert not pre_profast_cache.claim(tmp_path, key)
+    pre_profast_cache.mark_cached(tmp_path, key)
+    assert pre_profast_cache.is_cached(tmp_path, key)
+    assert sorted(os.listdir(tmp_path)) == [key + '.done']
+
+def test_failed_and_stale_claims_are_released(tmp_path):
+    key = pre_profast_cache.pre_profast_key(config())
+    assert pre_profast_cache.claim(tmp_path, key)
+    # A run that fails releases its claim without marking the entry done
+    pre_profast_cache.release(tmp_path, key)
+    assert pre_profast_cache.claim(tmp_path, key)
+    assert not pre_profast_cache.is_cached(tmp_path, key)
+    # A lock left by a crashed run is taken over once it is old enough
+    stale = time.time() - pre_profast_cache.LOCK_TIMEOUT_S - 60
+    os.utime(pre_profast_cache.cache_fn(tmp_path, key) + '.lock', (stale, stale))
+    assert pre_profast_cache.claim(tmp_path, key)
@@ -0,0 +1,85 @@
+import os
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+from utilities.prefetch_resources import prefetch_resources, wind_heights
+
+SOLAR_CSV = b'Source,Latitude\nNSRDB,45.0\nYear,GHI\n2012,0\n'
+
+def srw(height):
+    rows = ['id,city,state,country,year,lat,lon', 'WTK', 'Temperature,Pressure,Speed,Direction',
+            'C,atm,m/s,Degrees', ','.join([str(height)]*4), '10,1,{},180'.format(height/10)]
+    return ('\n'.join(rows)+'\n').encode()
+
+# Answers each path with the queued error codes first, then the file
+class StubHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        params = urllib.parse.parse_qs(url.query)
+        self.server.requests.append((url.path, params))
+        errors = self.server.errors.get(url.path, [])
+        if len(errors) > 0:
+            self.send_response(errors.pop(0))
+            self.end_headers()
+            return
+        body = SOLAR_CSV if url.path == '/solar' else srw(int(params['hubheight'][0]))
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.requests = []
+    server.errors = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def base_urls(server):
+    return {kind: 'http://127.0.0.1:{}/{}'.format(server.server_address[1], kind) for kind in ['solar', 'wind']}
+
+def test_prefetch_retries_rate_limits_and_server_errors(server, tmp_path):
+    server.errors = {'/solar': [429, 503], '/wind': [500]}
+    sites = pd.DataFrame({'latitude': [45.0, 45.001], 'longitude': [-94.0, -94.0]})
+    failed = prefetch_resources(sites, str(tmp_path)+'/', 2012, 90, rate_per_s=None,
+                                base_urls=base_urls(server), backoff_s=0.01)
+    assert failed == []
+    # Both sites share one grid cell, so each file is fetched once after its retries
+    assert [path for path, _ in server.requests].count('/solar') == 3
+    assert [path for path, _ in server.requests].count('/wind') == 1 + len(wind_heights(90))
+    with open(tmp_path/'solar'/'45.000_-94.000_2012.csv', 'rb') as solar_file:
+        assert solar_file.read() == SOLAR_CSV
+    # No temp files are left behind by the atomic writes
+    assert sorted(os.listdir(tmp_path/'solar')) == ['45.000_-94.000_2012.csv']
+    assert sorted(os.listdir(tmp_path/'wind')) == ['45.000_-94.000_2012.csv']
+
+def test_prefetch_combines_heights_around_the_hub_height(server, tmp_path):
+    prefetch_resources(pd.DataFrame({'latitude': [45.0], 'longitude': [-94.0]}), str(tmp_path)+'/', 2012, 90,
+                       rate_per_s=None, base_urls=base_urls(server), backoff_s=0.01)
+    with open(tmp_path/'wind'/'45.000_-94.000_2012.csv') as wind_file:
+        lines = wind_file.read().splitlines()
+    assert lines[:2] == ['id,city,state,country,year,lat,lon', 'WTK']
+    assert lines[2] == ','.join(['Temperature,Pressure,Speed,Direction']*2)
+    assert lines[4] == ','.join(['80']*4 + ['100']*4)
+    assert lines[5] == '10,1,8.0,180,10,1,10.0,180'
+
+def test_prefetch_reports_requests_that_cant_be_fetched(server, tmp_path):
+    server.errors = {'/solar': [404]}
+    failed = prefetch_resources(pd.DataFrame({'latitude': [45.0], 'longitude': [-94.0]}), str(tmp_path)+'/',
+                                2012, 100, rate_per_s=None, base_urls=base_urls(server), backoff_s=0.01)
+    # Client errors aren't retried
+    assert [path for path, _ in server.requests].count('/solar') == 1
+    assert failed == [(45.0, -94.0, 2012, 100.0)]
+    assert not os.path.exists(tmp_path/'solar'/'45.000_-94.000_2012.csv')
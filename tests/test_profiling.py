@@ -0,0 +1,31 @@
+import sys
+import types
+import pytest
+
+pytest.importorskip('pandas')
+
+from utilities import profiling
+
+@pytest.fixture
+def enabled(monkeypatch):
+    monkeypatch.setattr(profiling, 'enabled', True)
+    monkeypatch.setattr(profiling, 'records', [])
+    monkeypatch.setattr(profiling, 'timed_functions', set())
+
+def test_library_steps_are_timed_within_the_site(enabled, monkeypatch):
+    library = types.ModuleType('fake_library')
+    library.run_step = lambda x: x + 1
+    monkeypatch.setitem(sys.modules, 'fake_library', library)
+    assert profiling.time_calls({'fake_library': {'run_step': 'step', 'missing': 'missing'},
+                                 'not_a_module': {'run_step': 'other'}}) == ['step']
+    # Timing twice doesn't wrap the function again
+    profiling.time_calls({'fake_library': {'run_step': 'step'}})
+    with profiling.site('a'):
+        assert library.run_step(1) == 2
+    stages = profiling.stage_records()
+    assert stages[['site_id', 'stage']].values.tolist() == [['a', 'step'], ['a', 'site_total']]
+
+def test_stages_after_a_site_are_recorded_for_it(enabled):
+    with profiling.stage('results_io', 'a'):
+        pass
+    assert profiling.stage_records()['site_id'].tolist() == ['a']
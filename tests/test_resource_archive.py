@@ -0,0 +1,48 @@
+import os
+import numpy as np
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+from utilities.resource_archive import (build_archive, ResourceArchive, read_solar_csv, read_wind_srw,
+                                        SOLAR_KEYS, WIND_FIELDS, N_HOURS)
+
+SOLAR_COLUMNS = ['Year', 'Month', 'Day', 'Hour', 'Minute', 'GHI', 'DHI', 'DNI', 'Wind Speed', 'Temperature']
+WIND_COLUMNS = ['Temperature', 'Pressure', 'Speed', 'Direction', 'Speed']
+
+def write_site(weather_dir, lat, lon, year, rng):
+    fn = '{:.3f}_{:.3f}_{:d}.csv'.format(lat, lon, year)
+    solar = rng.uniform(0, 1000, size=(N_HOURS, len(SOLAR_COLUMNS))).round(1)
+    os.makedirs(weather_dir/'solar', exist_ok=True)
+    with open(weather_dir/'solar'/fn, 'w') as solar_file:
+        solar_file.write('Source,Latitude,Longitude,Time Zone,Elevation\nNSRDB,{},{},-6,{}\n'.format(lat, lon, lat*10))
+        solar_file.write(','.join(SOLAR_COLUMNS) + '\n')
+        np.savetxt(solar_file, solar, delimiter=',', fmt='%.1f')
+    wind = rng.uniform(0, 25, size=(N_HOURS, len(WIND_COLUMNS))).round(3)
+    os.makedirs(weather_dir/'wind', exist_ok=True)
+    with open(weather_dir/'wind'/fn, 'w') as wind_file:
+        wind_file.write('id,city,state,country,{},{},{}\nWTK\n'.format(year, lat, lon))
+        wind_file.write(','.join(WIND_COLUMNS) + '\n')
+        wind_file.write('C,atm,m/s,Degrees,m/s\n100,100,100,100,120\n')
+        np.savetxt(wind_file, wind, delimiter=',', fmt='%.3f')
+    return fn
+
+def test_archived_sites_match_their_resource_files(tmp_path):
+    rng = np.random.default_rng(0)
+    sites = [(45.0, -90.0, 2012), (46.5, -92.25, 2012)]
+    fns = [write_site(tmp_path, *site, rng) for site in sites]
+    archive = ResourceArchive(build_archive(str(tmp_path) + '/'))
+    assert isinstance(archive.solar, np.memmap)
+    for site, fn in zip(sites, fns):
+        assert site in archive
+        columns, solar, meta = read_solar_csv(tmp_path/'solar'/fn)
+        solar_data = archive.solar_data(*site)
+        for j, column in enumerate(columns):
+            np.testing.assert_array_equal(solar_data[SOLAR_KEYS[column]], solar[:, j])
+        assert (solar_data['tz'], solar_data['elev']) == (meta['tz'], meta['elev'])
+        fields, heights, wind = read_wind_srw(tmp_path/'wind'/fn)
+        wind_data = archive.wind_data(*site)
+        np.testing.assert_array_equal(wind_data['data'], wind)
+        assert wind_data['heights'] == heights
+        assert wind_data['fields'] == [WIND_FIELDS[field] for field in fields]
+    assert (47.0, -90.0, 2012) not in archive
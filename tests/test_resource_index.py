@@ -0,0 +1,35 @@
+import pytest
+
+from utilities.resource_index import ResourceIndex, lattice_point
+from utilities.prefetch_resources import missing_files
+
+def write_resource(tmp_path, kind, fn):
+    (tmp_path / kind).mkdir(exist_ok=True)
+    (tmp_path / kind / fn).write_text('')
+
+def test_sites_reuse_files_on_disk_within_the_tolerance(tmp_path):
+    # Downloaded before the lattice, named after its site
+    write_resource(tmp_path, 'solar', '45.013_-94.007_2012.csv')
+    index = ResourceIndex(str(tmp_path) + '/', 'solar', tolerance_km=2.0)
+    assert index.snap(45.02, -94.0, 2012).endswith('solar/45.013_-94.007_2012.csv')
+    # Further than the tolerance gets a new file for its lattice cell
+    assert index.snap(45.1, -94.0, 2012).endswith('solar/45.120_-94.000_2012.csv')
+    assert index.nearest(45.1, -94.0, 2013) is None
+
+@pytest.mark.parametrize('spacing_deg', [0.04, 0.02])
+def test_new_files_are_shared_by_sites_in_one_lattice_cell(tmp_path, spacing_deg):
+    fp = str(tmp_path) + '/'
+    lat, lon = lattice_point(45.0, -94.0, spacing_deg)
+    # No tolerance, so only the lattice decides which file a site gets
+    first = ResourceIndex(fp, 'wind', tolerance_km=0, spacing_deg=spacing_deg)
+    second = ResourceIndex(fp, 'wind', tolerance_km=0, spacing_deg=spacing_deg)
+    assert first.snap(lat + 0.3*spacing_deg, lon, 2012) == second.snap(lat - 0.3*spacing_deg, lon, 2012)
+    assert first.snap(lat, lon + spacing_deg, 2012) != first.snap(lat, lon, 2012)
+
+def test_missing_files_are_requested_for_the_point_they_are_named_after(tmp_path):
+    fp = str(tmp_path) + '/'
+    write_resource(tmp_path, 'solar', '45.013_-94.007_2012.csv')
+    missing = missing_files([(45.004, -94.003, 2012, 100.0), (44.997, -93.996, 2012, 100.0)], fp)
+    # Solar is on disk already, both sites share one new wind file
+    assert list(missing) == [('wind', fp + 'wind/45.000_-94.000_2012.csv')]
+    assert missing[('wind', fp + 'wind/45.000_-94.000_2012.csv')] == (45.0, -94.0, 2012, 100.0)
@@ -0,0 +1,16 @@
+import pytest
+
+pd = pytest.importorskip('pandas')
+pytest.importorskip('pyarrow')
+
+from utilities.results_store import ResultsStore, load_results
+
+def test_rows_are_written_every_few_sites(tmp_path):
+    store = ResultsStore(tmp_path, flush_every=2)
+    assert store.append({'id': 'a'}) == []
+    assert [row['id'] for row in store.append({'id': 'b'})] == ['a', 'b']
+    assert load_results(tmp_path)['id'].tolist() == ['a', 'b']
+
+def test_rows_are_written_once_the_oldest_is_flush_seconds_old(tmp_path):
+    store = ResultsStore(tmp_path, flush_every=50, flush_seconds=0)
+    assert [row['id'] for row in store.append({'id': 'a'})] == ['a']
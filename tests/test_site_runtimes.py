@@ -0,0 +1,23 @@
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+from utilities.site_runtimes import order_longest_first, save_runtimes
+from utilities.sweep_spec import SweepSpec
+
+def test_slowest_and_unrecorded_sites_go_first(tmp_path):
+    spec = SweepSpec({'ore': ['Hibbing Taconite', 'United Taconite'], 'tech': ['h2_dri', 'h2_dri_eaf']})
+    runtime_fp = tmp_path/'output'/'site_runtimes.csv'
+    s_list = range(len(spec))
+    assert order_longest_first(s_list, spec, runtime_fp) is s_list
+    ids = [spec.scenario(gid)['id'] for gid in s_list]
+    save_runtimes({ids[0]: 10.0, ids[1]: 30.0, ids[2]: 20.0}, runtime_fp)
+    assert order_longest_first(s_list, spec, runtime_fp) == [3, 1, 2, 0]
+
+def test_newest_runtimes_replace_old_ones(tmp_path):
+    runtime_fp = tmp_path/'site_runtimes.csv'
+    save_runtimes({'a': 10.0, 'b': 20.0}, runtime_fp)
+    save_runtimes({}, runtime_fp)
+    save_runtimes({'b': 5.0, 'c': 1.0}, runtime_fp)
+    runtimes = pd.read_csv(runtime_fp, index_col=0)['runtime_s']
+    assert runtimes.to_dict() == {'a': 10.0, 'b': 5.0, 'c': 1.0}
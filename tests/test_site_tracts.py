@@ -0,0 +1,12 @@
+import pytest
+
+pd = pytest.importorskip('pandas')
+pytest.importorskip('shapely')
+
+from utilities.site_tracts import add_tract_columns, tract_columns
+
+def test_empty_sites_get_tract_columns_without_loading_tracts():
+    sites = pd.DataFrame(columns=['id', 'latitude', 'longitude', 'lcoh'])
+    tagged = add_tract_columns(sites, buffer_km=10)
+    assert len(tagged) == 0
+    assert list(tagged.columns) == list(sites.columns) + tract_columns(10)
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+pd = pytest.importorskip('pandas')
+pytest.importorskip('sklearn')
+
+from utilities.surrogate import SurrogateModel, most_uncertain
+
+ORE_OFFSETS = {'Hibbing Taconite': 0.0, 'United Taconite': 0.3}
+
+# Smooth synthetic LCOH and LCOI over a Minnesota-sized box of sites
+def synthetic_results(n, rng):
+    sites = pd.DataFrame({'latitude': rng.uniform(44.0, 48.0, n),
+                          'longitude': rng.uniform(-96.0, -90.0, n),
+                          'ore': rng.choice(list(ORE_OFFSETS), n),
+                          'tech': 'h2_dri'})
+    offsets = sites['ore'].map(ORE_OFFSETS)
+    sites['lcoh'] = 4.0 + np.sin(sites['latitude']) + 0.5*np.cos(sites['longitude']/2) + offsets
+    sites['lcoi'] = 400.0 + 50.0*np.sin(sites['latitude']/2) + 100.0*offsets
+    return sites
+
+def test_predictions_fall_within_their_stated_uncertainty():
+    rng = np.random.default_rng(0)
+    model = SurrogateModel().fit(synthetic_results(80, rng))
+    test = synthetic_results(50, rng)
+    predictions = model.predict(test)
+    for target in ['lcoh', 'lcoi']:
+        err = np.abs(predictions[target] - test[target])
+        assert (err <= 1.96*predictions[target+'_std']).mean() >= 0.9
+        assert err.mean() < 0.02*test[target].abs().mean()
+
+def test_sites_far_from_the_fit_are_the_most_uncertain():
+    rng = np.random.default_rng(1)
+    model = SurrogateModel().fit(synthetic_results(60, rng))
+    test = synthetic_results(20, rng)
+    far = pd.DataFrame({'latitude': [60.0], 'longitude': [-120.0], 'ore': ['Hibbing Taconite'], 'tech': ['h2_dri']},
+                       index=['far'])
+    predictions = model.predict(pd.concat([test, far]))
+    assert list(most_uncertain(predictions, 1)) == ['far']
@@ -0,0 +1,17 @@
+import json
+import traceback
+
+from utilities.sweep_ledger import SweepLedger
+
+def test_failures_from_workers_are_recorded_from_their_traceback(tmp_path):
+    try:
+        raise ValueError("no resource")
+    except ValueError:
+        trace = traceback.format_exc()
+    ledger = SweepLedger(tmp_path)
+    ledger.record_failure('a', trace)
+    with open(ledger.fp) as ledger_file:
+        entry = json.loads(ledger_file.readline())
+    assert entry['status'] == 'failed'
+    assert entry['error'] == 'ValueError: no resource'
+    assert entry['traceback'] == trace
@@ -0,0 +1,28 @@
+import pytest
+
+pytest.importorskip('pandas')
+
+from utilities.sweep_spec import SweepSpec
+from conftest import ROOT_DIR
+
+SWEEP_FP = ROOT_DIR/"example_plant/input/multiprocess/sweep.yaml"
+
+def test_lazy_scenarios_match_the_full_expansion():
+    spec = SweepSpec.from_yaml(SWEEP_FP)
+    expanded = list(spec)
+    assert len(expanded) == len(spec)
+    assert [spec.scenario(i) for i in range(len(spec))] == expanded
+    assert len({scenario['id'] for scenario in expanded}) == len(spec)
+
+def test_expansion_order_and_ids_are_stable():
+    spec = SweepSpec({'location': [{'latitude': 45.0, 'longitude': -90.0}, {'latitude': 46.0, 'longitude': -91.0}],
+                      'ore': ['Hibbing Taconite', 'United Taconite'],
+                      'tech': ['h2_dri', 'h2_dri_eaf']})
+    # The last axis varies fastest
+    assert [(s['latitude'], s['ore'], s['tech']) for s in spec][:3] == [(45.0, 'Hibbing Taconite', 'h2_dri'),
+                                                                        (45.0, 'Hibbing Taconite', 'h2_dri_eaf'),
+                                                                        (45.0, 'United Taconite', 'h2_dri')]
+    assert [s['id'] for s in spec] == [s['id'] for s in SweepSpec(spec.axes)]
+    # IDs come from the parameters, so adding values to an axis doesn't change existing scenarios' IDs
+    grown = SweepSpec({**spec.axes, 'ore': spec.axes['ore'] + [{'ore': 'Northshore Taconite'}]})
+    assert {s['id'] for s in spec} < {s['id'] for s in grown}
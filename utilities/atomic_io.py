@@ -0,0 +1,34 @@
+import os
+import threading
+from contextlib import contextmanager
+
+'''
+Atomic file writes
+
+Files that another rank, worker or later run may read while they are being written - resource files,
+the results store, caches and indexes - are written to a hidden temp file next to their destination
+and renamed over it in one step, so readers only ever see the old file or the whole new one.
+'''
+
+# Temp path next to fp, unique to this process and thread, for writers that take a filepath
+# It is renamed over fp when the block finishes and removed if the block raises
+@contextmanager
+def atomic_path(fp):
+    fp = str(fp)
+    directory = os.path.dirname(fp)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_fp = os.path.join(directory, '.{}.{}.{}.tmp'.format(os.path.basename(fp), os.getpid(), threading.get_ident()))
+    try:
+        yield tmp_fp
+    except BaseException:
+        if os.path.exists(tmp_fp):
+            os.remove(tmp_fp)
+        raise
+    os.replace(tmp_fp, fp)
+
+# Write bytes or text to fp atomically
+def write_atomic(fp, content):
+    with atomic_path(fp) as tmp_fp:
+        with open(tmp_fp, 'wb' if isinstance(content, bytes) else 'w') as tmp_file:
+            tmp_file.write(content)
@@ -0,0 +1,147 @@
+import os
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from utilities.atomic_io import atomic_path
+
+'''
+Loader for the CEJST census tract shapefile in webtool/usa
+
+The shapefile has ~74k tracts and over a hundred indicator fields with two-letter names, which are
+mapped to readable names with webtool/usa/columns.csv. Only the requested fields are read, and a
+bounding box can be given to only read the tracts that overlap it.
+
+The first load converts the shapefile to GeoParquet next to it. Tracts are sorted along a Hilbert
+curve and each one's bounding box is stored with it, so later bounding box reads skip whole row
+groups. Tracts are read straight from the shapefile when there is no cache, using the bounding
+box of each record, found through the offsets in the .shx, to only read the tracts needed.
+'''
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+SHP_FP = ROOT_DIR/"webtool/usa/usa.shp"
+COLUMNS_FP = ROOT_DIR/"webtool/usa/columns.csv"
+
+# Tract ID field, which isn't listed in columns.csv - named as in webtool/1.0-codebook.csv
+TRACT_ID = 'GEOID10'
+TRACT_ID_NAME = 'Census tract 2010 ID'
+
+BBOX_COLUMNS = ['minx', 'miny', 'maxx', 'maxy']
+
+# Small row groups so bounding box filters can skip most of the file
+ROW_GROUP_SIZE = 2048
+
+# Shapefile field name -> readable name
+def column_names(columns_fp=COLUMNS_FP):
+    columns = pd.read_csv(columns_fp)
+    names = dict(zip(columns['shapefile_column'], columns['column_name']))
+    names.pop('geometry', None)
+    names[TRACT_ID] = TRACT_ID_NAME
+    return names
+
+# Shapefile field names for columns given by either field name or readable name
+def resolve_columns(columns, names):
+    fields = {name: field for field, name in names.items()}
+    resolved = []
+    for column in columns:
+        if column in names:
+            resolved.append(column)
+        elif column in fields:
+            resolved.append(fields[column])
+        else:
+            raise KeyError("{} is not a CEJST tract column".format(column))
+    return resolved
+
+def cache_fp_for(shp_fp):
+    return os.path.splitext(str(shp_fp))[0] + '.parquet'
+
+def record_bboxes(shp_fp):
+    """Bounding box of every record in a polygon shapefile, read through the offsets in its .shx
+
+    Returns an (n records, 4) array of minx, miny, maxx, maxy, NaN for null shapes
+    """
+    shx = np.fromfile(os.path.splitext(str(shp_fp))[0] + '.shx', dtype='>i4', offset=100)
+    # Offsets are in 16-bit words and point at the 8-byte record header
+    offsets = shx[0::2].astype(np.int64)*2 + 8
+    shp = np.memmap(shp_fp, dtype=np.uint8, mode='r')
+    shape_types = shp[offsets[:, None] + np.arange(4)].copy().view('<i4').ravel()
+    # Null shapes have no bounding box, and one at the end of the file would be read past its end
+    bbox_bytes = np.minimum(offsets[:, None] + 4 + np.arange(32), len(shp) - 1)
+    bboxes = shp[bbox_bytes].copy().view('<f8').reshape(-1, 4)
+    bboxes[shape_types == 0] = np.nan
+    return bboxes
+
+# Records whose bounding box overlaps bbox = (minx, miny, maxx, maxy)
+def bbox_overlaps(bboxes, bbox):
+    return ((bboxes[:, 0] <= bbox[2]) & (bboxes[:, 2] >= bbox[0]) &
+            (bboxes[:, 1] <= bbox[3]) & (bboxes[:, 3] >= bbox[1]))
+
+def shapefile_fields(shp_fp):
+    import pyogrio
+    return list(pyogrio.read_info(str(shp_fp))['fields'])
+
+def read_shapefile(shp_fp=SHP_FP, fields=None, bbox=None):
+    """Read fields of the tracts overlapping bbox straight from the shapefile, all fields if None"""
+    import geopandas as gpd
+    if bbox is None:
+        return gpd.read_file(shp_fp, columns=fields, engine='pyogrio')
+    fids = np.flatnonzero(bbox_overlaps(record_bboxes(shp_fp), bbox))
+    return gpd.read_file(shp_fp, columns=fields, fids=fids, engine='pyogrio')
+
+def build_cache(shp_fp=SHP_FP, cache_fp=None, columns_fp=COLUMNS_FP):
+    """Convert the mapped fields of the shapefile to spatially sorted GeoParquet"""
+    cache_fp = cache_fp_for(shp_fp) if cache_fp is None else cache_fp
+    names = column_names(columns_fp)
+    fields = [field for field in shapefile_fields(shp_fp) if field in names]
+    tracts = read_shapefile(shp_fp, fields)
+    tracts[BBOX_COLUMNS] = tracts.geometry.bounds.to_numpy()
+    tracts = tracts.iloc[np.argsort(tracts.geometry.hilbert_distance().to_numpy(), kind='stable')]
+    tracts = tracts.reset_index(drop=True)
+    # A half-written cache is never read
+    with atomic_path(cache_fp) as tmp_fp:
+        tracts.to_parquet(tmp_fp, row_group_size=ROW_GROUP_SIZE)
+    return cache_fp
+
+# A cache without its shapefile is still used, e.g. when only the GeoParquet is shipped
+def cache_is_fresh(shp_fp, cache_fp):
+    if not os.path.exists(cache_fp):
+        return False
+    return not os.path.exists(shp_fp) or os.path.getmtime(cache_fp) >= os.path.getmtime(shp_fp)
+
+def tracts_available(shp_fp=SHP_FP, cache_fp=None):
+    """True if the tracts can be loaded - the shapefile or its GeoParquet cache is on disk"""
+    cache_fp = cache_fp_for(shp_fp) if cache_fp is None else cache_fp
+    return os.path.exists(shp_fp) or os.path.exists(cache_fp)
+
+def load_tracts(columns=None, bbox=None, shp_fp=SHP_FP, cache_fp=None, columns_fp=COLUMNS_FP,
+                use_cache=True, readable_names=True):
+    """CEJST tracts with the given columns, overlapping bbox = (min lon, min lat, max lon, max lat)
+
+    Columns can be given by shapefile field name or readable name, all mapped columns if None. The
+    tract ID is always included.
+    """
+    import geopandas as gpd
+    names = column_names(columns_fp)
+    fields = None
+    if columns is not None:
+        fields = [TRACT_ID] + [f for f in resolve_columns(columns, names) if f != TRACT_ID]
+
+    cache_fp = cache_fp_for(shp_fp) if cache_fp is None else cache_fp
+    if use_cache:
+        if not cache_is_fresh(shp_fp, cache_fp):
+            build_cache(shp_fp, cache_fp, columns_fp)
+        filters = None
+        if bbox is not None:
+            filters = [('minx', '<=', bbox[2]), ('maxx', '>=', bbox[0]),
+                       ('miny', '<=', bbox[3]), ('maxy', '>=', bbox[1])]
+        tracts = gpd.read_parquet(cache_fp, columns=None if fields is None else fields + ['geometry'],
+                                  filters=filters)
+        tracts = tracts.drop(columns=[c for c in BBOX_COLUMNS if c in tracts.columns])
+    else:
+        if fields is None:
+            fields = [field for field in shapefile_fields(shp_fp) if field in names]
+        tracts = read_shapefile(shp_fp, fields, bbox)
+
+    if readable_names:
+        tracts = tracts.rename(columns=names)
+    return tracts
@@ -0,0 +1,145 @@
+import os
+import sys
+import pickle
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from utilities.ghg_accounting import site_carbon_intensity
+from utilities.resource_archive import WEATHER_DIR
+from utilities.results_store import load_results
+from utilities.logger import main_logger as main_log
+from utilities.atomic_io import atomic_path
+
+'''
+Compiles sweep results into one indexed table
+
+Pre-ProFAST LCOHs are pickled one per location under lcoh/<lat>_<lon>_... in the output folders.
+The folders are scanned once with os.scandir and new files are loaded in parallel and validated.
+A manifest of the files already compiled is kept next to the table, so later updates only read
+files that are new or changed.
+
+Scenario results come from the sweep's ResultsStore, one row per scenario id, so scenarios that
+share a location, ore and tech but differ in other parameters stay separate rows. Their GHG uses
+each site's resource statistics, so the resource year and hub height of the sweep are needed.
+
+The table is written as uncompressed Feather so it can be memory-mapped.
+'''
+
+COLUMNS = ['id', 'latitude', 'longitude', 'ore', 'tech', 'lcoe', 'lcoh', 'lcoi', 'ghg_total']
+INDEX = ['latitude', 'longitude']
+
+# Every output file under a folder, with its modification time
+def scan_files(folder):
+    for entry in os.scandir(folder):
+        if entry.is_dir(follow_symlinks=False):
+            yield from scan_files(entry.path)
+        elif entry.is_file():
+            yield entry.path, entry.stat().st_mtime
+
+# Latitude and longitude of a pre-ProFAST LCOH file from its name - None if it isn't one
+def classify(fp):
+    parts = os.path.splitext(os.path.basename(fp))[0].split('_')
+    if os.path.basename(os.path.dirname(fp)) == 'lcoh' and len(parts) >= 2:
+        return parts[0], parts[1]
+    return None
+
+def load_file(args):
+    """Read and validate one pre-ProFAST LCOH file - returns (row, None) or (None, error message)"""
+    fp, mtime = args
+    try:
+        lat, lon = (float(part) for part in classify(fp))
+        with open(fp, 'rb') as reader:
+            value = float(np.squeeze(pickle.load(reader)))
+    except Exception as e:
+        return None, "{}: {}".format(fp, e)
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None, "{}: lat/lon {}, {} out of range".format(fp, lat, lon)
+    if not np.isfinite(value):
+        return None, "{}: lcoh is not finite".format(fp)
+    return {'latitude': lat, 'longitude': lon, 'lcoh': value}, None
+
+def manifest_fp(table_fp):
+    return str(table_fp) + '.manifest.feather'
+
+def load_compiled(table_fp):
+    if not os.path.exists(table_fp):
+        return pd.DataFrame(columns=COLUMNS)
+    return pd.read_feather(table_fp, memory_map=True)
+
+def scenario_results(store_dir, year, hub_height, weather_dir=WEATHER_DIR):
+    """Latest row of each scenario id in a results store, with its GHG"""
+    results = load_results(store_dir)
+    if len(results) == 0:
+        return pd.DataFrame(columns=COLUMNS)
+    results = site_carbon_intensity(results.drop_duplicates('id', keep='last'), year, hub_height, weather_dir)
+    return results.reindex(columns=COLUMNS).sort_values('id').reset_index(drop=True)
+
+# Readers never memory-map a half-written table
+def write_feather(df, fp):
+    with atomic_path(fp) as tmp_fp:
+        df.to_feather(tmp_fp, compression='uncompressed')
+
+def compile_results(folders, table_fp, store_dir=None, year=None, hub_height=None, weather_dir=WEATHER_DIR,
+                    max_workers=None, chunksize=256):
+    """Add new or changed pre-ProFAST files under folders, and the scenarios in the results store at
+    store_dir, to the table at table_fp and return the table
+
+    Scenarios need the sweep's resource year and hub height to find their sites' resource statistics
+    """
+    if store_dir is not None and (year is None or hub_height is None):
+        raise ValueError("compiling a results store needs the resource year and hub height")
+    if isinstance(folders, (str, os.PathLike)):
+        folders = [folders]
+    table = load_compiled(table_fp)
+    if os.path.exists(manifest_fp(table_fp)):
+        manifest = pd.read_feather(manifest_fp(table_fp))
+    else:
+        manifest = pd.DataFrame(columns=['source_file', 'mtime'])
+    # Tables compiled before rows were keyed on scenario id are rebuilt from scratch
+    if 'id' not in table:
+        table = pd.DataFrame(columns=COLUMNS)
+        manifest = manifest.iloc[:0]
+    compiled = dict(zip(manifest['source_file'], manifest['mtime']))
+
+    new_files = [(fp, mtime) for folder in folders if os.path.isdir(folder)
+                 for fp, mtime in scan_files(folder)
+                 if compiled.get(fp) != mtime and classify(fp) is not None]
+    if len(new_files) == 0 and store_dir is None:
+        return table
+
+    # Pre-ProFAST rows have no scenario id, ore or tech
+    locations = table[table['id'].isna()]
+    scenarios = table[table['id'].notna()]
+    loaded = []
+    if len(new_files) > 0:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            loaded = list(pool.map(load_file, new_files, chunksize=chunksize))
+        rows = [row for row, error in loaded if row is not None]
+        errors = [error for row, error in loaded if error is not None]
+        for error in errors:
+            main_log.warning("skipped output file {}".format(error))
+        main_log.info("compiled {} new output files, {} failed validation".format(len(rows), len(errors)))
+        # Newer files replace the LCOH of their location
+        locations = pd.concat([locations, pd.DataFrame(rows, columns=COLUMNS)], ignore_index=True)
+        locations = locations.drop_duplicates(INDEX, keep='last')
+    # The store is read whole, so its scenarios replace any compiled before
+    if store_dir is not None:
+        scenarios = scenario_results(store_dir, year, hub_height, weather_dir)
+        main_log.info("compiled {} scenarios from {}".format(len(scenarios), store_dir))
+
+    table = pd.concat([locations.sort_values(INDEX), scenarios], ignore_index=True)[COLUMNS]
+    os.makedirs(os.path.dirname(os.path.abspath(table_fp)), exist_ok=True)
+    write_feather(table, table_fp)
+    # Files that failed validation stay out of the manifest so they are retried next time
+    loaded_files = [fp_mtime for fp_mtime, (row, error) in zip(new_files, loaded) if row is not None]
+    manifest = manifest[~manifest['source_file'].isin([fp for fp, mtime in loaded_files])]
+    manifest = pd.concat([manifest, pd.DataFrame(loaded_files, columns=['source_file', 'mtime'])],
+                         ignore_index=True)
+    write_feather(manifest, manifest_fp(table_fp))
+    return table
+
+
+if __name__ == "__main__":
+    # python compile_results.py <table> <store dir> <resource year> <hub height> <output folder>...
+    print(compile_results(sys.argv[5:], sys.argv[1], sys.argv[2], int(sys.argv[3]), float(sys.argv[4])))
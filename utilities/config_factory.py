@@ -0,0 +1,106 @@
+import math
+import copy
+
+'''
+Parses the GreenHEART input YAMLs once per process and hands out per-site config variants
+GreenHEART is only imported when the first factory is built
+
+Each variant gets its own copies of the HOPP, GreenHEART, turbine and FLORIS configs, since GreenHEART
+writes to them during a simulation. Only the template's other attributes are shared.
+'''
+
+# Where sweep parameters from a sweep spec or sitelist template go in the GreenHEART config, and
+# the factor to convert them from the template's units - parameters named like an entry of
+# finance_parameters set that entry, any others aren't config values
+PARAM_PATHS = {'inflation': (('finance_parameters', 'costing_general_inflation'), 0.01),
+               'slag_disposal_cost': (('iron', 'costs', 'feedstocks', 'slag_disposal_unitcost'), 1)}
+
+# Factories already built by this process, keyed by their input files and settings
+config_factories = {}
+
+class ConfigFactory:
+
+    def __init__(self, filename_hopp_config, filename_greenheart_config, filename_turbine_config,
+                 filename_floris_config, **config_kwargs):
+        from greenheart.simulation.greenheart_simulation import GreenHeartSimulationConfig
+
+        self.template = GreenHeartSimulationConfig(
+            filename_hopp_config,
+            filename_greenheart_config,
+            filename_turbine_config,
+            filename_floris_config,
+            **config_kwargs,
+        )
+
+    def variant(self, location=None, ore=None, tech=None, resource_dir=None, params=None, **overrides):
+        """Config for one site - location is (lat, lon), params are sweep parameters listed in PARAM_PATHS,
+        other keyword arguments set config attributes"""
+        config = copy.copy(self.template)
+        config.hopp_config = copy.deepcopy(self.template.hopp_config)
+        config.greenheart_config = copy.deepcopy(self.template.greenheart_config)
+        config.turbine_config = copy.deepcopy(self.template.turbine_config)
+        config.floris_config = copy.deepcopy(self.template.floris_config)
+
+        if location is not None:
+            config.hopp_config["site"]["data"]["lat"] = location[0]
+            config.hopp_config["site"]["data"]["lon"] = location[1]
+        if resource_dir is not None:
+            config.greenheart_config["site"]["resource_dir"] = resource_dir
+        if "iron" in config.greenheart_config:
+            if ore is not None:
+                config.greenheart_config["iron"]["ore_type"] = ore
+            if tech is not None:
+                config.greenheart_config["iron"]["technology"] = tech
+        for name, value in (params or {}).items():
+            set_param(config.greenheart_config, name, value)
+        for name, value in overrides.items():
+            setattr(config, name, value)
+
+        return config
+
+# Blank cells of a sitelist template are read as NaN
+def is_blank(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+# Set a sweep parameter in a GreenHEART config, skipping it if the config has no section for it
+# Blank values keep the template's default
+def set_param(greenheart_config, name, value):
+    if is_blank(value):
+        return
+    if name in greenheart_config.get('finance_parameters', {}) and name not in PARAM_PATHS:
+        greenheart_config['finance_parameters'][name] = value
+        return
+    if name not in PARAM_PATHS:
+        return
+    path, factor = PARAM_PATHS[name]
+    section = greenheart_config
+    for key in path[:-1]:
+        if key not in section:
+            return
+        section = section[key]
+    section[path[-1]] = value*factor
+
+# Whether set_param would set a sweep parameter in a GreenHEART config rather than skip it
+def has_param(greenheart_config, name):
+    if name not in PARAM_PATHS:
+        return name in greenheart_config.get('finance_parameters', {})
+    section = greenheart_config
+    for key in PARAM_PATHS[name][0][:-1]:
+        if key not in section:
+            return False
+        section = section[key]
+    return True
+
+# Sweep parameters that set_param would silently skip for a GreenHEART config
+def unknown_params(greenheart_config, names):
+    return sorted(name for name in names if not has_param(greenheart_config, name))
+
+# Build a factory the first time it is asked for, then reuse it for the rest of the process
+def get_config_factory(filename_hopp_config, filename_greenheart_config, filename_turbine_config,
+                       filename_floris_config, **config_kwargs):
+    key = (filename_hopp_config, filename_greenheart_config, filename_turbine_config, filename_floris_config,
+           tuple(sorted(config_kwargs.items())))
+    if key not in config_factories:
+        config_factories[key] = ConfigFactory(filename_hopp_config, filename_greenheart_config,
+                                              filename_turbine_config, filename_floris_config, **config_kwargs)
+    return config_factories[key]
@@ -1,7 +1,4 @@
 import os
-import time
-import numpy as np
-from mpi4py import MPI
 
 from hopp.simulation.technologies.resource import (
     SolarResource,
@@ -9,24 +6,62 @@ from hopp.simulation.technologies.resource import (
 )
 from hopp.utilities.keys import set_nrel_key_dot_env
 
-rank = MPI.COMM_WORLD.Get_rank()
+from utilities.resource_index import ResourceIndex
+from utilities.resource_archive import ResourceArchive, parse_resource_fn
+from utilities.atomic_io import atomic_path
+
 set_nrel_key_dot_env() 
 
+# Indices of resource files on disk, built the first time each resource directory is used
+resource_indices = {}
+
+# Resource archives under resource directories, opened the first time each directory is used - None if it has none
+resource_archives = {}
+
+# HPCResource whose loaded chunk of sites is handed to GreenHEART in memory instead of resource files
+hpc_resource = None
+
+def use_hpc_resource(resource):
+    global hpc_resource
+    hpc_resource = resource
+
 def download_site_resources(config,fp):
 
     lat = config.hopp_config["site"]["data"]["lat"]
     lon = config.hopp_config["site"]["data"]["lon"]
     year = config.hopp_config['site']['data']['year']
+
+    if hpc_resource is not None and (lat,lon,year) in hpc_resource:
+        hpc_resource.set_config_resources(config,lat,lon)
+        return
     
-    solar_fp = fp+'solar/{:.3f}_{:.3f}_{:d}.csv'.format(lat,lon,year)
-    wind_fp = fp+'wind/{:.3f}_{:.3f}_{:d}.csv'.format(lat,lon,year)
+    # Use a file already on disk near this site, or else its lattice cell's file, downloaded for the cell's center
+    if fp not in resource_indices:
+        resource_indices[fp] = {kind: ResourceIndex(fp,kind) for kind in ['solar','wind']}
+    solar_fp = resource_indices[fp]['solar'].snap(lat,lon,year)
+    wind_fp = resource_indices[fp]['wind'].snap(lat,lon,year)
+
+    # Serve the site from the memory-mapped archive when it holds both snapped files
+    if fp not in resource_archives:
+        archive_dir = fp+'archive/'
+        resource_archives[fp] = ResourceArchive(archive_dir) if os.path.exists(archive_dir+'index.csv') else None
+    archive = resource_archives[fp]
+    solar_site = parse_resource_fn(solar_fp)
+    wind_site = parse_resource_fn(wind_fp)
+    if archive is not None and solar_site in archive and wind_site in archive:
+        archive.set_config_resources(config,solar_site,wind_site)
+        return
+
+    config.hopp_config['site']['solar_resource_file'] = solar_fp
+    config.hopp_config['site']['wind_resource_file'] = wind_fp
     
-    # Only download the file if it does not already exist
-    # Sleep <rank> seconds to avoid API timeouts when multiprocessing
+    # Only download the file if it does not already exist - normally prefetch_resources has already
+    # fetched it, so this is a fallback for sites that weren't prefetched
+    # Downloaded atomically so other ranks or workers never read a partial file
     if not os.path.exists(solar_fp):
-        time.sleep(rank*4)
-        SolarResource(lat, lon, year, filepath=solar_fp)
+        with atomic_path(solar_fp) as tmp_fp:
+            SolarResource(*solar_site[:2], year, filepath=tmp_fp)
     if not os.path.exists(wind_fp):
-        time.sleep(rank*4+2)
-        WindResource(lat, lon, year, filepath=wind_fp,
-                wind_turbine_hub_ht=config.turbine_config['hub_height'])
\ No newline at end of file
+        with atomic_path(wind_fp) as tmp_fp:
+            WindResource(*wind_site[:2], year, filepath=tmp_fp,
+                    wind_turbine_hub_ht=config.turbine_config['hub_height'])
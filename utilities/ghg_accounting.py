@@ -0,0 +1,105 @@
+import numpy as np
+
+from utilities.load_library_inputs import get_cost_library
+from utilities.sweep_spec import override_values
+from utilities.resource_screen import load_resource_stats, add_resource_columns
+from utilities.resource_archive import WEATHER_DIR
+from utilities.logger import main_logger as main_log
+
+'''
+Sweep-level GHG accounting using the data_library/lca placeholders
+
+Carbon intensity of every scenario in a results table is computed in one vectorized pass by
+joining the ore and technology GHG factors with each scenario's hydrogen and electricity
+carbon intensities, so no extra GreenHEART runs are needed.
+
+Electricity carbon intensity is the override in a scenario's elec_ci column where it has one, or
+else the lifecycle emissions of its site's renewable plant spread over the generation its wind and
+solar capacity factors give. Hydrogen carbon intensity is the h2_ci override, or else the
+electricity carbon intensity times the electrolyzer's consumption.
+'''
+
+# Technology names in the sitelists and the names used in tech_ghg.csv
+TECH_GHG_NAMES = {'blast_furnace': 'Blast Furnace',
+                  'ng_dri': 'Gas DRI',
+                  'ng_dri_eaf': 'Gas DRI',
+                  'h2_dri': 'H2 DRI',
+                  'h2_dri_eaf': 'H2 DRI',
+                  'moe': 'MOE'}
+
+# Feedstock consumption per kg hot Fe from the iron section of greenheart_config.yaml
+ORE_CONSUMPTION = 1.62927 # kg ore
+H2_CONSUMPTION = 0.06596 # kg H2
+ELEC_CONSUMPTION = 0.5502 # kWh
+
+# Lifecycle emissions of the wind and solar plants per kW installed - placeholders giving about
+# 12 g CO2e/kWh for wind at a 35% capacity factor and 40 g CO2e/kWh for PV at 20%
+WIND_EMBODIED = 920.0 # kg CO2e/kW
+SOLAR_EMBODIED = 1750.0 # kg CO2e/kW
+PLANT_LIFE = 25 # years
+
+ELECTROLYZER_CONSUMPTION = 55.0 # kWh/kg H2
+
+# Sum the selected stages of a GHG table for each name, raising KeyError for names not in the table
+def stage_factors(ghg_df, names, stages, kind):
+    missing = sorted(set(names) - set(ghg_df.index))
+    if len(missing) > 0:
+        raise KeyError("{}s missing from the LCA library: {}".format(kind, ', '.join(map(str, missing))))
+    columns = [c for c in ghg_df.columns if any(c.startswith('Stage {:d} '.format(s)) for s in stages)]
+    totals = ghg_df[columns].sum(axis=1, min_count=len(columns))
+    return totals.reindex(names).to_numpy(dtype=float)
+
+def site_elec_ci(results):
+    """Lifecycle electricity carbon intensity [kg CO2e/kWh] of each row's site from its wind_cf and
+    solar_cf columns, using the better resource - NaN where neither is known"""
+    cis = []
+    for column, embodied in [('wind_cf', WIND_EMBODIED), ('solar_cf', SOLAR_EMBODIED)]:
+        cf = results[column].to_numpy(dtype=float) if column in results else np.full(len(results), np.nan)
+        with np.errstate(divide='ignore'):
+            cis.append(np.where(cf > 0, embodied/(cf*8760*PLANT_LIFE), np.nan))
+    return np.fmin(*cis)
+
+def carbon_intensity(results, library=None, stages=[1,2,3],
+                     ore_consumption=ORE_CONSUMPTION, h2_consumption=H2_CONSUMPTION,
+                     elec_consumption=ELEC_CONSUMPTION, electrolyzer_consumption=ELECTROLYZER_CONSUMPTION):
+    """Add GHG columns [kg CO2e/kg hot Fe] to a results table with 'ore' and 'tech' columns
+
+    Columns added are h2_ci_used, elec_ci_used, ghg_ore, ghg_tech, ghg_h2, ghg_elec, and ghg_total.
+    Per-site carbon intensities need the resource statistics columns wind_cf and solar_cf.
+    Raises KeyError for ores or techs missing from the LCA library
+    """
+    if library is None:
+        library = get_cost_library()
+    results = results.copy()
+    if len(results) == 0:
+        return results
+
+    techs = results['tech'].map(lambda t: TECH_GHG_NAMES.get(t, t))
+    ore_factor = stage_factors(library.ore_ghg, results['ore'], stages, 'ore')
+    tech_factor = stage_factors(library.tech_ghg, techs, stages, 'tech')
+    elec_cis = override_values(results, 'elec_ci')
+    elec_cis = np.where(np.isnan(elec_cis), site_elec_ci(results), elec_cis)
+    h2_cis = override_values(results, 'h2_ci')
+    h2_cis = np.where(np.isnan(h2_cis), elec_cis*electrolyzer_consumption, h2_cis)
+
+    results['h2_ci_used'] = h2_cis
+    results['elec_ci_used'] = elec_cis
+    results['ghg_ore'] = ore_factor*ore_consumption
+    results['ghg_tech'] = tech_factor
+    results['ghg_h2'] = h2_cis*h2_consumption
+    results['ghg_elec'] = elec_cis*elec_consumption
+    results['ghg_total'] = results[['ghg_ore','ghg_tech','ghg_h2','ghg_elec']].sum(axis=1, min_count=4)
+
+    n_missing = int(results['ghg_total'].isna().sum())
+    if n_missing > 0:
+        main_log.warning("{} of {} scenarios have no resource statistics or carbon intensity overrides".format(
+            n_missing, len(results)))
+
+    return results
+
+def site_carbon_intensity(results, year, hub_height, weather_dir=WEATHER_DIR, library=None):
+    """carbon_intensity of a results table with each site's resource statistics joined on first"""
+    if len(results) > 0:
+        locations = results[['latitude', 'longitude']].drop_duplicates(ignore_index=True)
+        results = add_resource_columns(results, load_resource_stats(locations, year, hub_height, weather_dir))
+    return carbon_intensity(results, library)
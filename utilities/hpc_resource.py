@@ -0,0 +1,210 @@
+import os
+import numpy as np
+from scipy.spatial import cKDTree
+
+from utilities.resource_index import to_xyz
+from utilities.resource_archive import site_key, memory_resource
+from utilities.prefetch_resources import wind_heights
+
+'''
+Reads solar and wind resource straight from the NSRDB and WTK .h5 files on the HPC
+
+A whole chunk of sites is mapped to dataset gids at once through a KD-tree over the dataset's
+coordinates. Each variable is then read for the whole chunk in a few contiguous hyperslabs of
+nearby gids instead of one API file per site. The data is kept in memory in the formats of HOPP's
+SolarResource and WindResource, like ResourceArchive, and handed to the simulation without
+writing resource files.
+
+Files are laid out like the HPC datasets: {source path}/nsrdb_{year}.h5 and wtk_conus_{year}.h5
+each hold a 'meta' table with the latitude and longitude of every gid (or a 'coordinates' dataset),
+a 'time_index' of UTC timestamps, and one (time, gid) dataset per variable, stored as integers
+with a scale factor attribute.
+'''
+
+FILE_PATTERNS = {'solar': 'nsrdb_{year}.h5',
+                 'wind': 'wtk_conus_{year}.h5'}
+
+# Attributes holding the factor the stored integers were scaled by
+SCALE_ATTRS = ['psm_scale_factor', 'scale_factor']
+
+# NSRDB datasets and the keys HOPP's SolarResource uses for them
+SOLAR_DATASETS = {'ghi': 'gh',
+                  'dhi': 'df',
+                  'dni': 'dn',
+                  'wind_speed': 'wspd',
+                  'air_temperature': 'tdry',
+                  'surface_pressure': 'pres',
+                  'dew_point': 'tdew'}
+
+# WTK dataset prefixes in SAM's wind resource field order - temperature, pressure, speed, direction
+WIND_DATASETS = ['temperature', 'pressure', 'windspeed', 'winddirection']
+
+PA_PER_ATM = 101325.0
+
+# Unneeded gids read through between two needed ones to keep a hyperslab contiguous
+MAX_GAP = 64
+
+def scale_factor(dataset):
+    for attr in SCALE_ATTRS:
+        if attr in dataset.attrs:
+            return float(dataset.attrs[attr])
+    return 1.0
+
+def read_columns(dataset, gids, step=1, max_gap=MAX_GAP):
+    """Columns gids of a (time, gid) dataset, every step-th row, unscaled to float32
+
+    gids must be sorted and unique - runs of gids no more than max_gap apart are read as one hyperslab
+    """
+    breaks = np.flatnonzero(np.diff(gids) > max_gap + 1) + 1
+    blocks = []
+    for run in np.split(gids, breaks):
+        slab = dataset[::step, run[0]:run[-1]+1]
+        blocks.append(slab[:, run - run[0]])
+    return np.concatenate(blocks, axis=1).astype(np.float32)/np.float32(scale_factor(dataset))
+
+# Hourly UTC timestamps of a dataset file and the step between them in its time index
+def hourly_times(h5):
+    time_index = h5['time_index'][...]
+    times = np.array(time_index.astype('U19'), dtype='datetime64[m]')
+    year_start = times[0].astype('datetime64[Y]')
+    hours_in_year = ((year_start + 1).astype('datetime64[h]') - year_start.astype('datetime64[h]')).astype(int)
+    step = max(len(times)//hours_in_year, 1)
+    return times[::step], step
+
+# Calendar columns of SolarResource data, without Feb 29 like the NSRDB API with leap_day=false
+def calendar(times):
+    months = times.astype('datetime64[M]')
+    days = times.astype('datetime64[D]')
+    columns = {'year': times.astype('datetime64[Y]').astype(int) + 1970,
+               'month': months.astype(int) % 12 + 1,
+               'day': (days - months.astype('datetime64[D]')).astype(int) + 1,
+               'hour': (times - days.astype('datetime64[m]')).astype(int)//60,
+               'minute': (times - times.astype('datetime64[h]').astype('datetime64[m]')).astype(int)}
+    keep = ~((columns['month'] == 2) & (columns['day'] == 29))
+    return {name: column[keep].astype(np.float32) for name, column in columns.items()}, keep
+
+# Roll each site's UTC columns to local standard time, like the NSRDB API with utc=false
+def to_local(data, timezones):
+    local = np.empty_like(data)
+    for j, tz in enumerate(np.asarray(timezones, dtype=int)):
+        local[:, j] = np.roll(data[:, j], tz)
+    return local
+
+class HPCResource:
+
+    def __init__(self, nsrdb_source_path, wtk_source_path, year, hub_height, max_gap=MAX_GAP):
+        self.fps = {'solar': os.path.join(nsrdb_source_path, FILE_PATTERNS['solar'].format(year=year)),
+                    'wind': os.path.join(wtk_source_path, FILE_PATTERNS['wind'].format(year=year))}
+        self.year = year
+        self.hub_height = hub_height
+        self.heights = wind_heights(hub_height)
+        self.max_gap = max_gap
+        self.trees = {}
+        self.meta = {}
+        self.sites = {}
+
+    @classmethod
+    def from_config(cls, input_config, year, hub_height):
+        """Reader for the datasets at hpc_resource_info in a sweep input config like multiprocess/example.yaml"""
+        info = input_config['hpc_resource_info']
+        return cls(info['nsrdb_source_path'], info['wtk_source_path'], year, hub_height)
+
+    # KD-tree over a dataset's gids, built the first time it is used
+    def tree(self, kind, h5):
+        if kind not in self.trees:
+            if 'coordinates' in h5:
+                coordinates = h5['coordinates'][...]
+                lats, lons = coordinates[:, 0], coordinates[:, 1]
+                self.meta[kind] = None
+            else:
+                meta = h5['meta'][...]
+                lats, lons = meta['latitude'], meta['longitude']
+                self.meta[kind] = meta
+            self.trees[kind] = cKDTree(to_xyz(lats, lons))
+        return self.trees[kind]
+
+    def gids(self, kind, h5, lats, lons):
+        """Gid of the dataset's closest grid point to each site"""
+        _, gids = self.tree(kind, h5).query(to_xyz(lats, lons))
+        return gids
+
+    def meta_field(self, kind, field, gids, default=0.0):
+        meta = self.meta[kind]
+        if meta is None or field not in meta.dtype.names:
+            return np.full(len(gids), default)
+        return meta[field][gids].astype(float)
+
+    def read_solar(self, h5, lats, lons):
+        gids, inverse = np.unique(self.gids('solar', h5, lats, lons), return_inverse=True)
+        inverse = np.ravel(inverse)
+        times, step = hourly_times(h5)
+        columns, keep = calendar(times)
+        timezones = self.meta_field('solar', 'timezone', gids)
+        elevations = self.meta_field('solar', 'elevation', gids)
+        variables = {key: to_local(read_columns(h5[name], gids, step, self.max_gap), timezones)[keep]
+                     for name, key in SOLAR_DATASETS.items() if name in h5}
+        sites = []
+        for lat, lon, j in zip(lats, lons, inverse):
+            data = {**columns, **{key: values[:, j] for key, values in variables.items()}}
+            data.update({'lat': lat,
+                         'lon': lon,
+                         'tz': timezones[j],
+                         'elev': elevations[j]})
+            sites.append(data)
+        return sites
+
+    def read_wind(self, h5, lats, lons):
+        gids, inverse = np.unique(self.gids('wind', h5, lats, lons), return_inverse=True)
+        inverse = np.ravel(inverse)
+        times, step = hourly_times(h5)
+        _, keep = calendar(times)
+        timezones = self.meta_field('wind', 'timezone', gids)
+        # Pressure is only stored at a few heights, so each height uses the closest one
+        pressure_heights = [int(name[len('pressure_'):-1]) for name in h5 if name.startswith('pressure_')]
+        blocks = []
+        heights = []
+        fields = []
+        for height in self.heights:
+            for field, prefix in enumerate(WIND_DATASETS, start=1):
+                dataset_height = height
+                if prefix == 'pressure':
+                    dataset_height = min(pressure_heights, key=lambda h: abs(h - height))
+                values = read_columns(h5['{}_{}m'.format(prefix, dataset_height)], gids, step, self.max_gap)
+                if prefix == 'pressure':
+                    values = values/np.float32(PA_PER_ATM)
+                blocks.append(to_local(values, timezones)[keep])
+                heights.append(height)
+                fields.append(field)
+        # Hours by column by gid, so each site's block is one slice
+        data = np.stack(blocks, axis=1)
+        return [{'heights': heights, 'fields': fields, 'data': data[:, :, j]} for j in inverse]
+
+    def load(self, lats, lons):
+        """Read the solar and wind resource of a chunk of sites into memory, replacing the last chunk"""
+        import h5py
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        with h5py.File(self.fps['solar'], 'r') as h5:
+            solar = self.read_solar(h5, lats, lons)
+        with h5py.File(self.fps['wind'], 'r') as h5:
+            wind = self.read_wind(h5, lats, lons)
+        self.sites = {site_key(lat, lon, self.year): (solar_data, wind_data)
+                      for lat, lon, solar_data, wind_data in zip(lats, lons, solar, wind)}
+
+    def __contains__(self, site):
+        return site_key(*site) in self.sites
+
+    def solar_data(self, lat, lon):
+        return self.sites[site_key(lat, lon, self.year)][0]
+
+    def wind_data(self, lat, lon):
+        return self.sites[site_key(lat, lon, self.year)][1]
+
+    # Hand a loaded site's resource to GreenHEART through the HOPP config in place of resource files
+    def set_config_resources(self, config, lat, lon):
+        from hopp.simulation.technologies.resource import SolarResource, WindResource
+        site = config.hopp_config['site']
+        site['solar_resource'] = memory_resource(SolarResource, lat, lon, self.year, self.solar_data(lat, lon))
+        site['wind_resource'] = memory_resource(WindResource, lat, lon, self.year, self.wind_data(lat, lon),
+                                                hub_height_meters=self.hub_height)
+        return config
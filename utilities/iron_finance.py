@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+from utilities.load_library_inputs import get_cost_library
+from utilities.ghg_accounting import ORE_CONSUMPTION, H2_CONSUMPTION, ELEC_CONSUMPTION
+from utilities.sweep_spec import override_mask, override_values
+from utilities.results_store import output_key
+
+'''
+Levelized cost of iron for scenarios with fixed hydrogen and electricity costs
+
+Scenarios from a sitelist template or sweep spec can set their own H2 cost and carbon intensity
+("overwrite GreenHEART H2?") and electricity cost and carbon intensity ("overwrite HOPP elec?").
+With the H2 cost fixed, neither HOPP nor the electrolyzer model is needed, so the iron costs of a
+whole table of those scenarios are worked out here in one pass from the data_library/tea costs.
+'''
+
+# Iron plant capacity factor from the iron section of greenheart_config.yaml
+CAPACITY_FACTOR = 0.9
+
+# Finance inputs for the fixed-cost iron model from a GreenHEART config
+def finance_inputs(greenheart_config):
+    return {'discount_rate': greenheart_config['finance_parameters']['discount_rate'],
+            'lifetime': greenheart_config['project_parameters']['project_lifetime'],
+            'cost_year': greenheart_config['project_parameters']['cost_year'],
+            'elec_cost': greenheart_config['project_parameters']['ppa_price']}
+
+def capital_recovery_factor(discount_rate, lifetime):
+    growth = (1 + discount_rate)**lifetime
+    return discount_rate*growth/(growth - 1)
+
+def fixed_cost_lcoi(scenarios, library=None, discount_rate=0.0948, lifetime=30, cost_year=2021,
+                    elec_cost=0.025, capacity_factor=CAPACITY_FACTOR):
+    """Levelized cost of iron [$/tonne hot Fe] from each scenario's 'h2_cost' [$/kg]
+
+    The iron plant buys electricity at the scenario's 'elec_cost' [$/kWh] where it is overridden,
+    at elec_cost otherwise. NaN for ores or techs missing from the cost library.
+    """
+    if library is None:
+        library = get_cost_library()
+    ores = scenarios['ore'].to_numpy()
+    techs = scenarios['tech'].to_numpy()
+    known = np.isin(ores, library.ore_cost.index) & np.isin(techs, library.tech_capex.index)
+    ore_costs = np.full(len(scenarios), np.nan)
+    capexes = np.full(len(scenarios), np.nan)
+    if known.any():
+        ore_costs[known] = library.ore_costs(ores[known], cost_year)
+        # CAPEX is per million tonnes per year of capacity
+        capexes[known] = library.tech_capexes(techs[known], cost_year)/1e6
+
+    elec_costs = override_values(scenarios, 'elec_cost')
+    elec_costs = np.where(np.isnan(elec_costs), elec_cost, elec_costs)
+    h2_costs = pd.to_numeric(scenarios['h2_cost'], errors='coerce').to_numpy(dtype=float)
+
+    return (capexes*capital_recovery_factor(discount_rate, lifetime)/capacity_factor
+            + ore_costs*ORE_CONSUMPTION
+            + h2_costs*H2_CONSUMPTION*1000
+            + elec_costs*ELEC_CONSUMPTION*1000)
+
+# Why each scenario can't be worked out here, None for those that can - unknown ores or techs would give
+# NaN costs, and a fixed electricity cost without a fixed H2 cost needs HOPP skipped inside GreenHEART
+def fixed_cost_errors(scenarios, library=None):
+    if library is None:
+        library = get_cost_library()
+    errors = pd.Series([None]*len(scenarios), index=scenarios.index, dtype=object)
+    elec_only = override_mask(scenarios, 'overwrite_elec') & ~override_mask(scenarios, 'overwrite_h2')
+    errors[elec_only] = ("a fixed electricity cost without a fixed H2 cost isn't supported - GreenHEART "
+                         "would still run HOPP and ignore it")
+    fixed_h2 = override_mask(scenarios, 'overwrite_h2')
+    unknown_ore = fixed_h2 & ~scenarios['ore'].isin(library.ore_cost.index).to_numpy()
+    unknown_tech = fixed_h2 & ~scenarios['tech'].isin(library.tech_capex.index).to_numpy()
+    errors[unknown_ore] = ["ore {!r} is not in the cost library".format(ore) for ore in scenarios['ore'][unknown_ore]]
+    errors[unknown_tech] = ["tech {!r} is not in the cost library".format(tech)
+                            for tech in scenarios['tech'][unknown_tech]]
+    return errors
+
+def fixed_cost_results(scenarios, library=None, elec_cost=0.025, **finance_kwargs):
+    """lcoe [$/MWh], lcoh [$/kg] and lcoi_fixed_cost [$/tonne] of the scenarios with their H2 cost overridden
+
+    lcoe is the electricity price the iron plant pays - the scenario's where it is overridden, elec_cost
+    otherwise. The iron cost comes from the placeholder TEA costs rather than GreenHEART's iron model, so it
+    goes in its own column instead of lcoi.
+    """
+    scenarios = scenarios[override_mask(scenarios, 'overwrite_h2')]
+    elec_costs = override_values(scenarios, 'elec_cost')
+    return pd.DataFrame({'lcoe': np.where(np.isnan(elec_costs), elec_cost, elec_costs)*1000,
+                         'lcoh': override_values(scenarios, 'h2_cost'),
+                         'lcoi_fixed_cost': fixed_cost_lcoi(scenarios, library, elec_cost=elec_cost,
+                                                            **finance_kwargs)},
+                        index=scenarios.index)
+
+def fixed_cost_rows(scenarios, library=None, **finance_kwargs):
+    """Results store rows for the scenarios of a sweep sitelist that have their H2 cost overridden, and the
+    errors of scenarios that can't be run by ID - see fixed_cost_errors"""
+    if library is None:
+        library = get_cost_library()
+    errors = fixed_cost_errors(scenarios, library)
+    failed = errors.dropna()
+    scenarios = scenarios.drop(failed.index)
+    fixed = fixed_cost_results(scenarios, library, **finance_kwargs)
+    rows = scenarios.loc[fixed.index].join(fixed).reset_index().to_dict('records')
+    for row in rows:
+        row['key'] = output_key(row['id'], row['ore'], row['tech'], (row['latitude'], row['longitude']))
+    return rows, failed.to_dict()
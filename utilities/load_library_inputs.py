@@ -1,41 +1,106 @@
 import os
+import numpy as np
 import pandas as pd
 
 '''
 Loads iron electrowinning cost inputs from library files into config object
 '''
 
-def load_ore_cost(config, filepath):
-    
-    # Read cost csv into dataframe
-    ore_df = pd.read_csv(filepath,index_col=0)
+LIBRARY_DIR = str(os.path.abspath(os.path.dirname(__file__)))+"/../data_library/"
+ORE_COST_FP = LIBRARY_DIR+"tea/placeholders/ore_cost.csv"
+TECH_CAPEX_FP = LIBRARY_DIR+"tea/placeholders/tech_capex.csv"
+
+# Cost libraries already loaded by this process, keyed by the cost files they were loaded from
+cost_libraries = {}
+
+# Ratio of index values between every pair of years - ratios[i,j] escalates year i dollars to year j
+def ratio_matrix(index_df, column):
+    years = index_df.index.to_numpy()
+    values = index_df[column].to_numpy(dtype=float)
+    return years, values[np.newaxis,:]/values[:,np.newaxis]
+
+class CostLibrary:
+    """All data_library/tea and data_library/lca tables, loaded once
+
+    Escalated costs are looked up for whole vectors of scenarios at a time
+    """
+
+    def __init__(self, ore_cost_fp=ORE_COST_FP, tech_capex_fp=TECH_CAPEX_FP, library_dir=LIBRARY_DIR):
+        self.ore_cost = pd.read_csv(ore_cost_fp,index_col=0)
+        self.tech_capex = pd.read_csv(tech_capex_fp,index_col=0)
+        self.ore_ghg = pd.read_csv(library_dir+"lca/placeholders/ore_ghg.csv",index_col=0)
+        self.tech_ghg = pd.read_csv(library_dir+"lca/placeholders/tech_ghg.csv",index_col=0)
+        self.cpi = pd.read_csv(library_dir+"tea/inflation/cpi.csv",index_col=0)
+        self.cepci = pd.read_csv(library_dir+"tea/inflation/cepci.csv",index_col=0)
+        self.ratios = {'CPI': ratio_matrix(self.cpi,'CPI'),
+                       'CEPCI': ratio_matrix(self.cepci,'CEPCI')}
+
+    # Positions of each name in a table's index, raising KeyError for any that aren't in it
+    @staticmethod
+    def positions(df, names):
+        idxs = df.index.get_indexer(np.atleast_1d(names))
+        if (idxs < 0).any():
+            missing = np.atleast_1d(names)[idxs < 0]
+            raise KeyError("{} not found in library table".format(sorted(set(missing))))
+        return idxs
+
+    def escalation(self, index, dollar_years, cost_years):
+        """CPI or CEPCI ratios that escalate dollar_years dollars to cost_years dollars"""
+        years, ratios = self.ratios[index]
+        from_idxs = np.searchsorted(years, dollar_years)
+        to_idxs = np.searchsorted(years, cost_years)
+        for year_idxs, req_years in [(from_idxs, dollar_years), (to_idxs, cost_years)]:
+            req_years = np.atleast_1d(req_years)
+            found = (year_idxs < len(years)) & (years[np.minimum(year_idxs, len(years)-1)] == req_years)
+            if not found.all():
+                raise KeyError("{} years {} not found in library".format(index, sorted(set(req_years[~found]))))
+        return ratios[from_idxs,to_idxs]
+
+    def ore_costs(self, ores, cost_years):
+        """Ore prices [$/tonne] escalated with CPI to cost_years"""
+        idxs = self.positions(self.ore_cost, ores)
+        prices = self.ore_cost['Price [$/tonne]'].to_numpy(dtype=float)[idxs]
+        dollar_years = self.ore_cost['$ year'].to_numpy()[idxs]
+        return prices*self.escalation('CPI', dollar_years, cost_years)
+
+    def tech_capexes(self, techs, cost_years):
+        """Technology CAPEX [$/MTPY] escalated with CEPCI to cost_years"""
+        idxs = self.positions(self.tech_capex, techs)
+        capexes = self.tech_capex['CAPEX [$/MTPY]'].to_numpy(dtype=float)[idxs]
+        dollar_years = self.tech_capex['$ year'].to_numpy()[idxs]
+        return capexes*self.escalation('CEPCI', dollar_years, cost_years)
+
+# Load the library the first time it is asked for, then reuse it for the rest of the process
+def get_cost_library(ore_cost_fp=ORE_COST_FP, tech_capex_fp=TECH_CAPEX_FP):
+    key = (os.path.abspath(ore_cost_fp), os.path.abspath(tech_capex_fp))
+    if key not in cost_libraries:
+        cost_libraries[key] = CostLibrary(ore_cost_fp, tech_capex_fp)
+    return cost_libraries[key]
+
+# Load the library on rank 0 only and broadcast it, so every rank shares one read of the files
+def broadcast_cost_library(comm, ore_cost_fp=ORE_COST_FP, tech_capex_fp=TECH_CAPEX_FP):
+    library = get_cost_library(ore_cost_fp, tech_capex_fp) if comm.Get_rank() == 0 else None
+    library = comm.bcast(library, root=0)
+    cost_libraries[(os.path.abspath(ore_cost_fp), os.path.abspath(tech_capex_fp))] = library
+    return library
+
+def load_ore_cost(config, filepath=ORE_COST_FP):
+
+    # Look up ore cost inflated with CPI
     ore_type = config.greenheart_config['iron']['ore_type']
-    ore_cost = ore_df.loc[ore_type,'Price [$/tonne]']
-    
-    # Inflate with CPI
-    cd = str(os.path.abspath(os.path.dirname(__file__)))
-    cpi_df = pd.read_csv(cd+"/../data_library/tea/inflation/cpi.csv",index_col=0)
-    dollar_year = ore_df.loc[ore_type,'$ year']
     cost_year = config.greenheart_config['project_parameters']['cost_year']
-    ratio = cpi_df.loc[cost_year,'CPI']/cpi_df.loc[dollar_year,'CPI']
-    config.greenheart_config['iron']['costs']['feedstocks']['iron_ore_pellet_unitcost'] = ore_cost*ratio
+    ore_cost = get_cost_library(ore_cost_fp=filepath).ore_costs([ore_type], [cost_year])[0]
+    config.greenheart_config['iron']['costs']['feedstocks']['iron_ore_pellet_unitcost'] = ore_cost
 
 
     return config
 
-def load_tech_capex(config, filepath):
+def load_tech_capex(config, filepath=TECH_CAPEX_FP):
 
-    # Read csv into dataframe and write to config
-    capex_df = pd.read_csv(filepath,index_col=0)
+    # Look up tech capex inflated with CEPCI and write to config
     tech = config.greenheart_config['iron']['technology']
-    tech_capex = capex_df.loc[tech,'CAPEX [$/MTPY]']
-
-    # Inflate with CEPCI
-    cd = str(os.path.abspath(os.path.dirname(__file__)))
-    cepci_df = pd.read_csv(cd+"/../data_library/tea/inflation/cepci.csv",index_col=0)
-    dollar_year = capex_df.loc[tech,'$ year']
     cost_year = config.greenheart_config['project_parameters']['cost_year']
-    ratio = cepci_df.loc[cost_year,'CEPCI']/cepci_df.loc[dollar_year,'CEPCI']
-    config.greenheart_config['iron']['costs']['capex_misc'] = tech_capex*ratio
+    tech_capex = get_cost_library(tech_capex_fp=filepath).tech_capexes([tech], [cost_year])[0]
+    config.greenheart_config['iron']['costs']['capex_misc'] = tech_capex
 
-    return config
\ No newline at end of file
+    return config
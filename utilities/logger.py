@@ -4,12 +4,19 @@ Copied from NED-toolbox/utilities/logger to power run_example_plants_mpi.py
 
 import sys
 import os
+import copy
+import glob
+import json
+import time
+import queue
 import logging
+import logging.handlers
 from datetime import datetime
 from pathlib import Path
 
 ROOT_DIR = Path(__file__).resolve().parent.parent
-LOG_DIR = os.path.join(str(ROOT_DIR),"dbg_log")
+# NED_LOG_DIR moves the logs out of the repo, e.g. for tests
+LOG_DIR = os.environ.get("NED_LOG_DIR",os.path.join(str(ROOT_DIR),"dbg_log"))
 if not os.path.isdir(LOG_DIR):
     os.makedirs(LOG_DIR,exist_ok=True)
 
@@ -20,12 +27,13 @@ fname_log = os.path.join(LOG_DIR,"ned_debug--{}_{}.log".format(log_description,t
 logging_level = logging.INFO
 formatter = logging.Formatter('%(asctime)s %(name)-12s: %(levelname)-8s %(message)s',datefmt='%m/%d/%Y %I:%M:%S %p')
 
+# Handlers only open the shared log file on the first record, so ranks that switch to
+# setup_rank_logging never touch it
 logging.basicConfig(level=logging_level,
                             datefmt='%m/%d/%Y %I:%M:%S %p',
-                            filename=fname_log,
-                            filemode='a')
+                            handlers=[logging.FileHandler(fname_log,mode='a',delay=True)])
 
-handler = logging.FileHandler(fname_log)
+handler = logging.FileHandler(fname_log,delay=True)
 handler.setFormatter(formatter)
 
 mpi_logger = logging.getLogger("MPI_LOGGER")
@@ -44,4 +52,122 @@ main_logger.setLevel(logging_level)
 main_logger.addHandler(handler)
 logging.getLogger("MAIN").propagate = False
 # toolbox_logger = logging.getLogger('NedSim')
-# toolbox_logger.addHandler(handler)
\ No newline at end of file
+# toolbox_logger.addHandler(handler)
+
+rank_listener = None
+
+# One JSON object per line with the rank, site id (if passed as extra={"site_id": ...}) and elapsed time
+class JsonFormatter(logging.Formatter):
+
+    def __init__(self, rank, start):
+        super().__init__()
+        self.rank = rank
+        self.start = start
+
+    def format(self, record):
+        entry = {'time': record.created,
+                 'elapsed_s': round(record.created - self.start, 3),
+                 'rank': self.rank,
+                 'logger': record.name,
+                 'level': record.levelname,
+                 'site_id': getattr(record, 'site_id', None),
+                 'message': record.getMessage()}
+        if getattr(record, 'exception', None):
+            entry['exception'] = record.exception
+        elif record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+# QueueHandler.prepare drops exc_info, so the traceback is formatted into its own attribute first
+# instead of being folded into the message
+class TracebackQueueHandler(logging.handlers.QueueHandler):
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exception = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        record.exc_text = None
+        record.stack_info = None
+        return record
+
+def setup_rank_logging(rank, run_name=None, log_dir=LOG_DIR):
+    """Send every logger's records through a queue to a background thread writing this rank's own file
+
+    Logging calls only put the record on the queue, so file I/O never blocks the simulation
+    """
+    global rank_listener
+    if run_name is None:
+        run_name = "ned_debug--{}_{}".format(log_description,todays_date)
+    run_dir = os.path.join(log_dir,run_name)
+    os.makedirs(run_dir,exist_ok=True)
+
+    rank_handler = logging.FileHandler(os.path.join(run_dir,"rank{:05d}.jsonl".format(rank)),delay=True)
+    rank_handler.setFormatter(JsonFormatter(rank,time.time()))
+    log_queue = queue.SimpleQueue()
+    rank_listener = logging.handlers.QueueListener(log_queue,rank_handler)
+    rank_listener.start()
+
+    route_loggers(TracebackQueueHandler(log_queue))
+    return run_dir
+
+# Replace the handlers of every logger with one handler
+def route_loggers(new_handler):
+    for logger in [mpi_logger,site_logger,main_logger,logging.getLogger()]:
+        for old_handler in list(logger.handlers):
+            logger.removeHandler(old_handler)
+            old_handler.close()
+        logger.addHandler(new_handler)
+
+def start_worker_listener(context):
+    """Queue for pool workers to log through, and the listener writing its records with this process's handlers
+
+    Only the parent writes the log file, so workers' lines never interleave - stop the listener after the pool
+    """
+    log_queue = context.Queue()
+    listener = logging.handlers.QueueListener(log_queue,*main_logger.handlers)
+    listener.start()
+    return log_queue, listener
+
+# Send this worker's records to the parent's listener - call in the pool initializer
+def setup_worker_logging(log_queue):
+    route_loggers(logging.handlers.QueueHandler(log_queue))
+
+# Write out anything still queued - call before the rank exits
+# Records logged afterwards go to the shared log file again
+def stop_rank_logging():
+    global rank_listener
+    if rank_listener is not None:
+        rank_listener.stop()
+        for rank_handler in rank_listener.handlers:
+            rank_handler.close()
+        rank_listener = None
+        route_loggers(handler)
+
+# Merge every rank's log into one file ordered by time
+# Lines that aren't whole JSON entries, like the last line of a rank killed mid-write, are skipped and counted
+def merge_rank_logs(run_dir, merged_fn="merged.jsonl"):
+    entries = []
+    n_bad = 0
+    for fp in glob.glob(os.path.join(run_dir,"rank*.jsonl")):
+        with open(fp) as rank_file:
+            for line in rank_file:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                    entry['time'] = float(entry['time'])
+                except (ValueError, KeyError, TypeError):
+                    n_bad += 1
+                    continue
+                entries.append(entry)
+    if n_bad > 0:
+        main_logger.warning("skipped {} unreadable lines merging the rank logs in {}".format(n_bad,run_dir))
+    entries.sort(key=lambda entry: entry['time'])
+    merged_fp = os.path.join(run_dir,merged_fn)
+    with open(merged_fp,'w') as merged_file:
+        for entry in entries:
+            merged_file.write(json.dumps(entry)+'\n')
+    return merged_fp
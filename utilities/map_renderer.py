@@ -0,0 +1,87 @@
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.colors import Normalize
+from mpl_toolkits.axes_grid1.inset_locator import inset_axes
+from pathlib import Path
+
+from utilities.mapping import merc_x, merc_y
+
+'''
+Local static map renderer for sweep results - no network access needed
+
+Points are drawn over the boundaries in the CEJST census tract shapefile in Web Mercator. Large
+point counts are binned onto a raster grid and drawn as one image instead of one marker each.
+'''
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+BOUNDARY_FP = ROOT_DIR/"webtool/usa/usa.shp"
+
+# Points are projected with merc_x/merc_y, so boundaries go to the same spherical Web Mercator
+MAP_EPSG = 3857
+
+# Continental US extent [deg]
+CONUS_EXTENT = {'lat_min': 25, 'lat_max': 50, 'lon_min': -125, 'lon_max': -67}
+
+# Above this many points the map is rasterized unless asked otherwise
+RASTER_THRESHOLD = 100000
+
+# Boundaries in Web Mercator, dissolved to e.g. state outlines so there are fewer shapes to draw
+def load_boundaries(boundary_fp=BOUNDARY_FP, dissolve_by='SF'):
+    import geopandas as gpd
+    boundaries = gpd.read_file(boundary_fp, columns=[dissolve_by] if dissolve_by else [])
+    if dissolve_by:
+        boundaries = boundaries.dissolve(by=dissolve_by)
+    return boundaries.to_crs(epsg=MAP_EPSG)
+
+# Mean value in each cell of a grid over the map extent, NaN where there are no points
+# Returns the grid and the extent its cells cover
+def rasterize(x, y, values, extent, resolution_m):
+    x_edges = np.arange(extent[0], extent[1]+resolution_m, resolution_m)
+    y_edges = np.arange(extent[2], extent[3]+resolution_m, resolution_m)
+    sums, _, _ = np.histogram2d(x, y, bins=[x_edges, y_edges], weights=values)
+    counts, _, _ = np.histogram2d(x, y, bins=[x_edges, y_edges])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (sums/counts).T, [x_edges[0], x_edges[-1], y_edges[0], y_edges[-1]]
+
+def render_map(lats, lons, values, label='Levelized\nCost of\nHydrogen\n[$/kg]', fig_fp=None,
+               boundaries=None, extent=CONUS_EXTENT, cmap='jet', vmin=None, vmax=None,
+               raster=None, raster_resolution_m=10000, marker_size=5, dpi=92, font_size=48):
+    """Draw values at lat/lon points over boundaries with a colorbar, and save to fig_fp if given"""
+    x = merc_x(lons)
+    y = merc_y(lats)
+    map_extent = [float(merc_x(extent['lon_min'])), float(merc_x(extent['lon_max'])),
+                  float(merc_y(extent['lat_min'])), float(merc_y(extent['lat_max']))]
+    width = (map_extent[1]-map_extent[0])/1000
+    height = (map_extent[3]-map_extent[2])/1000
+    values = np.asarray(values, dtype=float)
+    norm = Normalize(vmin=np.nanmin(values) if vmin is None else vmin,
+                     vmax=np.nanmax(values) if vmax is None else vmax)
+    if raster is None:
+        raster = len(values) > RASTER_THRESHOLD
+
+    plt.rcParams['font.size'] = font_size
+    plt.rcParams['xtick.major.size'] = 10
+    fig, ax = plt.subplots(figsize=(width/dpi, height/dpi), dpi=dpi)
+    if boundaries is not None:
+        boundaries.boundary.plot(ax=ax, color='0.3', linewidth=0.5, zorder=1)
+    if raster:
+        grid, grid_extent = rasterize(x, y, values, map_extent, raster_resolution_m)
+        mappable = ax.imshow(grid, extent=grid_extent, origin='lower', cmap=cmap, norm=norm,
+                             interpolation='nearest', zorder=2)
+    else:
+        mappable = ax.scatter(x, y, c=values, cmap=cmap, norm=norm, s=marker_size,
+                              edgecolors='k', linewidths=0.2, zorder=2)
+    ax.set_xlim(map_extent[0], map_extent[1])
+    ax.set_ylim(map_extent[2], map_extent[3])
+    ax.set_xticks([])
+    ax.set_yticks([])
+
+    bbox = ax.bbox.bounds
+    cbaxes = inset_axes(ax, width="3%", height="80%", loc=7, bbox_to_anchor=(bbox[0],bbox[1],bbox[2]*.99,bbox[3]*.5))
+    fig.colorbar(mappable, cax=cbaxes, ticklocation='left')
+    cbaxes.tick_params(direction='inout', length=30, width=10)
+    cbaxes.text(-1.5, 0.5, label, transform=cbaxes.transAxes, horizontalalignment='center', verticalalignment='center')
+
+    if fig_fp is not None:
+        fig.savefig(fig_fp, bbox_inches='tight')
+    return fig, ax
@@ -0,0 +1,63 @@
+import json
+import numpy as np
+import shapely
+from shapely.geometry import shape
+from shapely.strtree import STRtree
+
+'''
+Vectorized country filtering and Web Mercator projection for maps of sweep results
+
+Country lookups use an STRtree over prepared country polygons, so whole arrays of points are
+tested at once instead of looping over every point and every polygon.
+'''
+
+R_MAJOR = 6378137.000
+
+# Spherical Web Mercator (EPSG:3857), the projection of ArcGIS basemaps (wkid 3857) and of boundaries
+# reprojected with to_crs(epsg=3857) - vectorized over numpy arrays
+def merc_x(lon):
+    return R_MAJOR*np.radians(np.asarray(lon, dtype=float))
+
+def merc_y(lat):
+    lat = np.clip(np.asarray(lat, dtype=float), -89.5, 89.5)
+    return R_MAJOR*np.log(np.tan(np.pi/4 + np.radians(lat)/2))
+
+class CountryIndex:
+
+    def __init__(self, geodata, name_key='ADMIN'):
+        features = geodata['features']
+        self.geoms = np.array([shape(f['geometry']) for f in features])
+        self.names = np.array([f['properties'][name_key] for f in features], dtype=object)
+        shapely.prepare(self.geoms)
+        self.tree = STRtree(self.geoms)
+
+    def countries(self, lats, lons):
+        """Country name of each point, 'unknown' where it isn't inside any country"""
+        points = shapely.points(np.ravel(lons), np.ravel(lats))
+        point_idxs, geom_idxs = self.tree.query(points, predicate='within')
+        names = np.full(len(points), 'unknown', dtype=object)
+        names[point_idxs] = self.names[geom_idxs]
+        return names.reshape(np.shape(lats))
+
+    def mask(self, lats, lons, country='United States of America', snap_unknown=True):
+        """True for points in the country
+
+        With snap_unknown, points outside every country (lakes, coastline) count as in the country
+        when it is the closest one
+        """
+        names = np.ravel(self.countries(lats, lons))
+        keep = names == country
+        if snap_unknown:
+            unknown = np.flatnonzero(names == 'unknown')
+            if len(unknown) > 0:
+                points = shapely.points(np.ravel(lons)[unknown], np.ravel(lats)[unknown])
+                point_idxs, geom_idxs = self.tree.query_nearest(points)
+                # Ties return more than one nearest country, keep the first for each point
+                point_idxs, first = np.unique(point_idxs, return_index=True)
+                keep[unknown[point_idxs]] = self.names[geom_idxs[first]] == country
+        return keep.reshape(np.shape(lats))
+
+def load_country_index(geodata_fp, name_key='ADMIN'):
+    with open(geodata_fp, 'r') as open_file:
+        geodata = json.load(open_file)
+    return CountryIndex(geodata, name_key)
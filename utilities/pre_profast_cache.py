@@ -0,0 +1,81 @@
+import os
+import json
+import time
+import hashlib
+
+from utilities.atomic_io import write_atomic
+
+'''
+Content-addressed cache of pre-ProFAST (pre-iron) GreenHEART results
+
+Everything upstream of the iron model only depends on location and the plant inputs, so the
+cache is keyed by a hash of those. Every ore/tech variant at a location reuses one entry.
+'''
+
+# Finance parameters used before ProFAST, to bring modeled costs to the cost year - the rest only affect
+# ProFAST, so finance variants of a site all share its cache entry
+PRE_PROFAST_FINANCE = ['costing_general_inflation', 'discount_years']
+
+# Locks older than this are assumed to be left over from a crashed run
+LOCK_TIMEOUT_S = 6*60*60
+
+# Entries of the HOPP site config that hold resources for the site's location rather than inputs - they
+# can be objects with in-memory data (see hpc_resource.py), and the location is already part of the key
+SITE_RESOURCE_KEYS = ['solar_resource', 'wind_resource', 'solar_resource_file', 'wind_resource_file']
+
+# Numpy values and paths hash as their plain values, anything else that isn't JSON is an error - a repr
+# with a memory address in it would give a new key on every call
+def json_value(value):
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    if isinstance(value, os.PathLike):
+        return os.fspath(value)
+    raise TypeError("{} in the pre-ProFAST inputs can't be hashed".format(type(value).__name__))
+
+# Hash the location-dependent inputs of the pre-ProFAST stage
+def pre_profast_key(config):
+    hopp_site = config.hopp_config['site']['data']
+    hopp = {**config.hopp_config,
+            'site': {name: value for name, value in config.hopp_config['site'].items()
+                     if name not in SITE_RESOURCE_KEYS}}
+    inputs = {'lat': hopp_site['lat'],
+              'lon': hopp_site['lon'],
+              'year': hopp_site['year'],
+              'turbine': config.turbine_config,
+              'hopp': hopp,
+              'electrolyzer': config.greenheart_config['electrolyzer'],
+              'finance': {name: config.greenheart_config['finance_parameters'].get(name)
+                          for name in PRE_PROFAST_FINANCE}}
+    inputs_str = json.dumps(inputs, sort_keys=True, default=json_value)
+    return hashlib.sha256(inputs_str.encode()).hexdigest()[:16]
+
+def cache_fn(cache_dir, key):
+    return os.path.join(str(cache_dir), key)
+
+def is_cached(cache_dir, key):
+    return os.path.exists(cache_fn(cache_dir, key) + '.done')
+
+# Try to become the one run that fills this cache entry - False if another run already is
+def claim(cache_dir, key):
+    os.makedirs(str(cache_dir), exist_ok=True)
+    lock_fp = cache_fn(cache_dir, key) + '.lock'
+    if os.path.exists(lock_fp) and (time.time() - os.path.getmtime(lock_fp)) > LOCK_TIMEOUT_S:
+        release(cache_dir, key)
+    try:
+        fd = os.open(lock_fp, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    os.write(fd, str(os.getpid()).encode())
+    os.close(fd)
+    return True
+
+def release(cache_dir, key):
+    lock_fp = cache_fn(cache_dir, key) + '.lock'
+    if os.path.exists(lock_fp):
+        os.remove(lock_fp)
+
+# Mark an entry complete once GreenHEART has finished saving it
+def mark_cached(cache_dir, key):
+    done_fp = cache_fn(cache_dir, key) + '.done'
+    write_atomic(done_fp, str(time.time()))
+    release(cache_dir, key)
@@ -0,0 +1,162 @@
+import os
+import csv
+import time
+import random
+import threading
+import urllib.parse
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from utilities.logger import main_logger as main_log
+from utilities.resource_index import ResourceIndex
+from utilities.resource_archive import parse_resource_fn
+from utilities.atomic_io import write_atomic
+
+'''
+Prefetches solar and wind resource files for a whole sitelist before any simulations run
+
+Requests are deduped by (lat, lon, year, hub height) and snapped to resource files already on disk
+within a tolerance, or else to a new file for their lattice cell, fetched for the cell's center.
+Files not already on disk are fetched through a bounded thread pool
+with a shared rate limit and retry with backoff. Files are written to a temp file and renamed,
+so a rank never reads a half-written resource file.
+'''
+
+# NREL developer API endpoints - override with base_urls to point at a stub server
+BASE_URLS = {'solar': 'https://developer.nrel.gov/api/nsrdb/v2/solar/psm3-download.csv',
+             'wind': 'https://developer.nrel.gov/api/wind-toolkit/v2/wind/wtk-srw-download'}
+
+# Hub heights available from the WTK SRW download
+WTK_HEIGHTS = [10, 40, 60, 80, 100, 120, 140, 160, 200]
+
+SOLAR_ATTRIBUTES = 'ghi,dhi,dni,wind_speed,air_temperature,solar_zenith_angle,surface_pressure,dew_point'
+
+# HTTP status codes worth retrying - rate limiting and server-side errors
+RETRY_CODES = [429, 500, 502, 503, 504]
+
+# Unique (lat, lon, year, hub height) tuples in a sitelist, rounded like the resource filenames
+def resource_requests(sites, year, hub_height):
+    requests = set()
+    for lat, lon in zip(sites['latitude'], sites['longitude']):
+        requests.add((round(float(lat),3), round(float(lon),3), int(year), float(hub_height)))
+    return sorted(requests)
+
+# WTK heights to download so HOPP can interpolate to the hub height
+def wind_heights(hub_height):
+    if hub_height in WTK_HEIGHTS:
+        return [int(hub_height)]
+    lower = max([h for h in WTK_HEIGHTS if h < hub_height], default=WTK_HEIGHTS[0])
+    upper = min([h for h in WTK_HEIGHTS if h > hub_height], default=WTK_HEIGHTS[-1])
+    return sorted(set([lower, upper]))
+
+def solar_url(lat, lon, year, base_url=BASE_URLS['solar']):
+    params = {'wkt': 'POINT({} {})'.format(lon, lat),
+              'names': year,
+              'leap_day': 'false',
+              'interval': 60,
+              'utc': 'false',
+              'email': os.getenv('NREL_API_EMAIL', ''),
+              'api_key': os.getenv('NREL_API_KEY', ''),
+              'attributes': SOLAR_ATTRIBUTES}
+    return base_url + '?' + urllib.parse.urlencode(params)
+
+def wind_url(lat, lon, year, height, base_url=BASE_URLS['wind']):
+    params = {'year': year,
+              'lat': lat,
+              'lon': lon,
+              'hubheight': height,
+              'email': os.getenv('NREL_API_EMAIL', ''),
+              'api_key': os.getenv('NREL_API_KEY', '')}
+    return base_url + '?' + urllib.parse.urlencode(params)
+
+# Shared across the pool so the total request rate stays under the API limit
+class RateLimiter:
+
+    def __init__(self, rate_per_s):
+        self.interval = 1/rate_per_s if rate_per_s else 0
+        self.next_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            wait_time = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+def fetch(url, limiter, retries=5, backoff_s=2.0, timeout_s=120):
+    for attempt in range(retries+1):
+        limiter.wait()
+        try:
+            with urllib.request.urlopen(url, timeout=timeout_s) as response:
+                return response.read()
+        except urllib.error.HTTPError as e:
+            if e.code not in RETRY_CODES or attempt == retries:
+                raise
+        except urllib.error.URLError:
+            if attempt == retries:
+                raise
+        time.sleep(backoff_s*2**attempt*(1+random.random()))
+
+# Combine SRW files at different heights into one, the same way HOPP does for in-between hub heights
+def combine_srw(contents):
+    tables = [list(csv.reader(c.decode().splitlines())) for c in contents]
+    combined = tables[0][:2]
+    for i in range(2, len(tables[0])):
+        row = []
+        for table in tables:
+            row.extend(table[i])
+        combined.append(row)
+    lines = [','.join(row) for row in combined]
+    return ('\n'.join(lines)+'\n').encode()
+
+def prefetch_file(kind, request, resource_fp, limiter, base_urls, retries, backoff_s):
+    lat, lon, year, hub_height = request
+    if kind == 'solar':
+        content = fetch(solar_url(lat, lon, year, base_urls['solar']), limiter, retries, backoff_s)
+    else:
+        contents = [fetch(wind_url(lat, lon, year, h, base_urls['wind']), limiter, retries, backoff_s)
+                    for h in wind_heights(hub_height)]
+        content = contents[0] if len(contents) == 1 else combine_srw(contents)
+    write_atomic(resource_fp, content)
+
+# Resource files that need downloading, with the request for the point each file is named after
+# tolerance_km and spacing_deg are per kind, None for ResourceIndex's defaults
+def missing_files(requests, fp, tolerance_km=None, spacing_deg=None):
+    missing = {}
+    for kind in ['solar', 'wind']:
+        index = ResourceIndex(fp, kind, None if tolerance_km is None else tolerance_km[kind],
+                              None if spacing_deg is None else spacing_deg[kind])
+        for lat, lon, year, hub_height in requests:
+            resource_fp = index.snap(lat, lon, year)
+            if not os.path.exists(resource_fp) and (kind, resource_fp) not in missing:
+                file_lat, file_lon, _ = parse_resource_fn(resource_fp)
+                missing[(kind, resource_fp)] = (file_lat, file_lon, year, hub_height)
+    return missing
+
+def prefetch_resources(sites, fp, year, hub_height, max_workers=4, rate_per_s=1.0,
+                       base_urls=BASE_URLS, retries=5, backoff_s=2.0, tolerance_km=None, spacing_deg=None):
+    """Download every missing resource file for a sitelist
+
+    Returns a list of (lat, lon, year, hub height) requests that still failed after retrying
+    """
+    requests = resource_requests(sites, year, hub_height)
+    missing = missing_files(requests, fp, tolerance_km, spacing_deg)
+    limiter = RateLimiter(rate_per_s)
+    failed = []
+    n_fetched = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(prefetch_file, kind, request, resource_fp, limiter, base_urls, retries, backoff_s):
+                   request for (kind, resource_fp), request in missing.items()}
+        for future in as_completed(futures):
+            try:
+                future.result()
+                n_fetched += 1
+            except Exception as e:
+                main_log.warning("prefetch failed for {}: {}".format(futures[future], e))
+                failed.append(futures[future])
+    main_log.info("prefetched {} resource files for {} locations, {} failed".format(
+        n_fetched, len(requests), len(failed)))
+    return sorted(set(failed))
@@ -0,0 +1,165 @@
+import os
+import time
+import heapq
+import cProfile
+import importlib
+import functools
+import resource
+from contextlib import contextmanager
+import pandas as pd
+
+'''
+Opt-in per-stage timing and memory instrumentation for sweeps
+
+Wrap each phase of a site's run in stage(<name>) and the whole run in site(<site id>). Nothing is
+recorded unless enable_profiling has been called, so the wrappers cost next to nothing otherwise.
+Steps inside a library call that can't be wrapped directly are timed with time_calls, which
+replaces the library's module functions with timed ones.
+'''
+
+enabled = False
+records = []
+current_site = None
+
+# Keep cProfile dumps for this many of the slowest sites - 0 for no dumps
+n_profile_dumps = 0
+profile_dir = None
+# Min-heap of (site time, dump filepath) for the dumps kept so far
+profile_dumps = []
+
+# (module, function) pairs already replaced by time_calls
+timed_functions = set()
+
+def enable_profiling(n_dumps=0, dump_dir=None):
+    global enabled, n_profile_dumps, profile_dir
+    enabled = True
+    n_profile_dumps = n_dumps
+    profile_dir = dump_dir
+    if n_dumps > 0:
+        os.makedirs(str(dump_dir), exist_ok=True)
+
+# Peak RSS of this process so far [MB] - ru_maxrss is in kB on Linux
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+
+# Current RSS of this process [MB], falls back to the peak where /proc isn't available
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1])*os.sysconf('SC_PAGE_SIZE')/1024**2
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+# Stages outside site() are recorded for the site id passed, if any
+@contextmanager
+def stage(name, site_id=None):
+    if not enabled:
+        yield
+        return
+    start_rss = rss_mb()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        records.append({'site_id': current_site if site_id is None else site_id,
+                        'stage': name,
+                        'time_s': time.perf_counter() - start,
+                        'rss_delta_mb': rss_mb() - start_rss,
+                        'peak_rss_mb': peak_rss_mb()})
+
+@contextmanager
+def site(site_id):
+    """Time a whole site run as the 'site_total' stage, cProfiling it if dumps are on"""
+    global current_site
+    if not enabled:
+        yield
+        return
+    current_site = site_id
+    profiler = cProfile.Profile() if n_profile_dumps > 0 else None
+    start = time.perf_counter()
+    try:
+        with stage('site_total'):
+            if profiler is not None:
+                profiler.enable()
+            try:
+                yield
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+    finally:
+        if profiler is not None:
+            keep_profile(profiler, site_id, time.perf_counter() - start)
+        current_site = None
+
+def timed(function, name):
+    @functools.wraps(function)
+    def timed_function(*args, **kwargs):
+        with stage(name):
+            return function(*args, **kwargs)
+    return timed_function
+
+def time_calls(stages):
+    """Record every call of some module functions as its own stage, returning the stage names timed
+
+    stages maps module names to {function name: stage name}. Only calls made through the module
+    attribute are timed, and modules or functions that don't exist are skipped.
+    """
+    if not enabled:
+        return []
+    timed_stages = []
+    for module_name, functions in stages.items():
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError:
+            continue
+        for function_name, name in functions.items():
+            if not callable(getattr(module, function_name, None)):
+                continue
+            if (module_name, function_name) not in timed_functions:
+                setattr(module, function_name, timed(getattr(module, function_name), name))
+                timed_functions.add((module_name, function_name))
+            timed_stages.append(name)
+    return timed_stages
+
+# Only keep dumps for the slowest sites seen so far
+def keep_profile(profiler, site_id, site_time):
+    if len(profile_dumps) >= n_profile_dumps and site_time <= profile_dumps[0][0]:
+        return
+    fp = os.path.join(str(profile_dir), 'site_{}_pid{}.prof'.format(site_id, os.getpid()))
+    profiler.dump_stats(fp)
+    heapq.heappush(profile_dumps, (site_time, fp))
+    if len(profile_dumps) > n_profile_dumps:
+        _, old_fp = heapq.heappop(profile_dumps)
+        if os.path.exists(old_fp):
+            os.remove(old_fp)
+
+def stage_records():
+    return pd.DataFrame(records, columns=['site_id','stage','time_s','rss_delta_mb','peak_rss_mb'])
+
+# p50/p95 time and memory of each stage across all sites
+def stage_summary(stage_df):
+    grouped = stage_df.groupby('stage')
+    return pd.DataFrame({'n': grouped['time_s'].count(),
+                         'total_s': grouped['time_s'].sum(),
+                         'p50_s': grouped['time_s'].quantile(0.5),
+                         'p95_s': grouped['time_s'].quantile(0.95),
+                         'max_s': grouped['time_s'].max(),
+                         'p95_rss_delta_mb': grouped['rss_delta_mb'].quantile(0.95),
+                         'max_peak_rss_mb': grouped['peak_rss_mb'].max()}).sort_values('total_s', ascending=False)
+
+# Gather every rank's records to rank 0 - returns the combined records on rank 0, None elsewhere
+def gather_records(comm):
+    all_records = comm.gather(records, root=0)
+    if all_records is None:
+        return None
+    return pd.DataFrame([r for rank_records in all_records for r in rank_records],
+                        columns=['site_id','stage','time_s','rss_delta_mb','peak_rss_mb'])
+
+# Keep only the slowest n dumps across every rank
+def prune_profile_dumps(comm):
+    kept = comm.gather(profile_dumps, root=0)
+    if kept is not None:
+        kept = sorted([d for rank_dumps in kept for d in rank_dumps], reverse=True)
+        for _, fp in kept[n_profile_dumps:]:
+            if os.path.exists(fp):
+                os.remove(fp)
@@ -0,0 +1,180 @@
+import os
+import sys
+import glob
+import json
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from utilities.atomic_io import atomic_path, write_atomic
+
+'''
+Packs the per-site weather CSVs into one memory-mapped archive and loads them back without parsing
+
+The archive is a directory holding:
+    solar.npy - float32 array, one 8760 x n_fields block per site
+    wind.npy - float32 array, one 8760 x n_columns block per site
+    index.csv - lat, lon, year, block row, and site metadata for each site
+    header.json - solar and wind column layouts shared by every block
+
+download_site_resources serves archived sites to GreenHEART as in-memory HOPP resources.
+'''
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+WEATHER_DIR = str(ROOT_DIR/"data_library/weather")+"/"
+
+N_HOURS = 8760
+
+# PSM3 column names and the keys HOPP's SolarResource uses for them
+SOLAR_KEYS = {'Year': 'year',
+              'Month': 'month',
+              'Day': 'day',
+              'Hour': 'hour',
+              'Minute': 'minute',
+              'GHI': 'gh',
+              'DHI': 'df',
+              'DNI': 'dn',
+              'Wind Speed': 'wspd',
+              'Temperature': 'tdry',
+              'Pressure': 'pres',
+              'Dew Point': 'tdew'}
+
+# SRW field names and the field codes SAM's wind resource uses for them
+WIND_FIELDS = {'Temperature': 1,
+               'Pressure': 2,
+               'Speed': 3,
+               'Direction': 4}
+
+# Resource filenames are {lat}_{lon}_{year}.csv
+def parse_resource_fn(fn):
+    lat, lon, year = os.path.splitext(os.path.basename(fn))[0].split('_')
+    return float(lat), float(lon), int(year)
+
+def site_key(lat, lon, year):
+    return '{:.3f}_{:.3f}_{:d}'.format(lat, lon, year)
+
+# HOPP resource object holding data already in memory - skips the download and file parsing of its __init__
+def memory_resource(resource_class, lat, lon, year, data, **attrs):
+    resource = resource_class.__new__(resource_class)
+    resource.latitude = lat
+    resource.longitude = lon
+    resource.year = year
+    resource.filename = None
+    for name, value in attrs.items():
+        setattr(resource, name, value)
+    resource.data = data
+    return resource
+
+def read_solar_csv(fp):
+    meta = pd.read_csv(fp, nrows=1)
+    data = pd.read_csv(fp, skiprows=2)
+    columns = [c for c in SOLAR_KEYS if c in data.columns]
+    meta = {'tz': float(meta['Time Zone'][0]),
+            'elev': float(meta['Elevation'][0])}
+    return columns, data[columns].to_numpy(np.float32), meta
+
+def read_wind_srw(fp):
+    with open(fp) as srw_file:
+        header = [next(srw_file).rstrip('\n').split(',') for _ in range(5)]
+    fields = header[2]
+    heights = [float(h) for h in header[4]]
+    data = np.loadtxt(fp, delimiter=',', skiprows=5, dtype=np.float32, ndmin=2)
+    return fields, heights, data
+
+def build_archive(weather_dir=WEATHER_DIR, archive_dir=None):
+    """Convert every site that has both a solar and a wind CSV into one archive
+
+    Raises ValueError if sites don't share the same column layout or aren't 8760 hours long
+    """
+    if archive_dir is None:
+        archive_dir = weather_dir + 'archive/'
+    os.makedirs(archive_dir, exist_ok=True)
+
+    solar_fns = sorted(glob.glob(weather_dir + 'solar/*.csv'))
+    sites = [parse_resource_fn(fn) for fn in solar_fns
+             if os.path.exists(weather_dir + 'wind/' + os.path.basename(fn))]
+    if len(sites) == 0:
+        raise ValueError("no sites with both solar and wind resource files in {}".format(weather_dir))
+
+    header = None
+    index = []
+    # The arrays are filled in under temp names, so a half-built archive is never opened
+    with atomic_path(archive_dir + 'solar.npy') as solar_fp, atomic_path(archive_dir + 'wind.npy') as wind_fp:
+        for row, (lat, lon, year) in enumerate(sites):
+            fn = site_key(lat, lon, year) + '.csv'
+            solar_columns, solar, meta = read_solar_csv(weather_dir + 'solar/' + fn)
+            wind_fields, wind_heights, wind = read_wind_srw(weather_dir + 'wind/' + fn)
+            if solar.shape[0] != N_HOURS or wind.shape[0] != N_HOURS:
+                raise ValueError("{} is not {} hours long".format(fn, N_HOURS))
+
+            # Set up the arrays from the first site's layout
+            if header is None:
+                header = {'solar_columns': solar_columns,
+                          'wind_fields': wind_fields,
+                          'wind_heights': wind_heights}
+                solar_archive = np.lib.format.open_memmap(solar_fp, mode='w+', dtype=np.float32,
+                                                          shape=(len(sites), N_HOURS, len(solar_columns)))
+                wind_archive = np.lib.format.open_memmap(wind_fp, mode='w+', dtype=np.float32,
+                                                         shape=(len(sites), N_HOURS, len(wind_fields)))
+            elif (solar_columns != header['solar_columns'] or wind_fields != header['wind_fields']
+                  or wind_heights != header['wind_heights']):
+                raise ValueError("{} has a different column layout than the rest of the archive".format(fn))
+
+            solar_archive[row] = solar
+            wind_archive[row] = wind
+            index.append({'lat': lat, 'lon': lon, 'year': year, 'row': row, **meta})
+
+        solar_archive.flush()
+        wind_archive.flush()
+        del solar_archive, wind_archive
+    write_atomic(archive_dir + 'index.csv', pd.DataFrame(index).to_csv(index=False))
+    write_atomic(archive_dir + 'header.json', json.dumps(header))
+
+    return archive_dir
+
+class ResourceArchive:
+
+    def __init__(self, archive_dir=WEATHER_DIR + 'archive/'):
+        self.solar = np.load(archive_dir + 'solar.npy', mmap_mode='r')
+        self.wind = np.load(archive_dir + 'wind.npy', mmap_mode='r')
+        self.index = pd.read_csv(archive_dir + 'index.csv')
+        with open(archive_dir + 'header.json') as header_file:
+            self.header = json.load(header_file)
+        self.rows = {site_key(lat, lon, year): i for i, (lat, lon, year) in
+                     enumerate(zip(self.index['lat'], self.index['lon'], self.index['year']))}
+
+    def __contains__(self, site):
+        return site_key(*site) in self.rows
+
+    def solar_data(self, lat, lon, year):
+        """Solar data in SolarResource's data format - arrays are views into the memory map"""
+        i = self.rows[site_key(lat, lon, year)]
+        block = self.solar[self.index['row'][i]]
+        data = {SOLAR_KEYS[c]: block[:, j] for j, c in enumerate(self.header['solar_columns'])}
+        data.update({'lat': lat,
+                     'lon': lon,
+                     'tz': self.index['tz'][i],
+                     'elev': self.index['elev'][i]})
+        return data
+
+    def wind_data(self, lat, lon, year):
+        """Wind data in WindResource's data format - the data array is a view into the memory map"""
+        i = self.rows[site_key(lat, lon, year)]
+        return {'heights': self.header['wind_heights'],
+                'fields': [WIND_FIELDS[f] for f in self.header['wind_fields']],
+                'data': self.wind[self.index['row'][i]]}
+
+    # Hand archived resource to GreenHEART through the HOPP config in place of resource files
+    # Sites are (lat, lon, year) of the solar and wind files the site was snapped to
+    def set_config_resources(self, config, solar_site, wind_site):
+        from hopp.simulation.technologies.resource import SolarResource, WindResource
+        site = config.hopp_config['site']
+        site['solar_resource'] = memory_resource(SolarResource, *solar_site, self.solar_data(*solar_site))
+        site['wind_resource'] = memory_resource(WindResource, *wind_site, self.wind_data(*wind_site),
+                                                hub_height_meters=config.turbine_config['hub_height'])
+        return config
+
+
+if __name__ == "__main__":
+    weather_dir = sys.argv[1] if len(sys.argv) > 1 else WEATHER_DIR
+    print("built archive in {}".format(build_archive(weather_dir)))
@@ -0,0 +1,111 @@
+import os
+import glob
+import numpy as np
+from scipy.spatial import cKDTree
+
+'''
+Spatial index over the resource files already on disk
+
+NSRDB and WTK data come on ~4 km and ~2 km grids, so two sites closer than that get the same
+resource data anyway. Requested sites are snapped to an existing file within a tolerance instead
+of downloading a new file for every distinct lat/lon. Sites with no file nearby get a new file
+at the center of their cell on a regular lat/lon lattice about as fine as the dataset, so sites
+requested in any order share the same new files.
+
+The lattice only approximates each dataset's resolution - it isn't the native grid, which for WTK
+is Lambert conformal. HPCResource reads the datasets' own gids instead.
+'''
+
+EARTH_RADIUS_KM = 6371.0
+
+# Snap tolerance for each dataset - about half of its grid spacing
+SNAP_TOLERANCE_KM = {'solar': 2.0,
+                     'wind': 1.0}
+
+# Lattice spacing of new resource files for each dataset [degrees], about its grid spacing
+LATTICE_SPACING_DEG = {'solar': 0.04,
+                       'wind': 0.02}
+
+# Rebuild the tree after this many new files have been registered
+REBUILD_EVERY = 64
+
+# Points on a sphere of Earth's radius - chord distance is within 0.01% of the great circle below 100 km
+def to_xyz(lats, lons):
+    lats = np.radians(np.asarray(lats, dtype=float))
+    lons = np.radians(np.asarray(lons, dtype=float))
+    return EARTH_RADIUS_KM*np.column_stack([np.cos(lats)*np.cos(lons),
+                                            np.cos(lats)*np.sin(lons),
+                                            np.sin(lats)])
+
+# Center of a site's lattice cell, rounded like the resource filenames - the site itself with no lattice
+def lattice_point(lat, lon, spacing_deg):
+    if not spacing_deg:
+        return round(lat, 3), round(lon, 3)
+    return round(round(lat/spacing_deg)*spacing_deg, 3), round(round(lon/spacing_deg)*spacing_deg, 3)
+
+class ResourceIndex:
+
+    def __init__(self, fp, kind, tolerance_km=None, spacing_deg=None):
+        self.fp = fp
+        self.kind = kind
+        self.tolerance_km = SNAP_TOLERANCE_KM[kind] if tolerance_km is None else tolerance_km
+        self.spacing_deg = LATTICE_SPACING_DEG[kind] if spacing_deg is None else spacing_deg
+        self.points = {}
+        for fn in glob.glob(fp + kind + '/*.csv'):
+            try:
+                lat, lon, year = os.path.splitext(os.path.basename(fn))[0].split('_')
+                self.register(float(lat), float(lon), int(year), fn)
+            except ValueError:
+                continue
+        self.build()
+
+    # Keep a separate tree for each resource year
+    def build(self):
+        self.trees = {}
+        for year, (lats, lons, fns) in self.points.items():
+            self.trees[year] = (cKDTree(to_xyz(lats, lons)), len(fns))
+        self.n_new = 0
+
+    def register(self, lat, lon, year, fn):
+        lats, lons, fns = self.points.setdefault(year, ([], [], []))
+        lats.append(lat)
+        lons.append(lon)
+        fns.append(fn)
+
+    def nearest(self, lat, lon, year):
+        """Filepath of the closest resource file within tolerance, or None"""
+        if year not in self.points:
+            return None
+        lats, lons, fns = self.points[year]
+        best_fn = None
+        best_dist = self.tolerance_km
+        xyz = to_xyz([lat], [lon])
+        if year in self.trees:
+            tree, n_tree = self.trees[year]
+            dist, i = tree.query(xyz[0], distance_upper_bound=self.tolerance_km)
+            if dist <= best_dist:
+                best_fn, best_dist = fns[i], dist
+        else:
+            n_tree = 0
+        # Check files registered since the last rebuild by brute force
+        if len(fns) > n_tree:
+            dists = np.linalg.norm(to_xyz(lats[n_tree:], lons[n_tree:]) - xyz, axis=1)
+            i = int(np.argmin(dists))
+            if dists[i] <= best_dist:
+                best_fn = fns[n_tree + i]
+        return best_fn
+
+    def snap(self, lat, lon, year):
+        """Filepath to use for a site - the closest file within tolerance, or else its lattice cell's file
+
+        New files are named after the point their resource should be downloaded for
+        """
+        fn = self.nearest(lat, lon, year)
+        if fn is None:
+            cell_lat, cell_lon = lattice_point(lat, lon, self.spacing_deg)
+            fn = self.fp + self.kind + '/{:.3f}_{:.3f}_{:d}.csv'.format(cell_lat, cell_lon, year)
+            self.register(cell_lat, cell_lon, year, fn)
+            self.n_new += 1
+            if self.n_new >= REBUILD_EVERY:
+                self.build()
+        return fn
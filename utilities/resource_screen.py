@@ -0,0 +1,185 @@
+import os
+import numpy as np
+import pandas as pd
+
+from utilities.resource_archive import (ResourceArchive, read_solar_csv, read_wind_srw, parse_resource_fn,
+                                        site_key, WEATHER_DIR)
+from utilities.resource_index import ResourceIndex
+from utilities.atomic_io import atomic_path
+
+'''
+Resource statistics for screening out sites before they are fully simulated
+
+Mean hub-height wind speed, mean GHI, and rough wind and solar capacity factors are worked out for
+each site from its downloaded resource files, or from the resource archive when it holds them. Sites
+are stacked into blocks and each block is reduced in one vectorized pass. The statistics are kept in
+an index next to the resource files, keyed by location, year and hub height, so each site is only
+reduced once. Sites whose best capacity factor is below a threshold can then be dropped from a sweep
+or run last. The statistics are also features of the surrogate model.
+'''
+
+STATS_COLUMNS = ['wind_speed_mean', 'ghi_mean', 'wind_cf', 'solar_cf']
+
+STATS_FN = 'resource_stats.csv'
+
+# Generic power curve for the rough wind capacity factor [m/s]
+CUT_IN_SPEED = 3.0
+RATED_SPEED = 12.0
+CUT_OUT_SPEED = 25.0
+
+# Rough PV capacity factor is mean GHI relative to standard test irradiance, derated for system losses
+STC_IRRADIANCE = 1000.0
+PV_PERFORMANCE_RATIO = 0.85
+
+# Wind speed fields in SRW files and in WindResource data
+SPEED_FIELDS = ['Speed', 3]
+
+# Sites reduced at once - bounds memory to a few hundred MB per block
+BLOCK_SITES = 1024
+
+def hub_height_speeds(speeds, heights, hub_height):
+    """Wind speeds interpolated linearly in height to the hub height
+
+    speeds is (sites, hours, heights) with heights sorted, extrapolated from the closest pair
+    """
+    heights = np.asarray(heights, dtype=float)
+    if len(heights) == 1:
+        return speeds[:, :, 0]
+    i = int(np.clip(np.searchsorted(heights, hub_height) - 1, 0, len(heights) - 2))
+    weight = (hub_height - heights[i])/(heights[i+1] - heights[i])
+    return np.maximum(speeds[:, :, i]*(1 - weight) + speeds[:, :, i+1]*weight, 0)
+
+def wind_capacity_factor(speeds):
+    cf = np.clip((speeds**3 - CUT_IN_SPEED**3)/(RATED_SPEED**3 - CUT_IN_SPEED**3), 0, 1)
+    cf[speeds > CUT_OUT_SPEED] = 0
+    return cf.mean(axis=-1)
+
+def resource_stats(ghi, speeds, heights, hub_height):
+    """Statistics of a block of sites from (sites, hours) GHI [W/m2] and (sites, hours, heights) wind speeds [m/s]"""
+    hub_speeds = hub_height_speeds(speeds, heights, hub_height)
+    ghi_mean = ghi.mean(axis=1)
+    return pd.DataFrame({'wind_speed_mean': hub_speeds.mean(axis=1),
+                         'ghi_mean': ghi_mean,
+                         'wind_cf': wind_capacity_factor(hub_speeds),
+                         'solar_cf': ghi_mean/STC_IRRADIANCE*PV_PERFORMANCE_RATIO})
+
+def site_resource(lat, lon, year, indices, archive=None):
+    """GHI and wind speeds at each downloaded height of a site, with the heights sorted
+
+    Read from the archive where it has the site's files, None if the site's files aren't downloaded
+    """
+    solar_fn = indices['solar'].nearest(lat, lon, year)
+    wind_fn = indices['wind'].nearest(lat, lon, year)
+    if solar_fn is None or wind_fn is None:
+        return None
+    solar_site = parse_resource_fn(solar_fn)
+    wind_site = parse_resource_fn(wind_fn)
+    if archive is not None and solar_site in archive:
+        ghi = archive.solar_data(*solar_site)['gh']
+    else:
+        columns, data, _ = read_solar_csv(solar_fn)
+        ghi = data[:, columns.index('GHI')]
+    if archive is not None and wind_site in archive:
+        wind = archive.wind_data(*wind_site)
+        fields, heights, data = wind['fields'], wind['heights'], wind['data']
+    else:
+        fields, heights, data = read_wind_srw(wind_fn)
+    speed_columns = sorted([j for j, field in enumerate(fields) if field in SPEED_FIELDS],
+                           key=lambda j: float(heights[j]))
+    return ghi, data[:, speed_columns], tuple(float(heights[j]) for j in speed_columns)
+
+def compute_stats(locations, year, hub_height, weather_dir=WEATHER_DIR, archive=None):
+    """Statistics for each row of locations, NaN for sites without downloaded resource files"""
+    indices = {kind: ResourceIndex(weather_dir, kind) for kind in ['solar', 'wind']}
+    stats = pd.DataFrame(np.nan, index=range(len(locations)), columns=STATS_COLUMNS)
+    # Sites waiting to be reduced, grouped by the heights of their wind data
+    blocks = {}
+
+    def reduce_block(heights):
+        rows, ghis, speeds = zip(*blocks.pop(heights))
+        block_stats = resource_stats(np.stack(ghis), np.stack(speeds), heights, hub_height)
+        stats.loc[list(rows), STATS_COLUMNS] = block_stats.to_numpy()
+
+    for row, (lat, lon) in enumerate(zip(locations['latitude'], locations['longitude'])):
+        resource = site_resource(float(lat), float(lon), year, indices, archive)
+        if resource is None:
+            continue
+        ghi, speeds, heights = resource
+        blocks.setdefault(heights, []).append((row, ghi, speeds))
+        if len(blocks[heights]) >= BLOCK_SITES:
+            reduce_block(heights)
+    for heights in list(blocks):
+        reduce_block(heights)
+    return stats
+
+def stats_keys(locations, year, hub_height):
+    return ['{}_{:g}'.format(site_key(float(lat), float(lon), year), hub_height)
+            for lat, lon in zip(locations['latitude'], locations['longitude'])]
+
+def load_resource_stats(locations, year, hub_height, weather_dir=WEATHER_DIR, archive_dir=None):
+    """locations with resource statistics added, from the stats index or worked out and added to it
+
+    Sites without downloaded resource files get NaN statistics and aren't added to the index
+    """
+    index_fp = weather_dir + STATS_FN
+    index = pd.read_csv(index_fp, index_col='key') if os.path.exists(index_fp) else pd.DataFrame(columns=STATS_COLUMNS)
+    locations = locations.reset_index(drop=True)
+    keys = stats_keys(locations, year, hub_height)
+    stats = index[STATS_COLUMNS].reindex(keys).reset_index(drop=True)
+
+    missing = np.flatnonzero(stats.isna().any(axis=1).to_numpy())
+    if len(missing) > 0:
+        if archive_dir is None:
+            archive_dir = weather_dir + 'archive/'
+        archive = ResourceArchive(archive_dir) if os.path.exists(archive_dir + 'index.csv') else None
+        new_stats = compute_stats(locations.iloc[missing], year, hub_height, weather_dir, archive)
+        stats.loc[missing, STATS_COLUMNS] = new_stats.to_numpy()
+        new_stats.index = [keys[i] for i in missing]
+        new_stats = new_stats.dropna()
+        if len(new_stats) > 0:
+            new_stats.index.name = 'key'
+            index = pd.concat([index[~index.index.isin(new_stats.index)], new_stats])
+            index.index.name = 'key'
+            # A half-written index is never read
+            with atomic_path(index_fp) as tmp_fp:
+                index.to_csv(tmp_fp)
+
+    return pd.concat([locations.drop(columns=[c for c in STATS_COLUMNS if c in locations]), stats], axis=1)
+
+# Better of the wind and solar capacity factors - the hybrid plant can lean on either
+def best_cf(stats):
+    return stats[['wind_cf', 'solar_cf']].max(axis=1)
+
+def passes_screen(stats, min_cf):
+    """True for sites whose best capacity factor reaches min_cf, and for sites without statistics"""
+    cf = best_cf(stats)
+    return (cf.isna() | (cf >= min_cf)).to_numpy()
+
+def add_resource_columns(sites, stats):
+    """sites with the resource statistics of their latitude and longitude added, keeping its index"""
+    stats = stats.drop_duplicates(['latitude', 'longitude']).set_index(['latitude', 'longitude'])[STATS_COLUMNS]
+    keys = pd.MultiIndex.from_arrays([sites['latitude'].astype(float), sites['longitude'].astype(float)])
+    sites = sites.drop(columns=[c for c in STATS_COLUMNS if c in sites])
+    sites[STATS_COLUMNS] = stats.reindex(keys).to_numpy()
+    return sites
+
+def screen_scenarios(scenario_idxs, spec, stats, min_cf, action='drop'):
+    """Sweep scenarios to run after screening, and how many are below min_cf
+
+    Scenarios below min_cf are dropped, or with action 'last' moved after the rest, poorest last
+    """
+    stats = stats.set_index(['latitude', 'longitude'])
+    passed = pd.Series(passes_screen(stats, min_cf), index=stats.index)
+    cf = best_cf(stats)
+    keep = []
+    below = []
+    for i in scenario_idxs:
+        scenario = spec.scenario(i)
+        location = (scenario['latitude'], scenario['longitude'])
+        if passed[location]:
+            keep.append(i)
+        else:
+            below.append((cf[location], i))
+    if action == 'last':
+        return keep + [i for _, i in sorted(below, reverse=True)], len(below)
+    return keep, len(below)
@@ -0,0 +1,62 @@
+import os
+import glob
+import time
+import pandas as pd
+
+from utilities.atomic_io import atomic_path
+
+'''
+Columnar store for sweep results - one row per scenario
+
+Each rank buffers its rows and appends them as its own parquet part file, so ranks never write
+to the same file. The buffer is written once it holds flush_every rows or its oldest row is
+flush_seconds old, so slow sites don't sit unrecorded for long. The whole store is loaded in one read with load_results.
+'''
+
+# Build the key that namespaces a run's outputs from its site id, location, ore, and tech
+def output_key(site_id, ore, tech, location):
+    lat, lon = location
+    key = '{}_{:.3f}_{:.3f}_{}_{}'.format(site_id, lat, lon, ore, tech)
+    return key.replace(' ', '-').replace('/', '-')
+
+class ResultsStore:
+
+    def __init__(self, store_dir, rank=0, flush_every=5, flush_seconds=300):
+        self.store_dir = str(store_dir)
+        self.rank = rank
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+        self.rows = []
+        self.first_append = None
+        os.makedirs(self.store_dir, exist_ok=True)
+        # Keep numbering after any parts this rank wrote in earlier sweeps
+        self.part = len(glob.glob(os.path.join(self.store_dir, 'part-r{:05d}-*.parquet'.format(rank))))
+
+    # Both return the rows that were written to disk, if any
+    def append(self, row):
+        if len(self.rows) == 0:
+            self.first_append = time.monotonic()
+        self.rows.append(row)
+        if (len(self.rows) >= self.flush_every
+                or time.monotonic() - self.first_append >= self.flush_seconds):
+            return self.flush()
+        return []
+
+    def flush(self):
+        if len(self.rows) == 0:
+            return []
+        fn = 'part-r{:05d}-{:05d}.parquet'.format(self.rank, self.part)
+        # Readers never see a partial part file
+        with atomic_path(os.path.join(self.store_dir, fn)) as tmp_fp:
+            pd.DataFrame(self.rows).to_parquet(tmp_fp, index=False)
+        self.part += 1
+        flushed, self.rows = self.rows, []
+        return flushed
+
+# Load every rank's results into one dataframe
+# Parts are read one at a time since sweeps with different parameters write different columns
+def load_results(store_dir):
+    fps = sorted(glob.glob(os.path.join(str(store_dir), '*.parquet')))
+    if not os.path.isdir(store_dir) or len(fps) == 0:
+        return pd.DataFrame()
+    return pd.concat([pd.read_parquet(fp) for fp in fps], ignore_index=True)
@@ -0,0 +1,31 @@
+import os
+import pandas as pd
+
+'''
+Record of how long each scenario took in past sweeps, keyed by scenario ID
+
+The dynamic scheduler hands out the slowest scenarios first, so a long one doesn't start last and
+hold up the end of the sweep.
+'''
+
+# Order sites longest-first using runtimes recorded by earlier sweeps
+# Sites with no recorded runtime go first since they could be the slowest
+def order_longest_first(s_list, spec, runtime_fp):
+    if not os.path.exists(runtime_fp):
+        return s_list
+    runtimes = pd.read_csv(runtime_fp,index_col=0)['runtime_s']
+    past = [runtimes.get(spec.scenario(gid)['id'],float('inf')) for gid in s_list]
+    order = sorted(range(len(s_list)),key=lambda i: past[i],reverse=True)
+    return [s_list[i] for i in order]
+
+# Add runtimes from this sweep to the runtime record, newest value wins
+def save_runtimes(new_runtimes, runtime_fp):
+    if len(new_runtimes) == 0:
+        return
+    new_df = pd.DataFrame({'runtime_s':new_runtimes})
+    new_df.index.name = 'id'
+    os.makedirs(os.path.dirname(runtime_fp),exist_ok=True)
+    if os.path.exists(runtime_fp):
+        old_df = pd.read_csv(runtime_fp,index_col=0)
+        new_df = pd.concat([old_df[~old_df.index.isin(new_df.index)],new_df])
+    new_df.to_csv(runtime_fp)
@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.strtree import STRtree
+
+from utilities.cejst_tracts import load_tracts, column_names, tracts_available, TRACT_ID
+from utilities.logger import main_logger as main_log
+
+'''
+Tags plant sites with the CEJST census tract they fall in
+
+All sites are joined to the tracts in one bulk STRtree query instead of testing every site against
+every tract. With a buffer radius, each site is also tagged with how many tracts within that radius
+are disadvantaged and the highest burden indicators among them.
+'''
+
+# CEJST field flagging a tract as disadvantaged
+DISADVANTAGED = 'SN_C'
+
+# Burden indicators tagged by default - CEJST percentiles
+INDICATORS = ['EBF_PFS',    # Energy burden
+              'PM25F_PFS',  # PM2.5 in the air
+              'DSF_PFS',    # Diesel particulate matter exposure
+              'LMI_PFS',    # Low median household income
+              'P200_I_PFS'] # Below 200% of the Federal Poverty Line
+
+KM_PER_DEG_LAT = 111.32
+# Vertices in the polygon approximating each buffer circle
+BUFFER_VERTICES = 32
+
+class TractIndex:
+
+    def __init__(self, tracts, indicators=INDICATORS):
+        self.tract_ids = tracts[TRACT_ID].to_numpy()
+        self.disadvantaged = tracts[DISADVANTAGED].fillna(0).to_numpy().astype(bool)
+        self.indicators = tracts[indicators].to_numpy(dtype=float)
+        names = column_names()
+        self.indicator_names = [names.get(field, field) for field in indicators]
+        self.geoms = tracts.geometry.to_numpy()
+        shapely.prepare(self.geoms)
+        self.tree = STRtree(self.geoms)
+
+    def tract_of(self, lats, lons):
+        """Tract ID, disadvantaged flag and indicators of the tract each site is in, NaN outside every tract"""
+        points = shapely.points(np.asarray(lons, dtype=float), np.asarray(lats, dtype=float))
+        point_idxs, tract_idxs = self.tree.query(points, predicate='within')
+        # Sites on a shared tract boundary match both tracts, keep the first for each site
+        point_idxs, first = np.unique(point_idxs, return_index=True)
+        tract_idxs = tract_idxs[first]
+
+        tags = pd.DataFrame({'tract_id': pd.Series([None]*len(points), dtype=object),
+                             'disadvantaged': pd.Series([pd.NA]*len(points), dtype='boolean')})
+        tags.loc[point_idxs, 'tract_id'] = self.tract_ids[tract_idxs]
+        tags.loc[point_idxs, 'disadvantaged'] = self.disadvantaged[tract_idxs]
+        indicators = np.full((len(points), len(self.indicator_names)), np.nan)
+        indicators[point_idxs] = self.indicators[tract_idxs]
+        tags[self.indicator_names] = indicators
+        return tags
+
+    def within_buffer(self, lats, lons, buffer_km):
+        """Number of tracts within buffer_km of each site, the share of them that are disadvantaged,
+        and the highest of each indicator among them"""
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        # Circles in lat/lon, stretched in longitude so they are round on the ground
+        theta = np.linspace(0, 2*np.pi, BUFFER_VERTICES+1)
+        dlat = buffer_km/KM_PER_DEG_LAT
+        dlon = dlat/np.cos(np.radians(lats))
+        rings = np.stack([lons[:, None] + dlon[:, None]*np.cos(theta),
+                          lats[:, None] + dlat*np.sin(theta)], axis=-1)
+        buffers = shapely.polygons(rings)
+        site_idxs, tract_idxs = self.tree.query(buffers, predicate='intersects')
+
+        n_tracts = np.bincount(site_idxs, minlength=len(lats))
+        n_disadvantaged = np.bincount(site_idxs, weights=self.disadvantaged[tract_idxs].astype(float),
+                                       minlength=len(lats))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            tags = pd.DataFrame({'buffer_tracts': n_tracts,
+                                 'buffer_disadvantaged_share': n_disadvantaged/n_tracts})
+        max_indicators = pd.DataFrame(self.indicators[tract_idxs]).groupby(site_idxs).max()
+        max_indicators = max_indicators.reindex(range(len(lats))).to_numpy()
+        tags[['buffer max ' + name for name in self.indicator_names]] = max_indicators
+        return tags
+
+# Tracts around the sites only, padded by the buffer radius
+def load_tract_index(lats, lons, buffer_km=None, indicators=INDICATORS):
+    pad = 0.1 + (0 if buffer_km is None else 2*buffer_km/KM_PER_DEG_LAT)
+    bbox = (np.min(lons)-pad, np.min(lats)-pad, np.max(lons)+pad, np.max(lats)+pad)
+    tracts = load_tracts([DISADVANTAGED] + indicators, bbox, readable_names=False)
+    return TractIndex(tracts, indicators)
+
+# Names of the columns add_tract_columns adds
+def tract_columns(buffer_km=None, indicators=INDICATORS):
+    names = column_names()
+    indicator_names = [names.get(field, field) for field in indicators]
+    columns = ['tract_id', 'disadvantaged'] + indicator_names
+    if buffer_km is not None:
+        columns += ['buffer_tracts', 'buffer_disadvantaged_share'] + ['buffer max ' + name for name in indicator_names]
+    return columns
+
+def add_tract_columns(sites, tract_index=None, buffer_km=None, indicators=INDICATORS):
+    """sites with CEJST tract columns added, keeping its index
+
+    Each distinct latitude/longitude is only joined once, however many scenarios share it
+    """
+    if len(sites) == 0:
+        sites = sites.copy()
+        for column in tract_columns(buffer_km, indicators):
+            sites[column] = pd.Series(dtype=object)
+        return sites
+    locations = sites[['latitude', 'longitude']].to_numpy(dtype=float)
+    locations, inverse = np.unique(locations, axis=0, return_inverse=True)
+    lats, lons = locations[:, 0], locations[:, 1]
+    if tract_index is None:
+        tract_index = load_tract_index(lats, lons, buffer_km, indicators)
+    tags = tract_index.tract_of(lats, lons)
+    if buffer_km is not None:
+        tags = pd.concat([tags, tract_index.within_buffer(lats, lons, buffer_km)], axis=1)
+    tags = tags.iloc[np.ravel(inverse)].set_axis(sites.index)
+    return pd.concat([sites.drop(columns=[c for c in tags.columns if c in sites.columns]), tags], axis=1)
+
+def tag_if_available(sites, buffer_km=None, indicators=INDICATORS):
+    """sites with CEJST tract columns added, or unchanged with a warning when the tracts aren't on disk"""
+    if not tracts_available():
+        main_log.warning("CEJST tracts not found in webtool/usa, results are not tagged with tracts")
+        return sites
+    return add_tract_columns(sites, buffer_km=buffer_km, indicators=indicators)
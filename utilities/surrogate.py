@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+from sklearn.gaussian_process import GaussianProcessRegressor
+from sklearn.gaussian_process.kernels import ConstantKernel, Matern, WhiteKernel
+from sklearn.preprocessing import StandardScaler
+
+'''
+Gaussian process surrogate for screening LCOH/LCOI across dense location grids
+
+A surrogate is fit to a seed set of full GreenHEART runs and predicts the rest of the grid with an
+uncertainty, so full simulations only need to run where the surrogate is unsure.
+'''
+
+# Numeric feature columns used when present - resource statistics are added by the pre-screen
+NUMERIC_FEATURES = ['latitude', 'longitude', 'wind_speed_mean', 'ghi_mean', 'wind_cf', 'solar_cf']
+CATEGORICAL_FEATURES = ['ore', 'tech']
+TARGETS = ['lcoh', 'lcoi']
+
+class SurrogateModel:
+
+    def __init__(self, targets=TARGETS, numeric_features=NUMERIC_FEATURES,
+                 categorical_features=CATEGORICAL_FEATURES, random_state=0):
+        self.targets = targets
+        self.numeric_features = numeric_features
+        self.categorical_features = categorical_features
+        self.random_state = random_state
+
+    def features(self, df):
+        numeric = df[self.numeric_columns].to_numpy(dtype=float)
+        onehots = [(df[c].to_numpy()[:,np.newaxis] == np.array(self.categories[c])[np.newaxis,:]).astype(float)
+                   for c in self.categorical_features if c in df]
+        return np.hstack([self.scaler.transform(numeric)] + onehots)
+
+    def fit(self, results):
+        self.numeric_columns = [c for c in self.numeric_features if c in results]
+        self.categories = {c: sorted(results[c].unique()) for c in self.categorical_features if c in results}
+        self.scaler = StandardScaler().fit(results[self.numeric_columns].to_numpy(dtype=float))
+        X = self.features(results)
+        self.models = {}
+        for target in self.targets:
+            fit_rows = np.isfinite(results[target].to_numpy(dtype=float))
+            if fit_rows.sum() < 2:
+                continue
+            kernel = (ConstantKernel()*Matern(length_scale=np.ones(X.shape[1]), nu=2.5)
+                      + WhiteKernel(noise_level=1e-3))
+            model = GaussianProcessRegressor(kernel, normalize_y=True, n_restarts_optimizer=2,
+                                             random_state=self.random_state)
+            self.models[target] = model.fit(X[fit_rows], results[target].to_numpy(dtype=float)[fit_rows])
+        return self
+
+    def predict(self, scenarios):
+        """Predicted mean and standard deviation of each target, as <target> and <target>_std columns"""
+        X = self.features(scenarios)
+        predictions = pd.DataFrame(index=scenarios.index)
+        for target, model in self.models.items():
+            mean, std = model.predict(X, return_std=True)
+            predictions[target] = mean
+            predictions[target+'_std'] = std
+        return predictions
+
+# Scenarios the surrogate is least sure about, relative to the size of the prediction
+def most_uncertain(predictions, n, targets=TARGETS):
+    rel_std = [predictions[t+'_std']/np.maximum(np.abs(predictions[t]), 1e-9)
+               for t in targets if t in predictions]
+    if len(rel_std) == 0 or n <= 0:
+        return predictions.index[:0]
+    rel_std = pd.concat(rel_std, axis=1).max(axis=1)
+    return rel_std.sort_values(ascending=False).index[:n]
+
+def validation_report(results, holdout_fraction=0.2, random_state=0, **model_kwargs):
+    """Fit on part of a set of full runs and compare surrogate predictions on the held-out rest
+
+    Returns a per-target table of error statistics and the per-scenario comparison
+    """
+    rng = np.random.default_rng(random_state)
+    holdout = rng.random(len(results)) < holdout_fraction
+    train, test = results[~holdout], results[holdout]
+    model = SurrogateModel(random_state=random_state, **model_kwargs).fit(train)
+    predictions = model.predict(test)
+
+    report = []
+    comparison = test.copy()
+    for target in model.models:
+        full = test[target].to_numpy(dtype=float)
+        pred = predictions[target].to_numpy()
+        std = predictions[target+'_std'].to_numpy()
+        valid = np.isfinite(full)
+        err = pred[valid] - full[valid]
+        report.append({'target': target,
+                       'n_train': int(np.isfinite(train[target].to_numpy(dtype=float)).sum()),
+                       'n_holdout': int(valid.sum()),
+                       'mae': np.mean(np.abs(err)),
+                       'rmse': np.sqrt(np.mean(err**2)),
+                       'max_abs_error': np.max(np.abs(err)) if len(err) else np.nan,
+                       'mape': np.mean(np.abs(err/full[valid])),
+                       'r2': 1 - np.sum(err**2)/np.sum((full[valid]-np.mean(full[valid]))**2),
+                       # Share of held-out results inside the 95% prediction interval
+                       'coverage_95': np.mean(np.abs(err) <= 1.96*std[valid])})
+        comparison[target+'_surrogate'] = pred
+        comparison[target+'_surrogate_std'] = std
+    return pd.DataFrame(report), comparison
@@ -0,0 +1,66 @@
+import os
+import json
+import glob
+import traceback
+from datetime import datetime
+
+'''
+Durable record of which scenarios in a sweep have finished or failed
+
+Each rank appends JSON lines to its own ledger file and syncs them to disk, so the record survives
+the allocation ending mid-sweep. A scenario is only recorded done after its results have been
+written to the results store.
+'''
+
+class SweepLedger:
+
+    def __init__(self, ledger_dir, rank=0):
+        os.makedirs(str(ledger_dir), exist_ok=True)
+        self.fp = os.path.join(str(ledger_dir), 'rank{:05d}.jsonl'.format(rank))
+        self.rank = rank
+
+    def write(self, entries):
+        if len(entries) == 0:
+            return
+        with open(self.fp, 'a') as ledger_file:
+            for entry in entries:
+                ledger_file.write(json.dumps(entry, default=str) + '\n')
+            ledger_file.flush()
+            os.fsync(ledger_file.fileno())
+
+    def record_done(self, site_ids):
+        now = datetime.now().isoformat()
+        self.write([{'id': site_id, 'status': 'done', 'rank': self.rank, 'time': now} for site_id in site_ids])
+
+    # error is the exception, or its formatted traceback if it was raised in another process
+    def record_failure(self, site_id, error):
+        if isinstance(error, str):
+            message, trace = error.strip().splitlines()[-1], error
+        else:
+            message, trace = repr(error), ''.join(traceback.format_exception(type(error), error, error.__traceback__))
+        self.write([{'id': site_id,
+                     'status': 'failed',
+                     'rank': self.rank,
+                     'time': datetime.now().isoformat(),
+                     'error': message,
+                     'traceback': trace}])
+
+# Latest entry for every scenario in the ledger
+def load_ledger(ledger_dir):
+    entries = []
+    for fp in glob.glob(os.path.join(str(ledger_dir), 'rank*.jsonl')):
+        with open(fp) as ledger_file:
+            for line in ledger_file:
+                # A line cut off by the job ending is skipped, that scenario just reruns
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    entries.sort(key=lambda entry: entry['time'])
+    return {entry['id']: entry for entry in entries}
+
+def completed_ids(ledger_dir):
+    return set(site_id for site_id, entry in load_ledger(ledger_dir).items() if entry['status'] == 'done')
+
+def failed_ids(ledger_dir):
+    return set(site_id for site_id, entry in load_ledger(ledger_dir).items() if entry['status'] == 'failed')
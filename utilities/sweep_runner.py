@@ -0,0 +1,219 @@
+import os
+import time
+import pandas as pd
+from pathlib import Path
+from hopp.utilities import load_yaml
+
+from utilities.logger import main_logger as main_log
+from utilities.results_store import load_results
+from utilities.prefetch_resources import prefetch_resources
+from utilities.ghg_accounting import site_carbon_intensity
+from utilities.sweep_ledger import completed_ids
+from utilities.site_tracts import add_tract_columns, tag_if_available
+from utilities.sweep_spec import SweepSpec
+from utilities.iron_finance import fixed_cost_rows, finance_inputs
+from utilities.resource_screen import load_resource_stats, passes_screen, screen_scenarios
+
+'''
+Sweep settings and steps shared by every example_plants runner
+
+run_example_plants_mpi.py and run_example_plants_pool.py only differ in how they hand scenarios out
+to be simulated. Which scenarios make up the sweep, where results, ledgers and resource files go, and
+the steps before and after the simulations are set and done here, so both runners run the same sweep
+and --resume works across them. The MPI runner calls the steps on rank 0 and broadcasts the results.
+'''
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+INPUT_DIR = ROOT_DIR/"example_plant/input"
+
+sitelist_all = INPUT_DIR/'multiprocess/sitelist.csv'
+# Declarative sweep spec to run instead of the sitelist - see utilities/sweep_spec.py and multiprocess/sweep.yaml
+sweep_spec_fp = None
+
+# Pre-iron steps of GreenHEART are cached by location, so the first scenario at each location runs them
+# and every other ore/tech at that location reuses them - set True to force them to rerun everywhere
+rerun_locs = False
+
+# Results are batch-appended one row per scenario to part files in this store
+results_dir = ROOT_DIR/"example_plant/output/results"
+# Finished and failed scenarios are recorded here so a sweep can be resumed with --resume
+ledger_dir = ROOT_DIR/"example_plant/output/ledger"
+# All results so far with GHG accounting added, written at the end of each sweep
+summary_fp = ROOT_DIR/"example_plant/output/results_summary.parquet"
+# Results are written, and their sites recorded done, every few sites or every few minutes,
+# so a killed sweep only reruns the sites since the last write
+results_flush_every = 5
+results_flush_seconds = 300
+
+# Download all missing resource files up front instead of inside each simulation
+prefetch = True
+prefetch_workers = 4
+# NREL API allows about one request per second per key
+prefetch_rate_per_s = 1.0
+resource_dir = str(ROOT_DIR/"data_library/weather")+"/"
+
+# "API" downloads a resource file per site, "HPC" reads each chunk of sites straight from the NSRDB and
+# WTK .h5 files at hpc_resource_info in example.yaml and hands them to GreenHEART in memory
+resource_origin = "API"
+
+# Screen sites by mean wind speed, GHI and rough capacity factors from their resource files before running
+# them - sites whose better of the wind and solar capacity factors is below prescreen_min_cf are dropped,
+# or run after every other site with prescreen_action = "last"
+prescreen = False
+prescreen_min_cf = 0.2
+prescreen_action = "drop"
+prescreen_fp = ROOT_DIR/"example_plant/output/resource_prescreen.csv"
+
+# Tag every scenario in the results summary with the CEJST census tract it is in, whether the tract is
+# disadvantaged, and its burden indicators - with a buffer radius [km], also summarize tracts within it
+# Needs webtool/usa/usa.shp, which isn't in the repo, or its GeoParquet cache - skipped with a warning if neither is there
+tag_tracts = False
+tract_buffer_km = None
+
+# Scenario parameters that aren't passed to run_example_plant on their own
+SCENARIO_COLUMNS = ['id', 'ore', 'tech', 'latitude', 'longitude']
+
+# Sweep spec to run - a hand-written sitelist runs each of its rows as one scenario
+def setup_sweep():
+    if sweep_spec_fp is not None:
+        return SweepSpec.from_yaml(sweep_spec_fp)
+    return SweepSpec.from_sitelist(sitelist_all)
+
+# Number of sites and first site to run from the command line, and whether --resume was passed
+def parse_args(argv):
+    resume = "--resume" in argv
+    args = [arg for arg in argv if arg != "--resume"]
+    if len(args)<3:
+        return 4, 0, resume
+    return int(args[1]), int(args[2]), resume
+
+# Scenarios of the spec to run - a range holds them without listing them
+def sweep_scenarios(spec, n_sites, start_idx):
+    return range(len(spec))[start_idx:start_idx+n_sites]
+
+# Drop scenarios already recorded done in the ledger, rerunning unfinished and failed ones
+def resume_scenarios(s_list, spec, done=None):
+    if done is None:
+        done = completed_ids(ledger_dir)
+    s_list = [gid for gid in s_list if spec.scenario(gid)['id'] not in done]
+    main_log.info(f"resuming: {len(done)} sites already done, {len(s_list)} left to run")
+    return s_list
+
+# Resource year and wind hub height every site of the sweep is run with
+def resource_year_hub_height():
+    hopp_config = load_yaml(INPUT_DIR/"plant/hopp_config.yaml")
+    turbine_config = load_yaml(INPUT_DIR/"turbines/lbw_6MW.yaml")
+    return hopp_config["site"]["data"]["year"], turbine_config["hub_height"]
+
+# Arguments of run_example_plant for one scenario of the sweep spec
+def scenario_inputs(scenario):
+    run_pre_iron = True if rerun_locs else None
+    params = {name: value for name, value in scenario.items() if name not in SCENARIO_COLUMNS}
+    return [run_pre_iron,
+            scenario['ore'],
+            scenario['tech'],
+            (scenario['latitude'],scenario['longitude']),
+            params]
+
+# Results row of one simulated scenario
+def result_row(gid, scenario, inputs, results, runtime):
+    run_pre_iron, ore, tech, location, params = inputs
+    return {"id": scenario['id'],
+            "scenario": gid,
+            "ore": ore,
+            "tech": tech,
+            "latitude": location[0],
+            "longitude": location[1],
+            **params,
+            "run_pre_iron": run_pre_iron,
+            **results,
+            "runtime_s": runtime}
+
+# Distinct locations of the given scenarios - a whole sweep only expands its location axes
+def scenario_locations(s_list, spec):
+    if len(s_list) == len(spec):
+        return spec.axis_table(['latitude','longitude'])
+    locations = [(spec.scenario(gid)['latitude'], spec.scenario(gid)['longitude']) for gid in s_list]
+    return pd.DataFrame(locations, columns=['latitude','longitude']).drop_duplicates(ignore_index=True)
+
+# Fetch resource files for every location in the sweep before any site is simulated
+def prefetch_sites(s_list, spec):
+    year, hub_height = resource_year_hub_height()
+    failed = prefetch_resources(scenario_locations(s_list, spec),
+                                resource_dir,
+                                year,
+                                hub_height,
+                                max_workers=prefetch_workers,
+                                rate_per_s=prefetch_rate_per_s)
+    if len(failed) > 0:
+        main_log.warning(f"{len(failed)} locations could not be prefetched and will download during their runs")
+    return failed
+
+# Drop sites with a poor wind and solar resource, or move them to the end, before handing sites out
+# Reads the resource files on disk, so runs after the prefetch
+# Returns the scenarios to run and the resource statistics of their locations
+def prescreen_sites(s_list, spec):
+    year, hub_height = resource_year_hub_height()
+    site_stats = load_resource_stats(scenario_locations(s_list, spec), year, hub_height, resource_dir)
+    site_stats["passes_screen"] = passes_screen(site_stats, prescreen_min_cf)
+    os.makedirs(prescreen_fp.parent, exist_ok=True)
+    site_stats.to_csv(prescreen_fp, index=False)
+    order, n_below = screen_scenarios(s_list, spec, site_stats, prescreen_min_cf, prescreen_action)
+    main_log.info(f"pre-screen: {n_below} of {len(s_list)} sites below a capacity factor of {prescreen_min_cf}"
+                  f" - {'dropped' if prescreen_action == 'drop' else 'run last'}")
+    return order, site_stats
+
+# Move sites in disadvantaged tracts to the front of the sweep, keeping their order otherwise
+def order_disadvantaged_first(s_list, spec):
+    locations = scenario_locations(s_list, spec)
+    tagged = add_tract_columns(locations, buffer_km=tract_buffer_km)
+    disadvantaged = tagged['disadvantaged'].fillna(False).astype(bool)
+    disadvantaged = set(zip(locations['latitude'][disadvantaged], locations['longitude'][disadvantaged]))
+    first = []
+    rest = []
+    for gid in s_list:
+        scenario = spec.scenario(gid)
+        in_disadvantaged = (scenario['latitude'], scenario['longitude']) in disadvantaged
+        (first if in_disadvantaged else rest).append(gid)
+    main_log.info(f"{len(first)} of {len(s_list)} sites are in disadvantaged tracts and run first")
+    return first + rest
+
+# Scenarios with a fixed H2 cost don't need HOPP or the electrolyzer, so they are all worked out in one
+# pass and only the rest are simulated - returns the scenarios left to simulate
+def run_fixed_cost_scenarios(s_list, spec, results_store, ledger, cost_library, **row_info):
+    if not (spec.has_field('overwrite_h2') or spec.has_field('overwrite_elec')):
+        return s_list
+    fixed_start = time.perf_counter()
+    scenarios = spec.sitelist(s_list)
+    finance = finance_inputs(load_yaml(INPUT_DIR/"plant/greenheart_config.yaml"))
+    rows, failed = fixed_cost_rows(scenarios, cost_library, **finance)
+    # Scenarios that can't be run are recorded failed up front instead of giving NaN results
+    for site_id, error in failed.items():
+        main_log.error(f"Site {site_id}: {error}", extra={"site_id": site_id})
+        ledger.record_failure(site_id, ValueError(error))
+    runtime = (time.perf_counter() - fixed_start)/max(len(rows), 1)
+    flushed = []
+    for row in rows:
+        flushed.extend(results_store.append({**row, "runtime_s": runtime, **row_info}))
+    flushed.extend(results_store.flush())
+    ledger.record_done([row["id"] for row in flushed])
+    remaining = scenarios.drop([row["id"] for row in rows] + list(failed))["scenario"].tolist()
+    main_log.info(f"{len(rows)} scenarios with fixed H2 costs skipped GreenHEART, {len(failed)} failed, "
+                  f"{len(remaining)} left to simulate")
+    return remaining
+
+# Every scenario's results with its site's resource statistics and carbon intensity
+def summary_results(cost_library):
+    year, hub_height = resource_year_hub_height()
+    # Per-site electricity and H2 carbon intensities come from each site's capacity factors
+    return site_carbon_intensity(load_results(results_dir), year, hub_height, resource_dir, cost_library)
+
+# Written untagged first so a failure tagging tracts can't lose the results
+def write_summary(summary):
+    summary.to_parquet(summary_fp, index=False)
+    main_log.info(f"wrote {len(summary)} scenario results to {summary_fp}")
+    if tag_tracts:
+        try:
+            tag_if_available(summary, buffer_km=tract_buffer_km).to_parquet(summary_fp, index=False)
+        except Exception:
+            main_log.exception("tagging the results summary with CEJST tracts failed, it is left untagged")
@@ -0,0 +1,183 @@
+import os
+import json
+import hashlib
+import itertools
+import yaml
+import numpy as np
+import pandas as pd
+
+'''
+Declarative sweep specs, expanded lazily into scenarios
+
+A spec lists axes, and the sweep is every combination of one value from each axis. A value can be a
+single parameter or a set of parameters that vary together, like the latitude and longitude of a
+location. Scenario i is worked out from its position in the product when it is asked for, so the
+full list of scenarios never has to be built.
+
+    axes:
+      location:
+        file: sitelist_just_loc.csv       # rows of a CSV, relative to the spec file
+        columns: [latitude, longitude]
+      ore: [Hibbing Taconite, Northshore Taconite]
+      tech: [h2_dri, h2_dri_eaf]
+      inflation: [2, 2.5]
+
+An axis file can also be a sitelist template (format: template) with the three header rows of
+sitelist_template.csv. The ID of a scenario is a hash of its parameters, so it stays the same when
+axes are reordered or extended and can be used to cache and resume across runs.
+'''
+
+ID_LENGTH = 16
+
+# Parameter names for the (group, column) headers of sitelist_template.csv
+TEMPLATE_COLUMNS = {('Top Down Parameters', 'inflation'): 'inflation',
+                    ('Top Down Parameters', 'slag disposal cost'): 'slag_disposal_cost',
+                    ('site', 'latitude'): 'latitude',
+                    ('site', 'longitude'): 'longitude',
+                    ('iron_ore', 'ore_type'): 'ore',
+                    ('iron_win', 'option'): 'tech',
+                    ('overwrite HOPP elec?', 'Yes/no'): 'overwrite_elec',
+                    ('overwrite HOPP elec?', 'Elec cost'): 'elec_cost',
+                    ('overwrite HOPP elec?', 'Elec CI'): 'elec_ci',
+                    ('overwrite GreenHEART H2?', 'Yes/no'): 'overwrite_h2',
+                    ('overwrite GreenHEART H2?', 'H2 cost'): 'h2_cost',
+                    ('overwrite GreenHEART H2?', 'H2 CI'): 'h2_ci'}
+
+# Yes/no columns of the sitelist template and the columns they switch on
+OVERRIDES = {'overwrite_elec': ['elec_cost', 'elec_ci'],
+             'overwrite_h2': ['h2_cost', 'h2_ci']}
+
+# True where a yes/no override column is set - templates may hold TRUE/FALSE, Yes/No or 1/0
+def override_mask(scenarios, flag):
+    if flag not in scenarios:
+        return np.zeros(len(scenarios), dtype=bool)
+    return scenarios[flag].map(lambda v: str(v).strip().lower() in ('true', 'yes', '1', '1.0')).to_numpy()
+
+# Override values where their yes/no column is set, NaN elsewhere
+def override_values(scenarios, column):
+    flag = [f for f, columns in OVERRIDES.items() if column in columns][0]
+    if column not in scenarios:
+        return np.full(len(scenarios), np.nan)
+    values = pd.to_numeric(scenarios[column], errors='coerce').to_numpy(dtype=float)
+    # Values given without their yes/no column are always used
+    if flag not in scenarios:
+        return values
+    return np.where(override_mask(scenarios, flag), values, np.nan)
+
+# Numbers are hashed as floats so 46 and 46.0 give the same ID
+def normalize(value):
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    return str(value)
+
+def scenario_id(params):
+    params_str = json.dumps({name: normalize(value) for name, value in params.items()}, sort_keys=True)
+    return hashlib.sha256(params_str.encode()).hexdigest()[:ID_LENGTH]
+
+# Rows of a sitelist template, with the template's two-row column headers mapped to parameter names
+def read_template(fp):
+    template = pd.read_csv(fp, header=[0, 1, 2], index_col=0)
+    columns = {}
+    group = None
+    for column in template.columns:
+        # Groups are only named above their first column
+        if not column[0].startswith('Unnamed'):
+            group = column[0]
+        name = TEMPLATE_COLUMNS.get((group, column[1]))
+        if name is not None:
+            columns[column] = name
+    template = template[list(columns)]
+    template.columns = list(columns.values())
+    return template.to_dict('records')
+
+def read_axis_file(fp, columns=None, file_format='csv'):
+    if file_format == 'template':
+        rows = read_template(fp)
+    else:
+        rows = pd.read_csv(fp).to_dict('records')
+    if columns is not None:
+        rows = [{name: row[name] for name in columns} for row in rows]
+    return rows
+
+class SweepSpec:
+
+    def __init__(self, axes):
+        """axes maps axis names to lists of values - a value is a parameter value or a dict of parameters"""
+        self.axes = {}
+        for name, values in axes.items():
+            self.axes[name] = [value if isinstance(value, dict) else {name: value} for value in values]
+        self.sizes = [len(values) for values in self.axes.values()]
+
+    @classmethod
+    def from_yaml(cls, fp):
+        with open(fp) as spec_file:
+            spec = yaml.safe_load(spec_file)
+        axes = {}
+        for name, values in spec['axes'].items():
+            if isinstance(values, dict):
+                axis_fp = os.path.join(os.path.dirname(os.path.abspath(fp)), values['file'])
+                values = read_axis_file(axis_fp, values.get('columns'), values.get('format', 'csv'))
+            axes[name] = values
+        return cls(axes)
+
+    @classmethod
+    def from_sitelist(cls, fp, columns=['ore', 'tech', 'latitude', 'longitude']):
+        """Spec that runs each row of a hand-written sitelist as one scenario"""
+        return cls({'site': read_axis_file(fp, columns)})
+
+    def __len__(self):
+        n = 1
+        for size in self.sizes:
+            n *= size
+        return n
+
+    def scenario(self, i):
+        """Parameters of scenario i, with its stable ID under 'id' - the last axis varies fastest"""
+        if not 0 <= i < len(self):
+            raise IndexError("scenario {} out of range for a sweep of {}".format(i, len(self)))
+        params = {}
+        for values, size in zip(reversed(list(self.axes.values())), reversed(self.sizes)):
+            i, j = divmod(i, size)
+            params = {**values[j], **params}
+        params['id'] = scenario_id(params)
+        return params
+
+    def __iter__(self):
+        for combination in itertools.product(*self.axes.values()):
+            params = {}
+            for value in combination:
+                params.update(value)
+            params['id'] = scenario_id(params)
+            yield params
+
+    def shard(self, rank, size, scenario_idxs=None):
+        """Indices and parameters of this rank's share of the scenarios, every size-th one from rank"""
+        if scenario_idxs is None:
+            scenario_idxs = range(len(self))
+        for i in itertools.islice(scenario_idxs, rank, None, size):
+            yield i, self.scenario(i)
+
+    def sitelist(self, scenario_idxs=None):
+        """Table of the given scenarios, indexed by ID with each one's index in the sweep under 'scenario'"""
+        if scenario_idxs is None:
+            scenario_idxs = range(len(self))
+        rows = [{**self.scenario(i), 'scenario': i} for i in scenario_idxs]
+        return pd.DataFrame(rows).set_index('id')
+
+    def has_field(self, field):
+        return any(field in values[0] for values in self.axes.values() if len(values) > 0)
+
+    def axis_table(self, fields):
+        """Distinct combinations of the given fields, only expanding the axes that set them"""
+        axes = [values for values in self.axes.values() if any(field in values[0] for field in fields)]
+        rows = []
+        for combination in itertools.product(*axes):
+            params = {}
+            for value in combination:
+                params.update(value)
+            rows.append({field: params.get(field) for field in fields})
+        return pd.DataFrame(rows, columns=fields).drop_duplicates(ignore_index=True)
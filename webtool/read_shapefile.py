@@ -1,10 +1,13 @@
-# Import necessary modules
-import geopandas as gpd
 
-# Set filepath
-fp = "usa/usa.shp"
+# Import necessary modules
+import sys
+from pathlib import Path
 
-# Read file using gpd.read_file()
-data = gpd.read_file(fp, rows=10)
+# The repo root holds utilities, so this runs from webtool/ or anywhere else
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from utilities.cejst_tracts import load_tracts
 
-asdf
\ No newline at end of file
+# Read the disadvantaged community flag and a few indicators for the tracts in Pennsylvania
+# The first run converts the shapefile to GeoParquet, later runs read from that copy
+data = load_tracts(columns=['State/Territory', 'County Name', 'SN_C', 'EBF_PFS', 'PM25F_PFS'],
+                   bbox=(-80.6, 39.7, -74.7, 42.3))